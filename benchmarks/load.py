@@ -0,0 +1,309 @@
+"""Load test for the core blueprint.
+
+Seeds a synthetic database on top of `init_db`'s seed data, then requests /gallery, /appt,
+/manage, /book and /invoice as anonymous visitors, clients and photographers. Requests go
+either through the Flask test client in this process (`--mode client`) or over HTTP to a
+server process from several load-generating processes (`--mode http`). Latency
+percentiles, throughput and SQL queries per request (from the Server-Timing header) are
+reported per route.
+
+Seeding is deterministic (`--seed`), so results can be saved and compared across changes:
+
+    python -m benchmarks.load --mode client --save baseline.json
+    python -m benchmarks.load --mode client --compare baseline.json [--tolerance 0.2]
+
+`--compare` exits non-zero when a route's p95 is more than `--tolerance` slower.
+"""
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+
+from server import create_app, db, passwords
+
+PASSWORD = 'password'
+START_EPOCH = 1_893_456_000  # 2030-01-01, far enough ahead for /book to list the open times
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+@dataclass
+class Scale:
+    photographers: int
+    clients: int
+    albums: int  # per photographer
+    photos: int  # per album
+    appointments: int  # per photographer
+    open_times: int  # unbooked times per photographer
+
+
+@dataclass
+class Fixture:
+    database: str
+    photographers: list[str]
+    clients: list[str]
+    appointments: list[int]
+
+
+def make_app(database: str):
+    app = create_app()
+    # every simulated user logs in from the same address, as fast as it can; logins aren't
+    # timed, and the http server is a daemonic process, which can't start hashing processes
+    app.config.update(
+        DATABASE=database, TESTING=True, LOGIN_LIMIT_PER_ACCOUNT=None, LOGIN_LIMIT_PER_IP=None, PASSWORD_PROCESSES=0
+    )
+    return app
+
+
+def seed(database: str, scale: Scale, seed: int) -> Fixture:
+    rng = random.Random(seed)
+    app = make_app(database)
+    pathnames = [pathname for pathname, _ in db.SEED_PHOTOS]
+    photographers = [f"photographer{i}@bench.com" for i in range(scale.photographers)]
+    clients = [f"client{i}@bench.com" for i in range(scale.clients)]
+    # one hash shared by every account, hashing each would dominate seeding
+    password_hash = passwords.make_hash(PASSWORD, passwords.hash_method(app.config))
+
+    with app.app_context():
+        db.init_db()
+        with db.transaction() as conn:
+            conn.executemany(
+                "INSERT INTO user (email, password, name, phone_number, about, type) VALUES (?, ?, ?, ?, ?, ?)",
+                [(email, password_hash, f"Photographer {i}", '123', 'about me', 'photographer') for i, email in enumerate(photographers)]
+                + [(email, password_hash, f"Client {i}", '123', None, 'client') for i, email in enumerate(clients)],
+            )
+            conn.executemany(
+                "INSERT INTO album (name, release_type, photographer_email) VALUES (?, ?, ?)",
+                [(f"{email} album {j}", 'public', email) for email in photographers for j in range(scale.albums)],
+            )
+            conn.executemany(
+                "INSERT INTO photo (pathname, album_name) VALUES (?, ?)",
+                [
+                    (rng.choice(pathnames), f"{email} album {j}")
+                    for email in photographers for j in range(scale.albums) for _ in range(scale.photos)
+                ],
+            )
+            conn.executemany(
+                "INSERT INTO package (pricing, items, photographer_email) VALUES (?, ?, ?)",
+                [(rng.randrange(50, 500), '1,2,3', email) for email in photographers],
+            )
+
+            appointments = []
+            for email in photographers:
+                package_id = conn.execute("SELECT id FROM package WHERE photographer_email = ?", (email,)).fetchone()[0]
+                for k in range(scale.appointments + scale.open_times):
+                    start = START_EPOCH + k * 7200
+                    time_id = conn.execute(
+                        "INSERT INTO photographer_available_time (start_time, end_time, start_epoch, end_epoch, photographer_email) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (db.from_epoch(start).isoformat(), db.from_epoch(start + 3600).isoformat(), start, start + 3600, email),
+                    ).lastrowid
+                    if k < scale.appointments:
+                        appointments.append(conn.execute(
+                            "INSERT INTO appointment (time_id, confirmed, completed, package_id, photographer_email, client_email) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (time_id, rng.random() < 0.5, rng.random() < 0.2, package_id, email, rng.choice(clients)),
+                        ).lastrowid)
+    return Fixture(database, photographers, clients, appointments)
+
+
+# route -> (who makes the request, path for a random request)
+def routes(fixture: Fixture) -> dict:
+    return {
+        'gallery': (None, lambda rng: f"/gallery/{rng.choice(fixture.photographers)}"),
+        'appt (client)': ('client', lambda rng: '/appt'),
+        'appt (photographer)': ('photographer', lambda rng: '/appt'),
+        'manage': ('photographer', lambda rng: '/manage'),
+        'book': ('client', lambda rng: f"/book/{rng.choice(fixture.photographers)}"),
+        'invoice': ('client', lambda rng: f"/invoice/{rng.choice(fixture.appointments)}"),
+    }
+
+
+def _queries(server_timing: str) -> int:
+    match = _QUERIES.search(server_timing or '')
+    return int(match[1]) if match else 0
+
+
+def run_client(fixture: Fixture, requests: int, seed: int) -> dict[str, list[tuple[float, int]]]:
+    """(seconds, queries) per request for every route, through the Flask test client."""
+    app = make_app(fixture.database)
+    rng = random.Random(seed)
+    samples: dict[str, list[tuple[float, int]]] = {}
+    for route, (role, path) in routes(fixture).items():
+        client = app.test_client()
+        if role is not None:
+            email = rng.choice(fixture.clients if role == 'client' else fixture.photographers)
+            client.post('/login', data={'email': email, 'password': PASSWORD})
+        client.get(path(rng))  # warm up
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = client.get(path(rng))
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200, f"{route}: {response.status_code}"
+            samples.setdefault(route, []).append((elapsed, _queries(response.headers.get('Server-Timing'))))
+    return samples
+
+
+def _serve(database: str, ports: multiprocessing.Queue):
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, make_app(database), threaded=True)
+    ports.put(server.server_port)
+    server.serve_forever()
+
+
+def _http_worker(args) -> dict[str, list[tuple[float, int]]]:
+    port, fixture, route, role, requests, seed = args
+    rng = random.Random(seed)
+    path = routes(fixture)[route][1]
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {}
+    if role is not None:
+        email = rng.choice(fixture.clients if role == 'client' else fixture.photographers)
+        conn.request(
+            'POST', '/login', body=f"email={email}&password={PASSWORD}",
+            headers={'Content-Type': 'application/x-www-form-urlencoded'},
+        )
+        response = conn.getresponse()
+        response.read()
+        # a successful login redirects home with the session cookie
+        cookie = response.getheader('Set-Cookie')
+        assert response.status == 302 and cookie, f"login as {email}: {response.status}"
+        headers['Cookie'] = cookie.split(';', 1)[0]
+
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        conn.request('GET', path(rng), headers=headers)
+        response = conn.getresponse()
+        response.read()
+        elapsed = time.perf_counter() - start
+        assert response.status == 200, f"{route}: {response.status}"
+        samples.append((elapsed, _queries(response.getheader('Server-Timing'))))
+    conn.close()
+    return {route: samples}
+
+
+def run_http(fixture: Fixture, requests: int, seed: int, processes: int) -> tuple[dict[str, list[tuple[float, int]]], dict[str, float]]:
+    """Samples per route plus each route's throughput, with `processes` clients at once."""
+    context = multiprocessing.get_context('spawn')
+    ports = context.Queue()
+    server = context.Process(target=_serve, args=(fixture.database, ports), daemon=True)
+    server.start()
+    port = ports.get(timeout=30)
+
+    samples: dict[str, list[tuple[float, int]]] = {}
+    throughput: dict[str, float] = {}
+    try:
+        with context.Pool(processes) as pool:
+            # start and import in every worker before anything is timed
+            pool.map(_http_worker, [(port, fixture, 'gallery', None, 1, seed + i) for i in range(processes)])
+            for route, (role, _) in routes(fixture).items():
+                per_process = max(1, requests // processes)
+                jobs = [(port, fixture, route, role, per_process, seed + i) for i in range(processes)]
+                start = time.perf_counter()
+                results = pool.map(_http_worker, jobs)
+                elapsed = time.perf_counter() - start
+                samples[route] = [sample for result in results for sample in result[route]]
+                throughput[route] = len(samples[route]) / elapsed
+    finally:
+        server.terminate()
+        server.join()
+    return samples, throughput
+
+
+def summarize(samples: dict[str, list[tuple[float, int]]], throughput: dict[str, float]) -> dict[str, dict[str, float]]:
+    report = {}
+    for route, values in samples.items():
+        latencies = [elapsed * 1000 for elapsed, _ in values]
+        percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+        report[route] = dict(
+            requests=len(values),
+            p50_ms=round(percentiles[49], 3),
+            p95_ms=round(percentiles[94], 3),
+            p99_ms=round(percentiles[98], 3),
+            # a single client in client mode, so throughput is one over the mean latency
+            throughput_rps=round(throughput.get(route, 1000 / statistics.fmean(latencies)), 1),
+            queries_per_request=round(statistics.fmean(queries for _, queries in values), 2),
+        )
+    return report
+
+
+def print_report(report: dict[str, dict[str, float]], baseline: dict | None = None):
+    print(f"{'route':<22}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'req/s':>9}{'queries':>9}{'p95 vs base':>13}")
+    for route, row in report.items():
+        delta = ''
+        if baseline and route in baseline['routes']:
+            delta = f"{row['p95_ms'] / baseline['routes'][route]['p95_ms'] - 1:+.0%}"
+        print(
+            f"{route:<22}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+            f"{row['throughput_rps']:>9.1f}{row['queries_per_request']:>9.2f}{delta:>13}"
+        )
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    return [
+        f"{route}: p95 {row['p95_ms']:.2f}ms vs {baseline['routes'][route]['p95_ms']:.2f}ms"
+        for route, row in report.items()
+        if route in baseline['routes'] and row['p95_ms'] > baseline['routes'][route]['p95_ms'] * (1 + tolerance)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=('client', 'http'), default='client')
+    parser.add_argument('--photographers', type=int, default=50)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--albums', type=int, default=3)
+    parser.add_argument('--photos', type=int, default=12)
+    parser.add_argument('--appointments', type=int, default=100)
+    parser.add_argument('--open-times', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route.')
+    parser.add_argument('--processes', type=int, default=4, help='Load generating processes in http mode.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='Write the results to this JSON file.')
+    parser.add_argument('--compare', help='Baseline JSON file written by --save.')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 slowdown against the baseline.')
+    args = parser.parse_args()
+
+    scale = Scale(args.photographers, args.clients, args.albums, args.photos, args.appointments, args.open_times)
+    database = os.path.join(tempfile.mkdtemp(), 'load.sqlite')
+    start = time.perf_counter()
+    fixture = seed(database, scale, args.seed)
+    print(f"seeded {scale} in {time.perf_counter() - start:.1f}s")
+
+    if args.mode == 'client':
+        samples, throughput = run_client(fixture, args.requests, args.seed), {}
+    else:
+        samples, throughput = run_http(fixture, args.requests, args.seed, args.processes)
+    report = summarize(samples, throughput)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(dict(mode=args.mode, scale=vars(scale), requests=args.requests, seed=args.seed, routes=report), f, indent=2)
+        print(f"saved results to {args.save}")
+
+    if baseline:
+        slower = regressions(report, baseline, args.tolerance)
+        for line in slower:
+            print(line)
+        sys.exit(1 if slower else 0)
+
+
+if __name__ == '__main__':
+    main()
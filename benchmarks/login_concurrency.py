@@ -0,0 +1,112 @@
+"""Concurrency check for per-request user state.
+
+Many simulated users log in, browse galleries and log out in parallel threads (and
+optionally several processes sharing one database). Every page is checked against the
+identity of the user who requested it: the nav must match their role and only a
+photographer's own gallery may show "Edit Page". Exits non-zero on any cross-talk.
+
+    python -m benchmarks.login_concurrency [--users 40] [--threads 16] [--rounds 20] [--processes 1]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from server import create_app, db, passwords
+
+PASSWORD = 'password'
+
+
+def make_app(database: str):
+    app = create_app()
+    # every simulated user logs in from the same address, as fast as it can
+    app.config.update(DATABASE=database, TESTING=True, LOGIN_LIMIT_PER_ACCOUNT=None, LOGIN_LIMIT_PER_IP=None)
+    return app
+
+
+def seed(database: str, users: int) -> list[tuple[str, str]]:
+    app = make_app(database)
+    accounts = []
+    # one hash shared by every account, hashing each would dominate seeding
+    password_hash = passwords.make_hash(PASSWORD, passwords.hash_method(app.config))
+    with app.app_context():
+        db.init_db(seed=False)
+        with db.transaction() as conn:
+            for i in range(users):
+                role = 'photographer' if i % 2 else 'client'
+                email = f"{role}{i}@email.com"
+                conn.execute(
+                    "INSERT INTO user (email, password, name, phone_number, about, type) VALUES (?, ?, ?, ?, ?, ?)",
+                    (email, password_hash, f"{role} {i}", '123', '', role),
+                )
+                accounts.append((email, role))
+    return accounts
+
+
+def check_page(html: str, email: str, role: str, gallery_email: str) -> list[str]:
+    errors = []
+    if role == 'photographer' and '/manage' not in html:
+        errors.append(f"{email}: photographer nav missing")
+    if role == 'client' and '/manage' in html:
+        errors.append(f"{email}: client was shown the photographer nav")
+    owns_gallery = gallery_email == email
+    if ('Edit Page' in html) != owns_gallery:
+        errors.append(f"{email}: 'Edit Page' shown={not owns_gallery} on gallery of {gallery_email}")
+    return errors
+
+
+def simulate(app, accounts: list[tuple[str, str]], account: tuple[str, str], rounds: int) -> list[str]:
+    email, role = account
+    photographers = [a for a, r in accounts if r == 'photographer']
+    client = app.test_client()
+    errors = []
+    for _ in range(rounds):
+        response = client.post('/login', data={'email': email, 'password': PASSWORD})
+        if response.status_code != 302:
+            errors.append(f"{email}: login failed with {response.status_code}")
+            continue
+        for gallery_email in random.sample(photographers, k=min(3, len(photographers))) + [email]:
+            if role == 'client' and gallery_email == email:
+                continue
+            html = client.get(f"/gallery/{gallery_email}").get_data(as_text=True)
+            errors += check_page(html, email, role, gallery_email)
+        client.get('/logout')
+    return errors
+
+
+def run_process(database: str, accounts: list[tuple[str, str]], threads: int, rounds: int) -> list[str]:
+    app = make_app(database)
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = executor.map(lambda account: simulate(app, accounts, account, rounds), accounts)
+        return [error for errors in results for error in errors]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=40)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--processes', type=int, default=1)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'concurrency.sqlite')
+    accounts = seed(database, args.users)
+
+    if args.processes > 1:
+        with multiprocessing.get_context('spawn').Pool(args.processes) as pool:
+            results = pool.starmap(run_process, [(database, accounts, args.threads, args.rounds)] * args.processes)
+        errors = [error for errors in results for error in errors]
+    else:
+        errors = run_process(database, accounts, args.threads, args.rounds)
+
+    for error in errors[:20]:
+        print(error)
+    print(f"{len(accounts)} users x {args.rounds} rounds x {args.processes} processes: {len(errors)} errors")
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Latency of the photographer search at scale.
+
+Seeds a fresh database with `--photographers` photographers (each with an album and a
+package), then times `User.search_photographers` for a mix of whole-word, prefix and
+multi-word queries, plus the /search/photographers endpoint end to end.
+
+    python -m benchmarks.photographer_search [--photographers 100000] [--repeat 50]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from server import create_app, db
+
+FIRST_NAMES = ['Anna', 'Kyle', 'Jane', 'Omar', 'Li', 'Priya', 'Mateo', 'Sofia', 'Noah', 'Yuki']
+STYLES = ['wedding', 'portrait', 'landscape', 'street', 'wildlife', 'newborn', 'fashion', 'food']
+QUERIES = ['anna', 'wed', 'portrait sof', 'wildlife', 'ky', 'street yuki', 'newb', 'nothing-matches-this']
+
+
+def seed(database: str, photographers: int):
+    app = create_app()
+    app.config.update(DATABASE=database, TESTING=True)
+    random.seed(0)
+    with app.app_context():
+        db.init_db(seed=False)
+        with db.transaction() as conn:
+            users, albums, packages = [], [], []
+            for i in range(photographers):
+                email = f"photographer{i}@email.com"
+                name = f"{random.choice(FIRST_NAMES)} {i}"
+                style = random.choice(STYLES)
+                users.append((email, 'password', name, '123', f"I shoot {style} photos", 'photographer'))
+                albums.append((f"{style.title()} {i}", 'public', email))
+                packages.append((100, f"{style} session", email))
+            conn.executemany("INSERT INTO user (email, password, name, phone_number, about, type) VALUES (?, ?, ?, ?, ?, ?)", users)
+            conn.executemany("INSERT INTO album (name, release_type, photographer_email) VALUES (?, ?, ?)", albums)
+            conn.executemany("INSERT INTO package (pricing, items, photographer_email) VALUES (?, ?, ?)", packages)
+    return app
+
+
+def timed(func, repeat: int) -> tuple[float, float]:
+    """Median and worst milliseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), max(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--photographers', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    database = os.path.join(tempfile.mkdtemp(), 'search.sqlite')
+    start = time.perf_counter()
+    app = seed(database, args.photographers)
+    print(f"seeded {args.photographers} photographers in {time.perf_counter() - start:.1f}s")
+
+    print(f"{'query':<24}{'results':>10}{'median ms':>12}{'max ms':>10}")
+    with app.app_context():
+        for query in QUERIES:
+            page = db.User.search_photographers(query, 0, 20)
+            median, worst = timed(lambda: db.User.search_photographers(query, 0, 20), args.repeat)
+            print(f"{query:<24}{len(page.items):>10}{median:>12.2f}{worst:>10.2f}")
+
+    client = app.test_client()
+    median, worst = timed(lambda: client.get('/search/photographers?q=port'), args.repeat)
+    print(f"{'GET /search/photographers':<24}{'':>10}{median:>12.2f}{worst:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
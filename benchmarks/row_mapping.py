@@ -0,0 +1,110 @@
+"""Micro-benchmark for row -> model mapping in server.db.
+
+Compares the old path (`sqlite3.Row` rows unpacked with `Model(**row)` into a regular
+dataclass) with `server.db.map_rows` (plain tuples picked apart by a cached itemgetter
+into the slotted models). Reports latency and allocations per 10k rows.
+
+    python -m benchmarks.row_mapping [--rows 10000] [--repeat 5]
+"""
+import argparse
+import dataclasses
+import sqlite3
+import statistics
+import time
+import tracemalloc
+
+from server import db, migrate
+
+START_EPOCH = 1_669_852_800  # 2022-12-01
+
+MODELS = {
+    db.User: (
+        "INSERT INTO user (email, password, name, phone_number, about, type) VALUES (?, ?, ?, ?, ?, ?)",
+        lambda i: (f"user{i}@email.com", 'password', f"User {i}", '123', 'about me', 'photographer'),
+        "SELECT * FROM user",
+    ),
+    db.PhotographerAvailableTime: (
+        # one hour long times back to back, available times may not overlap
+        "INSERT INTO photographer_available_time (start_time, end_time, start_epoch, end_epoch, photographer_email) VALUES (?, ?, ?, ?, ?)",
+        lambda i: (
+            db.from_epoch(START_EPOCH + i * 3600).isoformat(), db.from_epoch(START_EPOCH + (i + 1) * 3600).isoformat(),
+            START_EPOCH + i * 3600, START_EPOCH + (i + 1) * 3600, 'photo@email.com',
+        ),
+        "SELECT * FROM photographer_available_time",
+    ),
+    db.Photo: (
+        "INSERT INTO photo (pathname, album_name) VALUES (?, ?)",
+        lambda i: (f"photo{i}.jpg", f"album{i % 50}"),
+        "SELECT * FROM photo",
+    ),
+}
+
+
+def legacy_model(model: type) -> type:
+    """The same model as a regular (dict based) dataclass, like server.db had before."""
+    namespace = {}
+    if hasattr(model, '__post_init__'):
+        namespace['__post_init__'] = model.__post_init__
+    return dataclasses.make_dataclass(
+        f"Legacy{model.__name__}",
+        [(f.name, f.type, dataclasses.field(init=f.init)) for f in dataclasses.fields(model)],
+        namespace=namespace,
+    )
+
+
+def before(conn: sqlite3.Connection, model: type, sql: str) -> list:
+    conn.row_factory = sqlite3.Row
+    return [model(**row) for row in conn.execute(sql).fetchall()]
+
+
+def after(conn: sqlite3.Connection, model: type, sql: str) -> list:
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(sql)
+    return db.map_rows(model, cursor)
+
+
+def measure(build, repeat: int) -> tuple[float, int, int]:
+    """Median seconds, peak bytes allocated while building and bytes still held by the result."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = build()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return statistics.median(times), peak, retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(':memory:')
+    migrate.upgrade(conn)
+    scale = 10_000 / args.rows
+
+    print(f"{'model':<28}{'path':<8}{'ms/10k':>10}{'peak KiB/10k':>15}{'held KiB/10k':>15}")
+    for model, (insert, make_row, select) in MODELS.items():
+        conn.executemany(insert, (make_row(i) for i in range(args.rows)))
+        conn.commit()
+        legacy = legacy_model(model)
+        for label, build in (
+            ('before', lambda: before(conn, legacy, select)),
+            ('after', lambda: after(conn, model, select)),
+        ):
+            seconds, peak, retained = measure(build, args.repeat)
+            print(
+                f"{model.__name__:<28}{label:<8}{seconds * 1000 * scale:>10.2f}"
+                f"{peak / 1024 * scale:>15.0f}{retained / 1024 * scale:>15.0f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
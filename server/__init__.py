@@ -2,13 +2,93 @@ import os
 
 from flask import Flask
 
-from server import db
+from server import assets, db, fragments, images, invoices, jobs, logs, metrics, storage, templating
 
 
 def create_app():
     app = Flask(__name__)
     app.config.from_mapping(
-        SECRET_KEY="dev", DATABASE=os.path.join(app.instance_path, "server.sqlite")
+        SECRET_KEY="dev",
+        DATABASE=os.path.join(app.instance_path, "server.sqlite"),
+        # connection pool, see server.pool
+        DATABASE_POOL_SIZE=8,
+        DATABASE_POOL_TIMEOUT=5.0,
+        # prepared statements kept per connection, enough for every SQL constant in server.db
+        DATABASE_CACHED_STATEMENTS=256,
+        # per-connection pragmas, set to None to keep the SQLite default
+        DATABASE_JOURNAL_MODE="WAL",
+        DATABASE_SYNCHRONOUS="NORMAL",
+        DATABASE_BUSY_TIMEOUT=5000,  # ms
+        DATABASE_BUSY_RETRIES=3,  # extra attempts to start or commit a transaction
+        DATABASE_MMAP_SIZE=256 * 1024 * 1024,  # bytes
+        DATABASE_CACHE_SIZE=-16000,  # negative means KiB
+        # read replicas, see db.get_read_db
+        DATABASE_REPLICAS=(),  # read-only copies of DATABASE, synced by `flask db sync-replicas` or WAL shipping
+        # cross-request cache for db.User.read
+        USER_CACHE_SIZE=1024,
+        USER_CACHE_TTL=60.0,  # seconds
+        # photo renditions, see server.images
+        IMAGE_WORKERS=2,
+        IMAGE_QUALITY=80,
+        # content-addressed photo storage, see server.storage
+        STORAGE_BACKEND="local",  # "local", "pack" or "s3"
+        STORAGE_DIR=None,  # defaults to <instance>/media, for "local" and "pack"
+        STORAGE_PACK_SIZE=1024 * 1024 * 1024,  # bytes, a full pack file is followed by a new one
+        STORAGE_S3_BUCKET="photos",
+        STORAGE_S3_ENDPOINT_URL="http://localhost:9000",  # e.g. a local MinIO, None for AWS
+        STORAGE_S3_URL_TTL=3600,  # seconds a presigned /media redirect stays valid
+        STORAGE_SENDFILE=None,  # "x-sendfile" or "x-accel-redirect" when a front server sends local files
+        STORAGE_ACCEL_PREFIX="/_media/",  # internal nginx location aliased to STORAGE_DIR
+        STORAGE_GC_GRACE=3600.0,  # seconds an unused object is kept after its latest upload
+        STORAGE_EXISTS_TTL=60.0,  # seconds pages trust a looked up rendition to exist or not
+        # content-hashed static URLs, see server.assets
+        STATIC_FINGERPRINT=True,
+        STATIC_IMMUTABLE_MAX_AGE=365 * 24 * 60 * 60,  # seconds
+        # compiled templates and warm-up, see server.templating
+        TEMPLATE_CACHE_DIR=None,  # defaults to <instance>/jinja, shared by every worker
+        TEMPLATE_PRELOAD=True,  # load every template in create_app
+        TEMPLATE_WARMUP=True,  # request WARMUP_PATHS when a server starts, see server.asgi
+        WARMUP_PATHS=("/", "/login", "/register"),  # must render without the database
+        # password hashing, see server.passwords
+        PASSWORD_HASH="scrypt",  # or "pbkdf2_sha256", existing hashes are upgraded on login
+        PASSWORD_SCRYPT_N=2**14,
+        PASSWORD_SCRYPT_R=8,
+        PASSWORD_SCRYPT_P=1,
+        PASSWORD_PBKDF2_ITERATIONS=600_000,
+        PASSWORD_PROCESSES=2,  # hashing processes, 0 hashes on the request thread
+        # login rate limits as (burst, tokens per second), see server.ratelimit
+        LOGIN_LIMIT_PER_ACCOUNT=(10, 1 / 60),
+        LOGIN_LIMIT_PER_IP=(30, 0.5),
+        LOGIN_LIMIT_KEYS=10_000,  # buckets kept per limit, least recently used dropped
+        # background jobs, see server.jobs
+        JOBS_IN_PROCESS=True,  # run jobs on threads of the web process, False leaves them to `flask worker`
+        JOBS_WORKERS=2,  # threads per worker
+        JOBS_CONCURRENCY={},  # task name -> jobs of it running at once across workers, overrides the task's default
+        JOBS_POLL_INTERVAL=1.0,  # seconds between checks for due jobs when nothing wakes a worker
+        JOBS_RETRY_BACKOFF=5.0,  # seconds before the first retry, doubled for each one after
+        JOBS_LEASE=600.0,  # seconds a job may run before it's assumed lost and queued again
+        # ASGI mode, see server.asgi
+        # requests running the Flask app at once, defaults to DATABASE_POOL_SIZE: each one may hold a
+        # pooled connection, and more would time out waiting for one instead of queueing for a thread
+        ASYNC_THREADS=None,
+        ASYNC_RESPONSE_BUFFER=16,  # response chunks buffered per slow client before its thread waits
+        # keyset-paginated listings (/appt, /manage), ?limit= is capped at PAGE_SIZE_MAX
+        PAGE_SIZE=50,
+        PAGE_SIZE_MAX=200,
+        # instrumentation, see server.metrics and server.logs
+        METRICS_ENABLED=True,
+        METRICS_ALLOWED_IPS=("127.0.0.1", "::1"),  # None serves /__metrics to everyone
+        PROFILE_ENABLED=False,
+        PROFILE_HEADER="X-Profile",
+        PROFILE_DIR=None,  # defaults to <instance>/profiles
+        LOG_LEVEL="INFO",
+        LOG_FORMAT="text",  # or "json"
+        # rendered fragments of public pages, see server.fragments
+        FRAGMENT_CACHE_BACKEND="memory",  # "memory", "filesystem", "redis" or None
+        FRAGMENT_CACHE_SIZE=512,  # fragments kept by the memory and filesystem backends
+        FRAGMENT_CACHE_TTL=300.0,  # seconds
+        FRAGMENT_CACHE_DIR=None,  # defaults to <instance>/fragments
+        FRAGMENT_CACHE_REDIS_URL="redis://localhost:6379/0",
     )
     app.config.from_pyfile("config.py")
     os.makedirs(app.instance_path, exist_ok=True)
@@ -20,4 +100,13 @@ def create_app():
     app.register_blueprint(core)
 
     db.init_app(app)
+    storage.init_app(app)
+    images.init_app(app)
+    assets.init_app(app)
+    fragments.init_app(app)
+    invoices.init_app(app)
+    jobs.init_app(app)
+    metrics.init_app(app)
+    logs.init_app(app)
+    templating.init_app(app)
     return app
@@ -1,44 +1,37 @@
 import datetime
+import json
+import math
 from sqlite3 import IntegrityError
-import sqlite3
-from server import db
+from typing import Optional
+from server import db, fragments, invoices, jobs, passwords, ratelimit, uploads
 from server.decorators import login_required
-from flask import Blueprint, flash, g, redirect, render_template, request, session, url_for
+from markupsafe import Markup
+from flask import Blueprint, Response, abort, current_app, flash, g, redirect, render_template, request, session, stream_with_context, url_for
+from werkzeug.security import safe_join
 
 EMAIL_SESSION_KEY = 'user_email'
 
 core = Blueprint('core', __name__)
-curr_user="none"
-user_type="none"
-loggedIn = 0
 
 @core.route('/')
 def home():
-    global user_type
-    return render_template('home.html.jinja', user_type=user_type, photographers=photographers)
+    return render_template('home.html.jinja', photographers=photographers)
 
 @core.route('/appt')
 def appt():
-    global user_type
-    appointments = []
-    is_photographer = False
-    if user_type == "photographer":
-        is_photographer = True
-    if 'user' in g:
-        user: db.User = g.get('user')
-        curr_user = user
-        if user and user.type is db.UserType.PHOTOGRAPHER:
-            user_type="photographer"
-            is_photographer=True
-        if user and user.type is db.UserType.CLIENT:
-            user_type = "client"
-    appointments = fetch_appointments(curr_user.email, is_photographer)
+    user: db.User = g.user
+    if user is None:
+        return redirect(url_for('.login'))
+    is_photographer = user.type is db.UserType.PHOTOGRAPHER
+    page = db.Appointment.read_page(user.email, not is_photographer, *_page_args('before'))
+    appointments = page.items
+    summary = db.PhotographerSummary.read(user.email) if is_photographer else None
     # for appointment in appointments:
     #     if db.ClientAlbum.exists(appointment['id']):
     #         print("Album exists")
     #         c=db.ClientAlbum.read_all(appointment['id'])
     #         print(c)
-    return render_template('appt.html.jinja', is_photographer=is_photographer, user_type=user_type, appointments = appointments, num_appt = len(appointments))
+    return render_template('appt.html.jinja', is_photographer=is_photographer, appointments = appointments, num_appt = len(appointments), next_cursor=page.next_cursor, summary=summary)
 
 @core.route('/register', methods=('GET', 'POST'))
 def register():
@@ -56,11 +49,13 @@ def register():
         if err:
             return render_register_template(error=err)
 
+        # hashing is as costly as a login attempt, so it's limited like one
+        retry_after = ratelimit.limit_login(None, request.remote_addr)
+        if retry_after:
+            return _too_many_attempts(retry_after, 'register.html.jinja')
+
         try:
-            # TODO(1): for the project we aren't hashing the password for simplicity
-            # if you end up deploying this, hash the passwords on registration
-            # and check password on login with hash
-            db.User.create_client(email, password, name, phone_number)
+            db.User.create_client(email, passwords.hash_password(password), name, phone_number)
             flash("Thank you for registering")
         except IntegrityError:
             flash(f"Email {email} is already registered")
@@ -73,10 +68,13 @@ def render_register_template(**context):
 
 @core.route('/login', methods=('GET', 'POST',))
 def login():
-    global user_type, loggedIn, curr_user
     if request.method == 'POST':
         email = request.form['email']
         password = request.form['password']
+
+        retry_after = ratelimit.limit_login(email, request.remote_addr)
+        if retry_after:
+            return _too_many_attempts(retry_after, 'login.html.jinja')
         
         user = None
         err = None
@@ -85,64 +83,96 @@ def login():
         except ValueError as e:
             err = str(e)
         
-        # TODO(1): same as first comment, this should be comparing password
-        if user and user.password != password:
-            err = "Incorrect password"
+        if user:
+            ok, new_hash = passwords.verify_password(password, user.password)
+            if not ok:
+                err = "Incorrect password"
+            elif new_hash is not None:
+                db.User.update_password(user.email, new_hash)
         
         if user and not err:
+            ratelimit.reset_login(user.email)
             session.clear()
-            loggedIn = 1
-            curr_user=user
-            if user and user.type is db.UserType.PHOTOGRAPHER:
-                user_type="photographer"
-            if user and user.type is db.UserType.CLIENT:
-                user_type = "client"
             session[EMAIL_SESSION_KEY] = user.email
             return redirect(url_for('.home'))
         elif err:
             flash(err)
         
-    return render_template('login.html.jinja', user_type=user_type)
+    return render_template('login.html.jinja')
+
+def _too_many_attempts(retry_after: float, template: str) -> tuple[str, int, dict]:
+    seconds = math.ceil(retry_after)
+    error = f"Too many attempts, try again in {seconds} seconds"
+    return render_template(template, error=error), 429, {'Retry-After': str(seconds)}
 
 @core.route('/logout')
 def logout():
-    global loggedIn, curr_user
     session.clear()
-    curr_user="none"
-    user_type="none"
-    loggedIn = 0;
-    return redirect(url_for('.home', user_type=user_type))
+    return redirect(url_for('.home'))
 
 @core.route('/photographers/<next>')
 def photographers(next: str):
-    global user_type
-    photographers = db.User.list_photographers()
-    return render_template('photographers.html.jinja', user_type=user_type, photographers=photographers, next=next)
+    q = request.args.get('q', '').strip()
+    offset, limit = _page_args('offset')
+    offset = offset or 0
+
+    def render_list():
+        page = db.User.search_photographers(q, offset, limit)
+        return render_template(
+            'photographer_list.html.jinja', photographers=page.items, next_offset=page.next_cursor, next=next, q=q
+        )
+
+    # search results aren't cached, they're cheap and rarely repeat
+    if q:
+        photographer_list = Markup(render_list())
+    else:
+        version = db.CacheVersion.read('photographers')
+        photographer_list = fragments.get_cache().fragment(f"photographers:{next}:{offset}:{limit}:v{version}", render_list)
+    return render_template('photographers.html.jinja', photographer_list=photographer_list, next=next, q=q)
+
+@core.route('/search/photographers')
+def search_photographers():
+    """JSON search for photographers by name, about text, album names and package items, ?q= is prefix matched."""
+    offset, limit = _page_args('offset')
+    page = db.User.search_photographers(request.args.get('q', ''), offset or 0, limit)
+    return dict(
+        results=[dict(email=user.email, name=user.name, about=user.about) for user in page.items],
+        next_offset=page.next_cursor,
+    )
 
 @core.route('/gallery/<email>')
 def gallery(email: str):
-    global curr_user, user_type
     photographer = db.User.read(email)
-    albums = db.Album.read(email)
-    return render_template('gallery.html.jinja',user_type=user_type, curr_user=curr_user, photographer=photographer, albums=albums)
+    user: db.User = g.user
+    is_owner = user is not None and user.email == email
+
+    def render_albums():
+        albums = db.Album.read(email)
+        return render_template('gallery_albums.html.jinja', albums=albums, is_owner=is_owner)
+
+    # the owner sees edit controls, everyone else gets the shared public fragment
+    if is_owner:
+        album_list = Markup(render_albums())
+    else:
+        version = db.CacheVersion.read(f"photographer:{email}")
+        album_list = fragments.get_cache().fragment(f"gallery:{email}:v{version}", render_albums)
+    return render_template('gallery.html.jinja', photographer=photographer, album_list=album_list)
 
 @login_required
 @core.route('/edit_gallery/<email>')
 def edit_gallery(email: str):
-    global curr_user, user_type
     photographer = db.User.read(email)
     albums = db.Album.read(email)
-    return render_template('edit_gallery.html.jinja',user_type=user_type, curr_user=curr_user, photographer=photographer, albums=albums)
+    return render_template('edit_gallery.html.jinja', photographer=photographer, albums=albums)
 
 @login_required
 @core.route('/view_client_photos/<int:appt_id>')
 def view_client_photos(appt_id: int):
-    global curr_user, user_type
     # email = db.Appointment.read(appt_id).photographer_email
     # album = db.Album.read(email)[0]
     album = db.ClientAlbum.read(appt_id)[0]
-    print(album)
-    return render_template('view_client_photos.html.jinja',user_type=user_type, curr_user=curr_user, album=album)
+    current_app.logger.debug("viewing client album", extra=dict(appointment_id=appt_id, album=album.name))
+    return render_template('view_client_photos.html.jinja', album=album)
 
 
 @login_required
@@ -151,7 +181,7 @@ def edit_about(email: str):
     if request.method == 'POST':
         text = request.form['text']
         db.User.edit_about(text, email)
-    return redirect(url_for('core.gallery', user_type=user_type, email=curr_user.email, photographer=curr_user))
+    return redirect(url_for('core.gallery', email=email))
 
 @login_required
 @core.route('/add_album/<photographer_email>',  methods=('POST',))
@@ -159,50 +189,91 @@ def add_album(photographer_email: str):
     if request.method == 'POST':
         album_name = request.form['album_name']
         release_type = request.form['release_type']
-        db.Album.create(album_name, release_type, photographer_email)
-        photos = request.form['photos']
-        pathnames = photos.split(",")
-        for pathname in pathnames:
-            db.Photo.create(pathname, album_name)
-    return redirect(url_for('core.gallery', user_type=user_type, email=curr_user.email, photographer=curr_user))
+        # uploads are stored before the write lock is taken, gc removes them if the album isn't created
+        pathnames = _album_pathnames()
+        with db.transaction():
+            db.Album.create(album_name, release_type, photographer_email)
+            db.Photo.create_many(pathnames, album_name)
+            jobs.enqueue('renditions', pathnames=pathnames)
+    return redirect(url_for('core.gallery', email=photographer_email))
 
 @login_required
 @core.route('/add_client_album/<int:appt_id>', methods=('GET', 'POST'))
 def add_client_album(appt_id: int):
+    user: db.User = g.user
     appt = db.Appointment.read(appt_id)
     client_email = appt.client_email
     if request.method == 'POST':
         album_name = request.form['album_name']
         release_type = request.form['release_type']
-        c = db.ClientAlbum.create(album_name, release_type, appt_id, client_email, curr_user.email)
-        print(c)
-        photos = request.form['photos']
-        pathnames = photos.split(",")
-        for pathname in pathnames:
-            db.Photo.create(pathname, album_name)
-        appointments = []
-        is_photographer = False
-        if user_type == "photographer":
-            is_photographer = True
-        appointments = fetch_appointments(curr_user.email, is_photographer)
-        clientalbums = db.ClientAlbum.read(appt_id)
-        print(clientalbums)
-        return render_template('appt.html.jinja', is_photographer=is_photographer, user_type=user_type, appointments = appointments, num_appt = len(appointments))
-    return render_template('add_client_album.html.jinja', user_type=user_type, curr_user=curr_user, photographer_email=curr_user.email, client_email=client_email, appt_id=appt_id)
+        pathnames = _album_pathnames()
+        try:
+            with db.transaction():
+                db.ClientAlbum.create(album_name, release_type, appt_id, client_email, user.email)
+                db.Photo.create_many(pathnames, album_name)
+                jobs.enqueue('renditions', pathnames=pathnames)
+        except IntegrityError:
+            flash("The album could not be created")
+            return render_template('add_client_album.html.jinja', photographer_email=user.email, client_email=client_email, appt_id=appt_id)
+        current_app.logger.debug("client album created", extra=dict(appointment_id=appt_id, album=album_name))
+        is_photographer = user.type is db.UserType.PHOTOGRAPHER
+        page = db.Appointment.read_page(user.email, not is_photographer, *_page_args('before'))
+        appointments = page.items
+        return render_template('appt.html.jinja', is_photographer=is_photographer, appointments = appointments, num_appt = len(appointments), next_cursor=page.next_cursor)
+    return render_template('add_client_album.html.jinja', photographer_email=user.email, client_email=client_email, appt_id=appt_id)
+
+def _album_pathnames() -> list[str]:
+    """Pathnames typed into the `photos` field plus the keys of any files uploaded with the form.
+
+    Typed pathnames that would point outside the static folder are dropped.
+    """
+    typed = (pathname.strip() for pathname in request.form.get('photos', '').split(","))
+    pathnames = [pathname for pathname in typed if pathname and safe_join(current_app.static_folder, pathname)]
+    events = uploads.save_uploads(request.files.getlist('files'))
+    pathnames += [event['pathname'] for event in events if event['status'] == 'saved']
+    return pathnames
 
+@login_required
+@core.route('/upload_photos/<album_name>', methods=('POST',))
+def upload_photos(album_name: str):
+    """Bulk upload into an existing album, responds with one JSON line per file and a summary."""
+    user: db.User = g.get('user')
+    if not user or not db.Album.readalbum(user.email, album_name, with_photos=False):
+        abort(404)
+    # each file's line is sent as soon as it's stored, so the uploads have to outlive the view
+    files = uploads.detach(request.files.getlist('photos'))
+    db.expect_write()
+
+    def progress():
+        try:
+            pathnames = []
+            for event in uploads.save_uploads(files):
+                if event['status'] == 'saved':
+                    pathnames.append(event['pathname'])
+                yield json.dumps(event) + '\n'
+        finally:
+            for file in files:
+                file.close()
+        with db.transaction():
+            photos = db.Photo.create_many(pathnames, album_name)
+            if photos:
+                jobs.enqueue('renditions', pathnames=pathnames)
+        yield json.dumps(dict(status='done', album_name=album_name, created=len(photos), total=len(files))) + '\n'
+
+    return Response(stream_with_context(progress()), mimetype='application/x-ndjson')
 
 @login_required
 @core.route("/delete_album/<album_name>", methods=('POST',)) 
+@db.atomic
 def delete_album(album_name: str): 
-    global curr_user
-    db.Album.delete(curr_user.email, album_name)
-    return redirect(url_for('core.gallery', email=curr_user.email))
+    user: db.User = g.user
+    db.Album.delete(user.email, album_name)
+    return redirect(url_for('core.gallery', email=user.email))
 
 
 @login_required
 @core.route('/manage', methods=('GET', 'POST'))
 def manage():
-    global user_type
     user: db.User = g.user
     # for rn, /manage is only for photographers
     if user.type is not db.UserType.PHOTOGRAPHER:
@@ -212,28 +283,35 @@ def manage():
     if request.method == 'POST':
         start = request.form['start']
         end = request.form['end']
-        db.PhotographerAvailableTime.create(start, end, user.email)
+        try:
+            available_time = db.PhotographerAvailableTime.create(start, end, user.email)
+        except ValueError:
+            available_time = None
+        if available_time is None:
+            flash("Available times must end after they start and can't overlap")
         return redirect(url_for('.manage')) # reload page after post
     
     available_times = db.PhotographerAvailableTime.read_all(user.email, False)
-    contact_forms = db.ContactForm.read(user.email)
-    feedbacks = db.FeedbackForm.read_all(user.email)
-    feedback_form_ids = {feedback.form_id for feedback in feedbacks}
-    contact_forms = [form for form in contact_forms if form.id not in feedback_form_ids]
-    print(feedbacks)
+    inquiries = db.ContactForm.read_inquiries(user.email, *_page_args('forms_before'))
+    feedbacks = db.FeedbackForm.read_page(user.email, *_page_args('feedback_before'))
+    summary = db.PhotographerSummary.read(user.email)
+    # the newest inquiries are on the first page, showing it marks them read
+    if summary.unread_inquiries and request.args.get('forms_before') is None and inquiries.items:
+        db.PhotographerSummary.mark_inquiries_read(user.email, inquiries.items[0].id)
     return render_template(
         'manage.html.jinja', 
         user=user, 
-        user_type=user_type,
+        summary=summary,
         available_times=available_times, 
-        contact_forms=contact_forms,
-        feedbacks=feedbacks
+        contact_forms=inquiries.items,
+        feedbacks=feedbacks.items,
+        forms_cursor=inquiries.next_cursor,
+        feedback_cursor=feedbacks.next_cursor,
     )
     
 @login_required
 @core.route('/create_photographer', methods=('GET', 'POST'))
 def create_photographer():
-    global user_type
     if request.method == 'POST':
         err = None
 
@@ -251,20 +329,16 @@ def create_photographer():
             return render_register_template(error=err)
 
         try:
-            # TODO(1): for the project we aren't hashing the password for simplicity
-            # if you end up deploying this, hash the passwords on registration
-            # and check password on login with hash
-            db.User.create_photographer(email, password, name, phone_number, about, account_type)
+            db.User.create_photographer(email, passwords.hash_password(password), name, phone_number, about, account_type)
             flash("Photographer account created")
         except IntegrityError:
             flash(f"Email {email} is already registered")
         return redirect(url_for('.manage'))
-    return render_template('create_photographer.html.jinja', user_type=user_type)
+    return render_template('create_photographer.html.jinja')
 
 @login_required
 @core.route('/book/<photographer_email>', methods=('GET', 'POST'))
 def book(photographer_email: str):
-    global user_type
     user: db.User = g.user
     if not user or user.type is not db.UserType.CLIENT:
         flash("You must be a logged in client to book with this photographer")
@@ -283,17 +357,20 @@ def book(photographer_email: str):
         if err:
             return render_register_template(error=err)
 
-        db.Appointment.create(time_id, confirmed, completed, package_id, photographer_email, user.email)
+        appointment = db.Appointment.create(time_id, confirmed, completed, package_id, photographer_email, user.email)
+        if appointment is None:
+            flash("Sorry, that time was just booked")
+            return redirect(url_for('.book', photographer_email=photographer_email))
         flash("Thank you for your booking!")
-        return redirect(url_for('core.gallery', curr_user=curr_user, email=photographer_email))
+        return redirect(url_for('core.gallery', email=photographer_email))
 
     
     photographer = db.User.read(photographer_email)
-    available_times = db.PhotographerAvailableTime.read_all(photographer_email, False)
+    available_times = db.PhotographerAvailableTime.read_free(photographer_email, datetime.datetime.now())
     packages = db.Package.read_all(photographer.email)
     packages.sort(key=lambda package: package.pricing)
 
-    return render_template('book.html.jinja', user_type=user_type, photographer=photographer, available_times=available_times, packages=packages)
+    return render_template('book.html.jinja', photographer=photographer, available_times=available_times, packages=packages)
 
 
 @login_required
@@ -301,60 +378,85 @@ def book(photographer_email: str):
 def contact(photographer_email: str):
     #    flash("You must be a logged in client to contact this photographer")
     #    return redirect(url_for('.home'))
-    global loggedIn
     if request.method == 'POST':
-        if loggedIn == 1:
-            user: db.User = g.user
+        user: db.User = g.user
+        if user is not None:
             name = user.name
             emails = user.email
-        elif loggedIn == 0:
+        else:
             emails = request.form['email']
             name = request.form['name']
             
         message = request.form['message']
-        db.ContactForm.create(message, emails, name, photographer_email)
-        return redirect(url_for('core.gallery', user_type=user_type, curr_user=curr_user, email=photographer_email))
+        with db.transaction():
+            db.ContactForm.create(message, emails, name, photographer_email)
+            jobs.enqueue('notify', to=photographer_email, subject=f"New inquiry from {name}", body=message)
+        return redirect(url_for('core.gallery', email=photographer_email))
 
     photographer = db.User.read(photographer_email)
-    return render_template('contact.html.jinja', user_type=user_type, photographer=photographer, loggedIn = loggedIn)
+    return render_template('contact.html.jinja', photographer=photographer)
 
 @login_required
 @core.route("/confirm_appt/<int:appointment_id>", methods=('POST',)) 
 def confirm_appt(appointment_id: int): 
     db.Appointment.confirm(appointment_id)
-    return redirect(url_for('core.appt', user_type=user_type, ))
+    return redirect(url_for('core.appt'))
 
 @login_required
 @core.route("/complete_appt/<int:appointment_id>", methods=('POST',)) 
+@db.atomic
 def complete_appt(appointment_id: int): 
     db.Appointment.complete(appointment_id)
-    return redirect(url_for('core.appt', user_type=user_type, ))
+    # the invoice is issued and the client notified in the background, /invoice issues it on demand too
+    jobs.enqueue('issue_invoice', appointment_id=appointment_id)
+    return redirect(url_for('core.appt'))
 
 @login_required
 @core.route("/delete_appt/<int:appointment_id>", methods=('POST',)) 
 def delete_appt(appointment_id: int): 
     db.Appointment.delete(appointment_id)
-    return redirect(url_for('core.appt', user_type=user_type))
+    return redirect(url_for('core.appt'))
 
 @login_required
 @core.route('/invoice/<int:appointment_id>')
 def invoice(appointment_id: int):
-    global user_type
-    appointment = db.Appointment.read(appointment_id)
-    time = db.PhotographerAvailableTime.read(appointment.time_id)
-    package = db.Package.read(appointment.package_id)
-    photographer = db.User.read(appointment.photographer_email)
-    client = db.User.read(appointment.client_email)
+    invoice = db.Invoice.issue(appointment_id)
+    if invoice is None:
+        abort(404)
+    return render_template('invoice.html.jinja', invoice=invoice)
 
-    invoice = db.Invoice.create(datetime.datetime.now(), package.pricing, package.items, appointment.id)
-    return render_template('invoice.html.jinja', user_type=user_type, appointment=appointment, invoice=invoice, time=time, client=client, photographer=photographer)
+@login_required
+@core.route('/invoices/export')
+def export_invoices():
+    """Streams the logged in photographer's invoices for appointments in [start, end)."""
+    user: db.User = g.user
+    if not user or user.type is not db.UserType.PHOTOGRAPHER:
+        flash("You must be a logged in photographer to export invoices")
+        return redirect(url_for('.home'))
+
+    format = request.args.get('format', 'csv')
+    if format not in invoices.FORMATS:
+        abort(400)
+    try:
+        start = datetime.datetime.fromisoformat(request.args['start'])
+        end = datetime.datetime.fromisoformat(request.args['end'])
+    except (KeyError, ValueError):
+        abort(400)
+
+    _, mimetype = invoices.FORMATS[format]
+    filename = f"invoices-{start:%Y%m%d}-{end:%Y%m%d}.{format}"
+    return Response(
+        stream_with_context(invoices.export(format, start, end, user.email)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
 
 @login_required
 @core.route('/feedback/<int:appt_id>', methods=('GET', 'POST',))
 def feedback(appt_id: int):
     user: db.User = g.user
     if not user or user.type is not db.UserType.CLIENT:
-        print("not client")
+        current_app.logger.debug("feedback needs a client account", extra=dict(appointment_id=appt_id))
         flash("You must be a logged in client to leave feedback")
         return redirect(url_for('.home'))
 
@@ -364,8 +466,10 @@ def feedback(appt_id: int):
         appointment = db.Appointment.read(appt_id)
         client = db.User.read(appointment.client_email)
         message = request.form['message']
-        f=db.FeedbackForm.create(message, appointment.client_email, client.name, appointment.photographer_email, appt_id)
-        print(f)
+        with db.transaction():
+            db.FeedbackForm.create(message, appointment.client_email, client.name, appointment.photographer_email, appt_id)
+            jobs.enqueue('notify', to=appointment.photographer_email, subject=f"Feedback from {client.name}", body=message)
+        current_app.logger.debug("feedback created", extra=dict(appointment_id=appt_id))
         return redirect(url_for('.home', appointment_id=appointment.id))
 
     return render_template('feedback.html.jinja', invoice=invoice, feedback_exists=feedback_exists)
@@ -378,25 +482,31 @@ def delete_available_time(id: int):
 
 @core.before_app_request
 def load_user():
+    """Identity for this request only, nothing about the user is kept outside `g` and the session."""
+    if request.endpoint == 'static':
+        return
+    g.user = None
     user_email = session.get(EMAIL_SESSION_KEY)
 
     if user_email:
-        g.user = db.User.read(user_email)
+        try:
+            g.user = db.User.read(user_email)
+        except ValueError:
+            # the account behind this session no longer exists
+            session.clear()
 
 @core.context_processor
 def inject_constants():
-    return dict(EMAIL_SESSION_KEY=EMAIL_SESSION_KEY)
-
-def fetch_appointments(email: str, is_photographer: bool):
-    db_ = db.get_db() 
-    data = db_.execute(
-        f"SELECT * FROM appointment a LEFT JOIN photographer_available_time pat ON a.time_id = pat.id LEFT JOIN package p ON a.package_id = p.id WHERE a.{'photographer_email' if is_photographer else 'client_email'} = ?", 
-        (email,)
-    ).fetchall()
-    return [_parse_times(row) for row in data]
-
-def _parse_times(appointment: sqlite3.Row):
-    parsed_appointment = dict(appointment)
-    parsed_appointment['start_time'] = datetime.datetime.fromisoformat(appointment['start_time'])
-    parsed_appointment['end_time'] = datetime.datetime.fromisoformat(appointment['end_time'])
-    return parsed_appointment
+    user: db.User = g.get('user')
+    return dict(
+        EMAIL_SESSION_KEY=EMAIL_SESSION_KEY,
+        curr_user=user,
+        user_type=user.type.value if user else "none",
+        loggedIn=int(user is not None),
+    )
+
+def _page_args(cursor_arg: str) -> tuple[Optional[int], int]:
+    """Keyset cursor from the query string and the page size, capped at PAGE_SIZE_MAX."""
+    before = request.args.get(cursor_arg, type=int)
+    limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+    return before, max(1, min(limit, current_app.config['PAGE_SIZE_MAX']))
@@ -0,0 +1,254 @@
+"""ASGI entry point, for serving many slow clients from one process.
+
+    uvicorn --factory server.asgi:create_asgi_app
+
+The event loop owns every connection, so a client on a slow mobile link costs a
+coroutine and a buffered response instead of a worker thread. Requests still run the
+regular Flask app, in a bounded pool of ASYNC_THREADS threads, so the views and the
+database layer stay synchronous (no flask[async]/asgiref). By default there are as many
+threads as pooled database connections, so busy requests wait here for a thread instead
+of timing out waiting for a connection. Each thread is given back as soon as the response
+is produced. Responses longer than ASYNC_RESPONSE_BUFFER chunks,
+such as streamed exports, make their thread wait for the client.
+
+Static files (including photos and renditions) don't take a request thread. They are
+sent from the loop with the same caching headers as server.assets. When the server
+supports the `http.response.zerocopysend` or `http.response.pathsend` ASGI extensions,
+the kernel copies the file straight to the socket. Otherwise the file is read in chunks
+off the loop. Range requests and apps without fingerprinting fall through to Flask.
+"""
+from __future__ import annotations
+import asyncio
+import mimetypes
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from flask import Flask
+from werkzeug.http import http_date
+from werkzeug.security import safe_join
+
+from server import assets, create_app, templating
+
+# request bodies larger than this are spooled to a temporary file
+BODY_IN_MEMORY = 1024 * 1024
+FILE_CHUNK_SIZE = 256 * 1024
+
+
+class _Disconnected(Exception):
+    pass
+
+
+class AsgiApp:
+    def __init__(self, app: Flask):
+        self.app = app
+        # no more threads than pooled connections, so requests queue here rather than time out
+        # in `ConnectionPool.checkout`
+        threads = app.config['ASYNC_THREADS'] or app.config['DATABASE_POOL_SIZE']
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            if not await self._send_static(scope, send):
+                await self._call_flask(scope, receive, send)
+        else:
+            raise NotImplementedError(f"unsupported ASGI scope type {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                if self.app.config['TEMPLATE_WARMUP']:
+                    await asyncio.get_running_loop().run_in_executor(self.executor, templating.warm_up, self.app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                worker = self.app.extensions.get('job_worker')
+                if worker is not None:
+                    worker.stop()
+                    worker.join()
+                for name in ('db_pool', 'db_replicas'):
+                    pool = self.app.extensions.get(name)
+                    if pool is not None:
+                        pool.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _call_flask(self, scope, receive, send):
+        body = await _read_body(receive)
+        environ = _environ(scope, body)
+        loop = asyncio.get_running_loop()
+        messages: asyncio.Queue = asyncio.Queue(maxsize=self.app.config['ASYNC_RESPONSE_BUFFER'])
+        disconnected = threading.Event()
+
+        def put(message):
+            if disconnected.is_set():
+                raise _Disconnected()
+            asyncio.run_coroutine_threadsafe(messages.put(message), loop).result()
+
+        def run():
+            try:
+                start = {}
+
+                def start_response(status, headers, exc_info=None):
+                    start.update(
+                        type='http.response.start',
+                        status=int(status.split(' ', 1)[0]),
+                        headers=[(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+                    )
+
+                iterable = self.app(environ, start_response)
+                try:
+                    started = False
+                    for chunk in iterable:
+                        if not chunk:
+                            continue
+                        if not started:
+                            put(start)
+                            started = True
+                        put({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    if not started:
+                        put(start)
+                    put({'type': 'http.response.body', 'body': b'', 'more_body': False})
+                finally:
+                    if hasattr(iterable, 'close'):
+                        iterable.close()
+            except _Disconnected:
+                pass
+            except BaseException as e:
+                if not disconnected.is_set():
+                    put(e)
+            finally:
+                body.close()
+
+        worker = loop.run_in_executor(self.executor, run)
+        try:
+            while True:
+                message = await messages.get()
+                if isinstance(message, BaseException):
+                    raise message
+                await send(message)
+                if message['type'] == 'http.response.body' and not message['more_body']:
+                    break
+        finally:
+            # let a thread that is still producing (e.g. the client went away) run to completion
+            disconnected.set()
+            while not worker.done():
+                while not messages.empty():
+                    messages.get_nowait()
+                await asyncio.wait([worker], timeout=0.05)
+        await worker
+
+    async def _send_static(self, scope, send) -> bool:
+        """Sends a static file from the event loop, False if Flask has to handle the request."""
+        app = self.app
+        prefix = f"{app.static_url_path}/"
+        headers = dict(scope['headers'])
+        if (
+            scope['method'] not in ('GET', 'HEAD')
+            or not scope['path'].startswith(prefix)
+            or b'range' in headers
+            or 'asset_manifest' not in app.extensions
+        ):
+            return False
+
+        with app.app_context():
+            static = assets.resolve(scope['path'][len(prefix):])
+            max_age = app.config['STATIC_IMMUTABLE_MAX_AGE']
+        if static is None:
+            return False
+        path = safe_join(app.static_folder, static.filename)
+        stat = os.stat(path)
+
+        etag = f'"{static.digest}"'
+        response_headers = [
+            (b'etag', etag.encode()),
+            (b'last-modified', http_date(stat.st_mtime).encode()),
+            (b'cache-control', f"public, max-age={max_age}, immutable".encode() if static.immutable else b'no-cache'),
+        ]
+        if etag.encode() in headers.get(b'if-none-match', b'').split(b', '):
+            await send({'type': 'http.response.start', 'status': 304, 'headers': response_headers})
+            await send({'type': 'http.response.body', 'body': b''})
+            return True
+
+        mimetype = mimetypes.guess_type(static.filename)[0] or 'application/octet-stream'
+        response_headers += [(b'content-type', mimetype.encode()), (b'content-length', str(stat.st_size).encode())]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': response_headers})
+        if scope['method'] == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            return True
+
+        extensions = scope.get('extensions') or {}
+        if 'http.response.zerocopysend' in extensions:
+            with open(path, 'rb') as f:
+                await send({'type': 'http.response.zerocopysend', 'file': f.fileno(), 'count': stat.st_size})
+        elif 'http.response.pathsend' in extensions:
+            await send({'type': 'http.response.pathsend', 'path': path})
+        else:
+            await self._send_chunks(path, send)
+        return True
+
+    async def _send_chunks(self, path: str, send):
+        loop = asyncio.get_running_loop()
+        with open(path, 'rb') as f:
+            while True:
+                chunk = await loop.run_in_executor(None, f.read, FILE_CHUNK_SIZE)
+                more = len(chunk) == FILE_CHUNK_SIZE
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': more})
+                if not more:
+                    return
+
+
+async def _read_body(receive) -> tempfile.SpooledTemporaryFile:
+    body = tempfile.SpooledTemporaryFile(max_size=BODY_IN_MEMORY)
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            break
+    body.seek(0)
+    return body
+
+
+def _environ(scope, body) -> dict:
+    server: Optional[tuple] = scope.get('server')
+    client: Optional[tuple] = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0] if server else 'localhost',
+        'SERVER_PORT': str(server[1]) if server else '80',
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': client[0] if client else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f"HTTP_{name}"
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    # the body is already read in full, so chunked requests get a length too
+    if 'CONTENT_LENGTH' not in environ:
+        environ['CONTENT_LENGTH'] = str(body.seek(0, os.SEEK_END))
+        body.seek(0)
+    return environ
+
+
+def create_asgi_app() -> AsgiApp:
+    return AsgiApp(create_app())
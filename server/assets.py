@@ -0,0 +1,132 @@
+"""Fingerprinted static files.
+
+`url_for('static', filename='main.css')` builds `/static/main.<hash>.css`, where the hash
+is taken from the file contents. Fingerprinted URLs never change content so they are
+served as immutable for a year; plain static URLs get a strong content ETag so repeat
+visits revalidate with a 304, and both support Range requests.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from flask import Flask, Response, abort, current_app, send_from_directory
+from werkzeug.security import safe_join
+
+HASH_LENGTH = 12
+_FINGERPRINTED = re.compile(rf'^(?P<stem>.+)\.(?P<hash>[0-9a-f]{{{HASH_LENGTH}}})(?P<ext>\.[^./]+)$')
+
+
+@dataclass
+class _Entry:
+    mtime: float
+    size: int
+    digest: str
+
+
+class AssetManifest:
+    """Content hashes of the files in a static folder, refreshed when a file changes on disk."""
+
+    def __init__(self, static_folder: str):
+        self.static_folder = static_folder
+        self._entries: dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Hashes every file up front so the first requests don't pay for it."""
+        for root, _, files in os.walk(self.static_folder):
+            for name in files:
+                path = os.path.relpath(os.path.join(root, name), self.static_folder)
+                self.digest(path.replace(os.sep, '/'))
+
+    def digest(self, filename: str) -> Optional[str]:
+        path = safe_join(self.static_folder, filename)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        entry = self._entries.get(filename)
+        if entry is None or entry.mtime != stat.st_mtime or entry.size != stat.st_size:
+            entry = _Entry(stat.st_mtime, stat.st_size, _hash_file(path))
+            with self._lock:
+                self._entries[filename] = entry
+        return entry.digest
+
+    def fingerprinted(self, filename: str) -> str:
+        digest = self.digest(filename)
+        if digest is None:
+            return filename
+        stem, ext = os.path.splitext(filename)
+        return f"{stem}.{digest[:HASH_LENGTH]}{ext}"
+
+
+def _hash_file(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get_manifest(app: Optional[Flask] = None) -> AssetManifest:
+    app = app or current_app._get_current_object()
+    return app.extensions['asset_manifest']
+
+
+def _fingerprint_static_urls(endpoint: str, values: dict):
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = get_manifest().fingerprinted(values['filename'])
+
+
+@dataclass
+class StaticFile:
+    filename: str  # without the fingerprint
+    digest: str
+    # fingerprinted with the current hash, an outdated or missing fingerprint has to revalidate
+    immutable: bool
+
+
+def resolve(filename: str) -> Optional[StaticFile]:
+    """The file behind a (possibly fingerprinted) static URL, None if there is no such file."""
+    manifest = get_manifest()
+    match = _FINGERPRINTED.match(filename)
+    if match:
+        original = match['stem'] + match['ext']
+        digest = manifest.digest(original)
+        if digest is not None:
+            return StaticFile(original, digest, digest.startswith(match['hash']))
+    digest = manifest.digest(filename)
+    return None if digest is None else StaticFile(filename, digest, False)
+
+
+def send_static_file(filename: str) -> Response:
+    static = resolve(filename)
+    if static is None:
+        abort(404)
+    if static.immutable:
+        response = send_from_directory(
+            get_manifest().static_folder, static.filename, etag=static.digest,
+            max_age=current_app.config['STATIC_IMMUTABLE_MAX_AGE'],
+        )
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    else:
+        response = send_from_directory(get_manifest().static_folder, static.filename, etag=static.digest, max_age=0)
+        response.cache_control.no_cache = True
+    return response
+
+
+def init_app(app: Flask):
+    if not app.config['STATIC_FINGERPRINT'] or app.static_folder is None:
+        return
+    manifest = AssetManifest(app.static_folder)
+    manifest.build()
+    app.extensions['asset_manifest'] = manifest
+    app.url_defaults(_fingerprint_static_urls)
+    app.view_functions['static'] = send_static_file
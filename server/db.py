@@ -1,66 +1,520 @@
 from __future__ import annotations
 import datetime
+import functools
+import json
+import operator
+import re
 
 import sqlite3
-from dataclasses import dataclass, field
+import threading
+import time
+from contextlib import closing, contextmanager
+from dataclasses import dataclass, field, fields, replace
 from enum import Enum
-from typing import Optional
+from typing import Callable, Generic, Iterator, Optional, TypeVar
 
 import click
-from flask import Flask, current_app, g
-
-from server.decorators import tries_to_commit
-
+from flask import Flask, current_app, g, has_request_context, session
+
+from server import metrics, migrate, passwords
+from server.cache import TTLCache
+from server.decorators import P, T, tries_to_commit
+from server.pool import ConnectionPool, ReplicaSet
+
+
+_extensions_lock = threading.Lock()
+
+# the replication position of the session's latest write, see `get_read_db`
+REPLICATION_SESSION_KEY = 'db_position'
+# set by `expect_write`, the session's next request learns the position of that write
+REPLICATION_PENDING_KEY = 'db_write_pending'
+
+def _pool_options(app: Flask) -> dict:
+    return dict(
+        max_size=app.config['DATABASE_POOL_SIZE'],
+        timeout=app.config['DATABASE_POOL_TIMEOUT'],
+        cached_statements=app.config['DATABASE_CACHED_STATEMENTS'],
+        factory=metrics.InstrumentedConnection if app.config['METRICS_ENABLED'] else sqlite3.Connection,
+    )
+
+def get_pool(app: Optional[Flask] = None) -> ConnectionPool:
+    """Returns the connection pool of `app`, creating it on first use from the app config."""
+    app = app or current_app._get_current_object()
+    pool = app.extensions.get('db_pool')
+    if pool is None or pool.database != app.config['DATABASE']:
+        with _extensions_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None or pool.database != app.config['DATABASE']:
+                if pool is not None:
+                    pool.close()
+                pool = ConnectionPool(
+                    app.config['DATABASE'],
+                    pragmas={
+                        'journal_mode': app.config['DATABASE_JOURNAL_MODE'],
+                        'synchronous': app.config['DATABASE_SYNCHRONOUS'],
+                        'busy_timeout': app.config['DATABASE_BUSY_TIMEOUT'],
+                        'mmap_size': app.config['DATABASE_MMAP_SIZE'],
+                        'cache_size': app.config['DATABASE_CACHE_SIZE'],
+                    },
+                    **_pool_options(app),
+                )
+                app.extensions['db_pool'] = pool
+    return pool
+
+def get_replicas(app: Optional[Flask] = None) -> Optional[ReplicaSet]:
+    """Returns the read replica pools of `app`, None when DATABASE_REPLICAS is empty."""
+    app = app or current_app._get_current_object()
+    databases = tuple(app.config['DATABASE_REPLICAS'])
+    if not databases:
+        return None
+    replicas = app.extensions.get('db_replicas')
+    if replicas is None or replicas.databases != databases:
+        with _extensions_lock:
+            replicas = app.extensions.get('db_replicas')
+            if replicas is None or replicas.databases != databases:
+                if replicas is not None:
+                    replicas.close()
+                # replicas are opened read-only, so no journal mode or synchronous setting
+                replicas = ReplicaSet(
+                    databases,
+                    pragmas={
+                        'busy_timeout': app.config['DATABASE_BUSY_TIMEOUT'],
+                        'mmap_size': app.config['DATABASE_MMAP_SIZE'],
+                        'cache_size': app.config['DATABASE_CACHE_SIZE'],
+                    },
+                    **_pool_options(app),
+                )
+                app.extensions['db_replicas'] = replicas
+    return replicas
+
+def get_user_cache(app: Optional[Flask] = None) -> TTLCache[str, User]:
+    """Returns the cross-request `User.read` cache of `app`, see USER_CACHE_* in the config."""
+    app = app or current_app._get_current_object()
+    cache = app.extensions.get('user_cache')
+    if cache is None:
+        with _extensions_lock:
+            cache = app.extensions.setdefault('user_cache', TTLCache(
+                max_size=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL']
+            ))
+    return cache
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(current_app.config['DATABASE'], detect_types=sqlite3.PARSE_DECLTYPES)
-        g.db.row_factory = sqlite3.Row
+        g.db = get_pool().checkout()
     
     return g.db
 
+def _checkout_replica(replicas: ReplicaSet, required: int) -> Optional[tuple[ConnectionPool, sqlite3.Connection]]:
+    for pool in replicas.shuffled():
+        try:
+            conn = pool.checkout()
+        except sqlite3.Error as e:
+            current_app.logger.warning("replica unavailable", extra=dict(replica=pool.database, error=str(e)))
+            continue
+        try:
+            row = conn.execute(ReplicationPosition.READ).fetchone()
+        except sqlite3.Error as e:
+            # not synced yet, or mid-sync for longer than the busy timeout
+            current_app.logger.warning("replica unavailable", extra=dict(replica=pool.database, error=str(e)))
+            pool.checkin(conn, discard=True)
+            continue
+        if row is None or row[0] < required:
+            pool.checkin(conn)
+            replicas.count('behind')
+            continue
+        return pool, conn
+    return None
+
+def get_read_db():
+    """Connection for reads: a replica when one is current enough, otherwise the primary.
+
+    Only requests read from replicas, jobs and CLI commands always use the primary, as
+    does anything inside a `transaction`. A request picks a replica that has its session's
+    latest write (see `transaction`) and keeps it, so users always read their own writes
+    even while the replicas lag behind.
+    """
+    if g.get('transaction_depth') or not has_request_context():
+        return get_db()
+    if 'read_db' in g:
+        return g.read_db
+    replicas = get_replicas()
+    if replicas is None:
+        return get_db()
+
+    if session.get(REPLICATION_PENDING_KEY):
+        # the streamed response that wrote has been read by now, the primary's position covers its write
+        session.pop(REPLICATION_PENDING_KEY)
+        position = get_db().execute(ReplicationPosition.READ).fetchone()[0]
+        session[REPLICATION_SESSION_KEY] = max(position, session.get(REPLICATION_SESSION_KEY, 0))
+    checked_out = _checkout_replica(replicas, session.get(REPLICATION_SESSION_KEY, 0))
+    if checked_out is None:
+        replicas.count('fallbacks')
+        g.read_pool, g.read_db = None, get_db()
+    else:
+        replicas.count('reads')
+        g.read_pool, g.read_db = checked_out
+    return g.read_db
+
+def _reads_primary() -> bool:
+    """Whether `get_read_db` currently hands out the primary rather than a replica."""
+    return bool(g.get('transaction_depth')) or g.get('read_pool') is None
+
+def _release_read_db():
+    read_pool = g.pop('read_pool', None)
+    read_db = g.pop('read_db', None)
+    if read_pool is not None:
+        read_pool.checkin(read_db)
+
+def _remember_write(position: int):
+    """Keeps the session off replicas that don't have this write yet, including for the rest of the request."""
+    if not has_request_context():
+        return
+    if position > session.get(REPLICATION_SESSION_KEY, 0):
+        session[REPLICATION_SESSION_KEY] = position
+    _release_read_db()
+
+def expect_write():
+    """Keeps the session's reads off the replicas for a write made while the response streams.
+
+    That write commits after the session cookie went out, so `transaction` can't record
+    its position; call this in the view before returning the streamed response.
+    """
+    if current_app.config['DATABASE_REPLICAS']:
+        session[REPLICATION_PENDING_KEY] = True
+
 def close_db(e=None):
+    _release_read_db()
     db = g.pop('db', None)
     if db is not None:
-        db.close()
-
-def init_db():
-    db = get_db()
+        get_pool().checkin(db)
 
-    cursor = db.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON;")
-    cursor.close()
-    db.commit()
+def _is_busy(e: sqlite3.OperationalError) -> bool:
+    code = getattr(e, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    return 'locked' in str(e) or 'busy' in str(e)
 
-    with current_app.open_resource('schema.sql') as f:
-        script = f.read().decode('utf8')
+def _retry_busy(statement: Callable[[], object]):
+    retries = current_app.config['DATABASE_BUSY_RETRIES']
+    for attempt in range(retries + 1):
         try:
-            db.executescript(script)
-        except sqlite3.IntegrityError as e:
-            click.echo(e)
-    
-    cursor = db.cursor()
-    cursor.execute("INSERT INTO user(email, password, name, phone_number, about, type) VALUES ('photo@email.com', 'password', 'Anna', '123', 'I love taking pictures! My cat is my everything <3', 'photographer');")
-    cursor.execute("INSERT INTO user(email, password, name, phone_number, about, type) VALUES ('photo2@email.com', 'password', 'Kyle', '234', '', 'photographer');")
-    cursor.execute("INSERT INTO user(email, password, name, phone_number, about, type) VALUES ('photo3@email.com', 'password', 'Jane', '234', '', 'photographer');")
-    cursor.execute("INSERT INTO album(name, release_type, photographer_email) VALUES ('Nature', 'public', 'photo@email.com');")
-    cursor.execute("INSERT INTO photo(pathname, album_name) VALUES ('garden1.jpg', 'Nature');")
-    cursor.execute("INSERT INTO photo(pathname, album_name) VALUES ('garden2.jpg', 'Nature');")
-    cursor.execute("INSERT INTO photo(pathname, album_name) VALUES ('garden3.jpg', 'Nature');")
-    cursor.execute("INSERT INTO package(pricing, items, photographer_email) VALUES (120, '1,2,3', 'photo@email.com'), (50, '4', 'photo2@email.com');")
-    cursor.execute("INSERT INTO user(email, password, name, phone_number, type) VALUES ('client@email.com', 'password', 'client', '123', 'client');")
-    cursor.execute("INSERT INTO user(email, password, name, phone_number, type) VALUES ('c@email.com', 'password', 'client', '123', 'client');")
-    cursor.close()
-    db.commit()
+            return statement()
+        except sqlite3.OperationalError as e:
+            if attempt == retries or not _is_busy(e):
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Unit of work: everything inside commits together, or not at all.
+
+    The outermost block runs `BEGIN IMMEDIATE` so the write lock is taken up front, retrying
+    while SQLite reports busy. Nested blocks (a model called from an `atomic` view, or
+    `FeedbackForm.create` calling `ContactForm.create`) become savepoints and only the
+    outermost block commits.
+
+    With DATABASE_REPLICAS, a block that changed anything also advances the replication
+    position and records it in the session, see `get_read_db` (and `expect_write` for
+    blocks run by a streamed response).
+    """
+    db = get_db()
+    depth = g.get('transaction_depth', 0)
+    if depth:
+        savepoint = f"sp_{depth}"
+        db.execute(f"SAVEPOINT {savepoint}")
+        g.transaction_depth = depth + 1
+        try:
+            yield db
+        except BaseException:
+            db.execute(f"ROLLBACK TO {savepoint}")
+            db.execute(f"RELEASE {savepoint}")
+            raise
+        else:
+            db.execute(f"RELEASE {savepoint}")
+        finally:
+            g.transaction_depth = depth
+        return
+
+    if db.in_transaction:
+        db.commit()
+    _retry_busy(lambda: db.execute("BEGIN IMMEDIATE"))
+    g.transaction_depth = 1
+    changes = db.total_changes
+    position = None
+    try:
+        yield db
+        if current_app.config['DATABASE_REPLICAS'] and db.total_changes != changes:
+            position = db.execute(ReplicationPosition.ADVANCE).fetchone()[0]
+    except BaseException:
+        db.rollback()
+        raise
+    else:
+        _retry_busy(db.commit)
+        if position is not None:
+            _remember_write(position)
+    finally:
+        g.transaction_depth = 0
+
+def atomic(func: Callable[P, T]) -> Callable[P, T]:
+    """Decorator running `func` in a single `transaction`, stacks with `tries_to_commit`."""
+
+    @functools.wraps(func)
+    def wrapped(*args: P.args, **kwargs: P.kwargs) -> T:
+        with transaction():
+            return func(*args, **kwargs)
+    return wrapped
+
+SEED_USERS = [
+    ('photo@email.com', 'password', 'Anna', '123', 'I love taking pictures! My cat is my everything <3', 'photographer'),
+    ('photo2@email.com', 'password', 'Kyle', '234', '', 'photographer'),
+    ('photo3@email.com', 'password', 'Jane', '234', '', 'photographer'),
+    ('client@email.com', 'password', 'client', '123', None, 'client'),
+    ('c@email.com', 'password', 'client', '123', None, 'client'),
+]
+SEED_ALBUMS = [('Nature', 'public', 'photo@email.com')]
+SEED_PHOTOS = [('garden1.jpg', 'Nature'), ('garden2.jpg', 'Nature'), ('garden3.jpg', 'Nature')]
+SEED_PACKAGES = [(120, '1,2,3', 'photo@email.com'), (50, '4', 'photo2@email.com')]
+
+def init_db(seed: bool = True):
+    """Drops everything and rebuilds the schema from the migrations."""
+    db = get_db()
+    migrate.drop_all(db)
+    migrate.upgrade(db)
+    if seed:
+        seed_db()
+
+def seed_db():
+    db = get_db()
+    method = passwords.hash_method(current_app.config)
+    users = [(email, passwords.make_hash(password, method), *rest) for email, password, *rest in SEED_USERS]
+    with db:
+        db.executemany("INSERT INTO user(email, password, name, phone_number, about, type) VALUES (?, ?, ?, ?, ?, ?)", users)
+        db.executemany("INSERT INTO album(name, release_type, photographer_email) VALUES (?, ?, ?)", SEED_ALBUMS)
+        db.executemany("INSERT INTO photo(pathname, album_name) VALUES (?, ?)", SEED_PHOTOS)
+        db.executemany("INSERT INTO package(pricing, items, photographer_email) VALUES (?, ?, ?)", SEED_PACKAGES)
 
 @click.command('init-db')
-def init_db_command():
-    init_db()
+@click.option('--seed/--no-seed', default=True, help='Insert the sample users, albums and packages.')
+def init_db_command(seed: bool):
+    init_db(seed)
     click.echo('db init-ed 🤪')
 
+@click.group('db')
+def db_cli():
+    """Schema migrations, see server/migrations."""
+
+@db_cli.command('upgrade')
+@click.option('--to', 'target', type=int, default=None, help='Version to upgrade to, defaults to the latest.')
+def db_upgrade_command(target: Optional[int]):
+    applied = migrate.upgrade(get_db(), target)
+    for migration in applied:
+        click.echo(f"applied {migration.version:04d}_{migration.name}")
+    click.echo(f"schema at version {migrate.current_version(get_db())}")
+
+@db_cli.command('downgrade')
+@click.option('--to', 'target', type=int, default=None, help='Version to downgrade to, defaults to one step back.')
+def db_downgrade_command(target: Optional[int]):
+    try:
+        reverted = migrate.downgrade(get_db(), target)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    for migration in reverted:
+        click.echo(f"reverted {migration.version:04d}_{migration.name}")
+    click.echo(f"schema at version {migrate.current_version(get_db())}")
+
+@db_cli.command('current')
+def db_current_command():
+    version = migrate.current_version(get_db())
+    for migration in migrate.list_migrations():
+        state = 'applied' if migration.version <= version else 'pending'
+        click.echo(f"{migration.version:04d}_{migration.name}: {state}")
+
+@db_cli.command('rebuild-search')
+def db_rebuild_search_command():
+    User.rebuild_search_index()
+    click.echo('photographer search index rebuilt')
+
+@db_cli.command('hash-passwords')
+def db_hash_passwords_command():
+    """Hashes the passwords still stored as plain text, instead of waiting for each user to log in."""
+    method = passwords.hash_method(current_app.config)
+    rows = [row for row in get_db().execute("SELECT email, password FROM user") if not passwords.is_hash(row['password'])]
+    plain_texts = [row['password'] for row in rows]
+    executor = passwords.get_executor()
+    if executor is None:
+        hashes = [passwords.make_hash(password, method) for password in plain_texts]
+    else:
+        hashes = list(executor.map(passwords.make_hash, plain_texts, [method] * len(rows), chunksize=16))
+    with transaction() as db:
+        db.executemany(User.UPDATE_PASSWORD, [(hash, row['email']) for hash, row in zip(hashes, rows)])
+    get_user_cache().clear()
+    click.echo(f"{len(rows)} passwords hashed")
+
+@db_cli.command('reconcile-summaries')
+def db_reconcile_summaries_command():
+    """Rebuilds the dashboard totals from the appointments, invoices and forms."""
+    PhotographerSummary.reconcile()
+    click.echo('photographer summaries rebuilt')
+
+@db_cli.command('sync-replicas')
+@click.option('--interval', type=float, default=None, help='Keep syncing, INTERVAL seconds apart.')
+def sync_replicas_command(interval: Optional[float]):
+    """Copies the database into every DATABASE_REPLICAS file with the SQLite backup API."""
+    while True:
+        for replica in current_app.config['DATABASE_REPLICAS']:
+            start = time.perf_counter()
+            position = sync_replica(replica)
+            click.echo(f"{replica}: at position {position} in {time.perf_counter() - start:.2f}s")
+        if interval is None:
+            return
+        time.sleep(interval)
+
+def sync_replica(replica: str) -> int:
+    """Copies the database into `replica` in one step, returns the replication position it now has."""
+    # a one-step backup reads a single snapshot, writers carry on meanwhile (in WAL mode)
+    with closing(sqlite3.connect(replica, timeout=current_app.config['DATABASE_BUSY_TIMEOUT'] / 1000)) as target:
+        get_db().backup(target)
+        return target.execute(ReplicationPosition.READ).fetchone()[0]
+
+@db_cli.command('seed')
+def db_seed_command():
+    seed_db()
+    click.echo('db seeded')
+
+def explain_queries() -> dict[str, list[str]]:
+    """Runs `EXPLAIN QUERY PLAN` over every SQL constant on the models in this module.
+
+    Returns the plan lines that do a full table scan, keyed by `Model.CONSTANT`.
+    """
+    db = get_db()
+    scans: dict[str, list[str]] = {}
+    for model_name, model in sorted(globals().items()):
+        if not isinstance(model, type) or model.__module__ != __name__:
+            continue
+        for attr, sql in vars(model).items():
+            if not attr.isupper() or not isinstance(sql, str):
+                continue
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            params = (None,) * sql.count('?')
+            plan = db.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            full_scans = [row['detail'] for row in plan if _is_full_scan(row['detail'])]
+            if full_scans:
+                scans[f"{model_name}.{attr}"] = full_scans
+    return scans
+
+def _is_full_scan(detail: str) -> bool:
+    # "SCAN t" / "SCAN TABLE t" is a full scan, scans over an index, a virtual table
+    # (json_each) or a materialized subquery are not
+    return detail.startswith('SCAN') and not any(
+        marker in detail for marker in ('USING', 'VIRTUAL TABLE', 'SUBQUERY', 'CONSTANT ROW')
+    )
+
+@click.command('index-advisor')
+def index_advisor_command():
+    scans = explain_queries()
+    for query, details in scans.items():
+        for detail in details:
+            click.echo(f"{query}: {detail}")
+    if scans:
+        raise click.ClickException(f"{len(scans)} queries do a full table scan")
+    click.echo('no full table scans found')
+
 def init_app(app: Flask):
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(index_advisor_command)
+
+
+# largest SQLite integer, the open upper bound for range queries and keyset cursors
+MAX_INTEGER = 2**63 - 1
+
+# available times are naive local times, stored as if they were UTC
+
+def to_epoch(value: str | datetime.datetime) -> int:
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return int(value.timestamp())
+
+def from_epoch(epoch: int) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).replace(tzinfo=None)
+
+M = TypeVar('M')
+
+_row_getters: dict[tuple[type, tuple[str, ...]], Callable[[tuple], tuple]] = {}
+
+def _row_getter(model: type, description: tuple) -> Callable[[tuple], tuple]:
+    """Picks a model's init fields out of a plain row tuple, cached per model and column list."""
+    columns = tuple(column[0] for column in description)
+    getter = _row_getters.get((model, columns))
+    if getter is None:
+        index: dict[str, int] = {}
+        for i, column in enumerate(columns):
+            index.setdefault(column, i)
+        positions = [index[f.name] for f in fields(model) if f.init]
+        if len(positions) == 1:
+            position = positions[0]
+            getter = lambda row: (row[position],)
+        else:
+            getter = operator.itemgetter(*positions)
+        _row_getters[(model, columns)] = getter
+    return getter
+
+def map_rows(model: type[M], cursor: sqlite3.Cursor) -> list[M]:
+    """Builds `model` instances straight from row tuples, skipping the `sqlite3.Row` -> kwargs step."""
+    getter = _row_getter(model, cursor.description)
+    return [model(*getter(row)) for row in cursor.fetchall()]
+
+def fetch_all(model: type[M], sql: str, params: tuple = ()) -> list[M]:
+    cursor = get_read_db().cursor()
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+    return map_rows(model, cursor)
+
+def iter_rows(model: type[M], sql: str, params: tuple = (), batch_size: int = 500) -> Iterator[M]:
+    """Like `fetch_all`, but fetches `batch_size` rows at a time so large results are never all in memory."""
+    cursor = get_read_db().cursor()
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+    getter = _row_getter(model, cursor.description)
+    while rows := cursor.fetchmany(batch_size):
+        for row in rows:
+            yield model(*getter(row))
+
+def fetch_one(model: type[M], sql: str, params: tuple = ()) -> Optional[M]:
+    cursor = get_read_db().cursor()
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+    row = cursor.fetchone()
+    return None if row is None else model(*_row_getter(model, cursor.description)(row))
+
+@dataclass(slots=True)
+class Page(Generic[M]):
+    """One page of a listing.
+
+    `next_cursor` is what to pass back for the following page, None on the last one: the id
+    to pass as `before` for keyset-paginated listings (newest first), or the offset of the
+    next page for ranked search results.
+    """
+    items: list[M]
+    next_cursor: Optional[int]
+
+    @staticmethod
+    def from_rows(items: list[M], limit: int, cursor_of: Callable[[M], int]) -> Page[M]:
+        # the queries fetch one row past the limit to tell whether there is a next page
+        if len(items) > limit:
+            items = items[:limit]
+            return Page(items, cursor_of(items[-1]))
+        return Page(items, None)
+
+    @staticmethod
+    def from_offset(items: list[M], offset: int, limit: int) -> Page[M]:
+        if len(items) > limit:
+            return Page(items[:limit], offset + limit)
+        return Page(items, None)
 
 
 class UserType(Enum):
@@ -69,14 +523,17 @@ class UserType(Enum):
 
     @staticmethod
     def from_string(string: str):
-        for val in UserType:
-            if val.value == string:
-                return val
-        raise ValueError(f"{string} not included in {__class__}")
+        try:
+            return UserType(string)
+        except ValueError:
+            raise ValueError(f"{string} not included in {UserType}") from None
 
 USER_TYPE_VALUES = [val.value for val in UserType]
 
-@dataclass
+# words past this are ignored, a search is an AND of prefix queries per word
+SEARCH_MAX_WORDS = 8
+
+@dataclass(slots=True)
 class User:
     email: str
     password: str
@@ -89,7 +546,22 @@ class User:
     CREATE_C = "INSERT INTO user (email, password, name, phone_number, type) VALUES (?, ?, ?, ?, ?)"
     READ = "SELECT * FROM user WHERE email = ?"
     EDIT_ABOUT = "UPDATE user SET about = ? WHERE email = ?"
-    LIST_PHOTOGRAPHERS = "SELECT * FROM user WHERE type = 'photographer'"
+    UPDATE_PASSWORD = "UPDATE user SET password = ? WHERE email = ?"
+    LIST_PHOTOGRAPHERS = "SELECT * FROM user WHERE type = 'photographer' ORDER BY rowid LIMIT ? OFFSET ?"
+    # see migrations/0006_photographer_search.up.sql for the index and its ranking
+    SEARCH = (
+        "SELECT u.* FROM photographer_search s JOIN user u ON u.email = s.email "
+        "WHERE photographer_search MATCH ? ORDER BY s.rank LIMIT ? OFFSET ?"
+    )
+    CLEAR_SEARCH = "DELETE FROM photographer_search"
+    # photographer_search is keyed by these ids rather than user.rowid, which VACUUM renumbers
+    FILL_SEARCH_IDS = (
+        "INSERT OR IGNORE INTO photographer_search_id (email) SELECT email FROM user WHERE type = 'photographer'"
+    )
+    FILL_SEARCH = (
+        "INSERT INTO photographer_search (rowid, email, name, about, albums, packages) "
+        "SELECT rowid, email, name, about, albums, packages FROM photographer_search_source"
+    )
 
     def __post_init__(self):
         if not isinstance(self.type, UserType):
@@ -98,95 +570,147 @@ class User:
     @staticmethod
     @tries_to_commit
     def create_photographer(email: str, password: str, name: str, phone_number: str, about: str, type: UserType) -> User:
-        db = get_db()
-        db.execute(User.CREATE_P, (email, password, name, phone_number, about, type.value))
-        db.commit()
+        with transaction() as db:
+            db.execute(User.CREATE_P, (email, password, name, phone_number, about, type.value))
+        User.invalidate(email)
         return User(email, password, name, phone_number, about, type)
 
     def create_client(email: str, password: str, name: str, phone_number: str) -> User:
-        db = get_db()
         type = UserType.CLIENT.value
-        db.execute(User.CREATE_C, (email, password, name, phone_number, type))
-        db.commit()
+        with transaction() as db:
+            db.execute(User.CREATE_C, (email, password, name, phone_number, type))
+        User.invalidate(email)
         return User(email, password, name, phone_number, "", type)
 
     @staticmethod 
     def read(email: str) -> User:
-        db = get_db()
-        data = db.execute(User.READ, (email,)).fetchone()
-        if not data:
-            raise ValueError(f"no user exists with email: {email}")
-        user = User(**data)
+        # identity map for the current request, then the cache shared across requests
+        users: dict[str, User] = g.setdefault('users', {})
+        if email in users:
+            return users[email]
+
+        cache = get_user_cache()
+        user = cache.get(email)
+        if user is None:
+            user = fetch_one(User, User.READ, (email,))
+            if not user:
+                raise ValueError(f"no user exists with email: {email}")
+            # a replica may not have the latest edit yet, every other request would then read
+            # the stale copy, so only what the primary returned is shared
+            if _reads_primary():
+                cache.set(email, user)
+        # cached users are shared between threads, hand each request its own copy
+        users[email] = user = replace(user)
         return user
 
+    @staticmethod
+    def invalidate(email: str):
+        g.get('users', {}).pop(email, None)
+        get_user_cache().delete(email)
+
     @staticmethod
     def edit_about(text: str, email: str) -> Appointment:
-        db = get_db()
-        db.execute(User.EDIT_ABOUT, (text, email))
-        db.commit()
+        with transaction() as db:
+            db.execute(User.EDIT_ABOUT, (text, email))
+        User.invalidate(email)
 
     @staticmethod
-    def list_photographers() -> list[User]:
-        db = get_db()
-        data = db.execute(User.LIST_PHOTOGRAPHERS).fetchall()
-        print("data: " + str(data))
-        photographers = [User(**row) for row in data]
-        return photographers
+    def update_password(email: str, password_hash: str):
+        with transaction() as db:
+            db.execute(User.UPDATE_PASSWORD, (password_hash, email))
+        User.invalidate(email)
 
-@dataclass
+    @staticmethod
+    def list_photographers(offset: int = 0, limit: int = 50) -> Page[User]:
+        photographers = fetch_all(User, User.LIST_PHOTOGRAPHERS, (limit + 1, offset))
+        return Page.from_offset(photographers, offset, limit)
+
+    @staticmethod
+    def search_photographers(text: str, offset: int = 0, limit: int = 50) -> Page[User]:
+        """Photographers matching every word of `text` as a prefix, best match first.
+
+        Names count the most, then album names, the about text and package items.
+        An empty search lists every photographer.
+        """
+        words = re.findall(r'\w+', text)[:SEARCH_MAX_WORDS]
+        if not words:
+            return User.list_photographers(offset, limit)
+        match = ' '.join(f'"{word}"*' for word in words)
+        photographers = fetch_all(User, User.SEARCH, (match, limit + 1, offset))
+        return Page.from_offset(photographers, offset, limit)
+
+    @staticmethod
+    def rebuild_search_index():
+        with transaction() as db:
+            db.execute(User.CLEAR_SEARCH)
+            db.execute(User.FILL_SEARCH_IDS)
+            db.execute(User.FILL_SEARCH)
+
+@dataclass(slots=True)
 class PhotographerAvailableTime:
     id: int
-    # these are stored as text in SQLite, parsed to datetime in __post_init__
+    # as entered (datetime-local), start_epoch and end_epoch are what gets queried
     start_time: str
     end_time: str
     photographer_email: str
+    start_epoch: int
+    end_epoch: int
+    booked: bool
 
-    start_parsed: datetime.datetime = field(init=False)
-    end_parsed: datetime.datetime = field(init=False)
-
-    CREATE = "INSERT INTO photographer_available_time (start_time, end_time, photographer_email) VALUES (?, ?, ?)"
+    CREATE = "INSERT INTO photographer_available_time (start_time, end_time, start_epoch, end_epoch, photographer_email) VALUES (?, ?, ?, ?, ?)"
     READ = "SELECT * FROM photographer_available_time where id = ?"
-    READ_ALL = "SELECT * FROM photographer_available_time WHERE photographer_email = ?"
-    READ_AVAILABLE = "SELECT * FROM photographer_available_time WHERE id NOT IN (SELECT time_id FROM appointment) AND photographer_email = ?"
+    READ_ALL = "SELECT * FROM photographer_available_time WHERE photographer_email = ? ORDER BY start_epoch"
+    READ_AVAILABLE = "SELECT * FROM photographer_available_time WHERE photographer_email = ? AND booked = 0 ORDER BY start_epoch"
+    READ_FREE = "SELECT * FROM photographer_available_time WHERE photographer_email = ? AND booked = 0 AND start_epoch >= ? AND start_epoch < ? ORDER BY start_epoch"
     DELETE = "DELETE FROM photographer_available_time WHERE id = ?"
 
-    def __post_init__(self):
-        self.start_parsed = datetime.datetime.fromisoformat(self.start_time)
-        self.end_parsed = datetime.datetime.fromisoformat(self.end_time)
-    
+    @property
+    def start_parsed(self) -> datetime.datetime:
+        return from_epoch(self.start_epoch)
+
+    @property
+    def end_parsed(self) -> datetime.datetime:
+        return from_epoch(self.end_epoch)
+
     @staticmethod
     @tries_to_commit
     def create(start_time: str, end_time: str, photographer_email: str) -> PhotographerAvailableTime:
-        db = get_db()
-        c = db.execute(PhotographerAvailableTime.CREATE, (start_time, end_time, photographer_email))
-        db.commit()
+        """Adds an available time, None if it overlaps one of the photographer's other times."""
+        start_epoch, end_epoch = to_epoch(start_time), to_epoch(end_time)
+        with transaction() as db:
+            c = db.execute(
+                PhotographerAvailableTime.CREATE, (start_time, end_time, start_epoch, end_epoch, photographer_email)
+            )
         assert c.lastrowid is not None # TODO: this is unstable, fix if app is deployed
-        return PhotographerAvailableTime(c.lastrowid, start_time, end_time, photographer_email)
+        return PhotographerAvailableTime(c.lastrowid, start_time, end_time, photographer_email, start_epoch, end_epoch, False)
     
     @staticmethod
     def read_all(photographer_email: str, include_booked = True) -> list[PhotographerAvailableTime]:
-        db = get_db()
-        data = db.execute(
+        return fetch_all(
+            PhotographerAvailableTime,
             PhotographerAvailableTime.READ_ALL if include_booked else PhotographerAvailableTime.READ_AVAILABLE,
             (photographer_email,)
         )
-        available_times = [PhotographerAvailableTime(**row) for row in data]
-        return available_times
+
+    @staticmethod
+    def read_free(photographer_email: str, start: datetime.datetime, end: Optional[datetime.datetime] = None) -> list[PhotographerAvailableTime]:
+        """Unbooked times starting in [start, end)."""
+        end_epoch = to_epoch(end) if end else MAX_INTEGER
+        return fetch_all(
+            PhotographerAvailableTime, PhotographerAvailableTime.READ_FREE, (photographer_email, to_epoch(start), end_epoch)
+        )
     
     @staticmethod
     def read(id: int) -> PhotographerAvailableTime:
-        db = get_db()
-        data = db.execute(PhotographerAvailableTime.READ, (id,)).fetchone()
-        return PhotographerAvailableTime(**data)
+        return fetch_one(PhotographerAvailableTime, PhotographerAvailableTime.READ, (id,))
     
     @staticmethod
     @tries_to_commit
     def delete(id: int) -> None:
-        db = get_db()
-        db.execute(PhotographerAvailableTime.DELETE, (id,))
-        db.commit()
+        with transaction() as db:
+            db.execute(PhotographerAvailableTime.DELETE, (id,))
 
-@dataclass
+@dataclass(slots=True)
 class Package:
     id: int
     pricing: int
@@ -198,18 +722,13 @@ class Package:
 
     @staticmethod
     def read_all(photographer_email: str) -> list[Package]:
-        db = get_db()
-        data = db.execute(Package.READ_ALL, (photographer_email,))
-        packages = [Package(**row) for row in data]
-        return packages
+        return fetch_all(Package, Package.READ_ALL, (photographer_email,))
 
     @staticmethod
     def read(id: int) -> Package:
-        db = get_db()
-        data = db.execute(Package.READ, (id,)).fetchone()
-        return Package(**data)
+        return fetch_one(Package, Package.READ, (id,))
 
-@dataclass
+@dataclass(slots=True)
 class Appointment:
     id: int
     confirmed: bool
@@ -226,49 +745,75 @@ class Appointment:
     COMPLETE = "UPDATE appointment SET completed = True WHERE id = ?"
     READ = "SELECT * FROM appointment WHERE id = ?"
     DELETE = "DELETE FROM appointment WHERE id = ?"
+    # appointments with their time and package for /appt, keyset-paginated on id
+    READ_PAGE_CLIENT = (
+        "SELECT a.*, t.start_epoch, t.end_epoch, p.pricing, p.items FROM appointment a "
+        "LEFT JOIN photographer_available_time t ON a.time_id = t.id LEFT JOIN package p ON a.package_id = p.id "
+        "WHERE a.client_email = ? AND a.id < ? ORDER BY a.id DESC LIMIT ?"
+    )
+    READ_PAGE_PHOTOGRAPHER = (
+        "SELECT a.*, t.start_epoch, t.end_epoch, p.pricing, p.items FROM appointment a "
+        "LEFT JOIN photographer_available_time t ON a.time_id = t.id LEFT JOIN package p ON a.package_id = p.id "
+        "WHERE a.photographer_email = ? AND a.id < ? ORDER BY a.id DESC LIMIT ?"
+    )
 
     @staticmethod
     @tries_to_commit
     def create(time_id: int, confirmed: bool,  completed: bool, package_id: int, photographer_email: str, client_email: str) -> Appointment:
-        db = get_db()
-        c = db.execute(Appointment.CREATE, (time_id, confirmed, completed, package_id, photographer_email, client_email))
-        db.commit()
+        """Books the time, None if it was already booked or isn't one of the photographer's times."""
+        with transaction() as db:
+            c = db.execute(Appointment.CREATE, (time_id, confirmed, completed, package_id, photographer_email, client_email))
         assert c.lastrowid is not None # TODO unstable, fix if deployed
         return Appointment(c.lastrowid, time_id, confirmed, completed, package_id, photographer_email, client_email)
 
     @staticmethod
     def read_all(email: str, is_client = True) -> list[Appointment]:
-        db = get_db()
-        data = db.execute(Appointment.READ_CLIENT if is_client else Appointment.READ_PHOTOGRAPHER, (email,)).fetchall()
-        appointments = [Appointment(**row) for row in data]
-        return appointments
+        return fetch_all(Appointment, Appointment.READ_CLIENT if is_client else Appointment.READ_PHOTOGRAPHER, (email,))
     
     @staticmethod
     def read(appointment_id: int) -> Appointment:
-        db = get_db()
-        data = db.execute(Appointment.READ, (appointment_id,)).fetchone()
-        return Appointment(**data)
+        return fetch_one(Appointment, Appointment.READ, (appointment_id,))
+
+    @staticmethod
+    def read_page(email: str, is_client: bool, before: Optional[int], limit: int) -> Page[dict]:
+        """Appointments joined with their time and package, as dicts with parsed start and end times."""
+        sql = Appointment.READ_PAGE_CLIENT if is_client else Appointment.READ_PAGE_PHOTOGRAPHER
+        rows = get_read_db().execute(sql, (email, before or MAX_INTEGER, limit + 1)).fetchall()
+        appointments = []
+        for row in rows:
+            appointment = dict(row)
+            appointment['start_time'] = from_epoch(row['start_epoch'])
+            appointment['end_time'] = from_epoch(row['end_epoch'])
+            appointments.append(appointment)
+        return Page.from_rows(appointments, limit, operator.itemgetter('id'))
 
     @staticmethod
     def confirm(appointment_id: int) -> Appointment:
-        db = get_db()
-        db.execute(Appointment.CONFIRM, (appointment_id,))
-        db.commit()
+        with transaction() as db:
+            db.execute(Appointment.CONFIRM, (appointment_id,))
 
     @staticmethod
     def complete(appointment_id: int) -> Appointment:
-        db = get_db()
-        db.execute(Appointment.COMPLETE, (appointment_id,))
-        db.commit()
+        with transaction() as db:
+            db.execute(Appointment.COMPLETE, (appointment_id,))
 
 
     @staticmethod
     def delete(appointment_id: int) -> Appointment:
-        db = get_db()
-        db.execute(Appointment.DELETE, (appointment_id,))
-        db.commit()
-
-@dataclass
+        with transaction() as db:
+            db.execute(Appointment.DELETE, (appointment_id,))
+
+# an invoice with everything printed on it, in one query
+_INVOICE_DETAIL = (
+    "SELECT i.*, a.client_email, client.name AS client_name, a.photographer_email, "
+    "photographer.name AS photographer_name, t.start_epoch, t.end_epoch FROM invoice i "
+    "JOIN appointment a ON i.appointment_id = a.id "
+    "JOIN photographer_available_time t ON a.time_id = t.id "
+    "JOIN user client ON a.client_email = client.email "
+    "JOIN user photographer ON a.photographer_email = photographer.email "
+)
+
+@dataclass(slots=True)
 class Invoice:
     id: int
     date: str
@@ -278,32 +823,94 @@ class Invoice:
 
     parsed_date: datetime.datetime = field(init=False)
 
-    CREATE = "INSERT INTO invoice (date, total_cost, cost, appointment_id) VALUES (?, ?, ?, ?)"
     READ = "SELECT * FROM invoice WHERE appointment_id = ?"
+    # invoices are priced from the appointment's package, existing invoices are left as they are
+    GENERATE = (
+        "INSERT INTO invoice (date, total_cost, cost, appointment_id) "
+        "SELECT ?, p.pricing, p.items, a.id FROM appointment a JOIN package p ON a.package_id = p.id "
+        "WHERE a.id = ? ON CONFLICT (appointment_id) DO NOTHING"
+    )
+    GENERATE_RANGE = (
+        "INSERT INTO invoice (date, total_cost, cost, appointment_id) "
+        "SELECT ?, p.pricing, p.items, a.id FROM photographer_available_time t "
+        "JOIN appointment a ON a.time_id = t.id JOIN package p ON a.package_id = p.id "
+        "WHERE t.start_epoch >= ? AND t.start_epoch < ? ON CONFLICT (appointment_id) DO NOTHING"
+    )
+    GENERATE_RANGE_PHOTOGRAPHER = (
+        "INSERT INTO invoice (date, total_cost, cost, appointment_id) "
+        "SELECT ?, p.pricing, p.items, a.id FROM photographer_available_time t "
+        "JOIN appointment a ON a.time_id = t.id JOIN package p ON a.package_id = p.id "
+        "WHERE t.photographer_email = ? AND t.start_epoch >= ? AND t.start_epoch < ? ON CONFLICT (appointment_id) DO NOTHING"
+    )
 
     def __post_init__(self):
         self.parsed_date = datetime.datetime.fromisoformat(self.date)
 
     @staticmethod
-    @tries_to_commit
-    def create(date: datetime.datetime, total_cost: int, cost: str, appointment_id: int) -> Invoice:
-        invoice = Invoice.read(appointment_id)
-        if invoice:
-            return invoice
-        db = get_db()
-        date_str = date.isoformat()
-        c = db.execute(Invoice.CREATE, (date_str, total_cost, cost, appointment_id))
-        db.commit()
-        assert c.lastrowid is not None # TODO: unstable
-        return Invoice(c.lastrowid, date_str, total_cost, cost, appointment_id)
+    def issue(appointment_id: int) -> Optional[InvoiceDetail]:
+        """The appointment's invoice, generated on first view. None if there is no such appointment."""
+        invoice = fetch_one(InvoiceDetail, InvoiceDetail.READ, (appointment_id,))
+        if invoice is None:
+            with transaction() as db:
+                db.execute(Invoice.GENERATE, (datetime.datetime.now().isoformat(), appointment_id))
+            invoice = fetch_one(InvoiceDetail, InvoiceDetail.READ, (appointment_id,))
+        return invoice
+
+    @staticmethod
+    def export(start: datetime.datetime, end: datetime.datetime, photographer_email: Optional[str] = None) -> Iterator[InvoiceDetail]:
+        """Invoices for the appointments starting in [start, end), generating any that are missing.
+
+        Lazy: nothing runs until the first invoice is asked for, and rows are streamed from the cursor.
+        """
+        now = datetime.datetime.now().isoformat()
+        start_epoch, end_epoch = to_epoch(start), to_epoch(end)
+        with transaction() as db:
+            if photographer_email is None:
+                db.execute(Invoice.GENERATE_RANGE, (now, start_epoch, end_epoch))
+            else:
+                db.execute(Invoice.GENERATE_RANGE_PHOTOGRAPHER, (now, photographer_email, start_epoch, end_epoch))
+        if photographer_email is None:
+            yield from iter_rows(InvoiceDetail, InvoiceDetail.READ_RANGE, (start_epoch, end_epoch))
+        else:
+            yield from iter_rows(InvoiceDetail, InvoiceDetail.READ_RANGE_PHOTOGRAPHER, (photographer_email, start_epoch, end_epoch))
     
     @staticmethod
     def read(appointment_id: int) -> Optional[Invoice]:
-        db = get_db()
-        data = db.execute(Invoice.READ, (appointment_id,)).fetchone()
-        return None if not data else Invoice(**data)
+        return fetch_one(Invoice, Invoice.READ, (appointment_id,))
 
-@dataclass
+@dataclass(slots=True)
+class InvoiceDetail:
+    id: int
+    date: str
+    total_cost: int
+    cost: str
+    appointment_id: int
+    client_email: str
+    client_name: str
+    photographer_email: str
+    photographer_name: str
+    start_epoch: int
+    end_epoch: int
+
+    READ = _INVOICE_DETAIL + "WHERE i.appointment_id = ?"
+    READ_RANGE = _INVOICE_DETAIL + "WHERE t.start_epoch >= ? AND t.start_epoch < ? ORDER BY t.start_epoch"
+    READ_RANGE_PHOTOGRAPHER = (
+        _INVOICE_DETAIL + "WHERE t.photographer_email = ? AND t.start_epoch >= ? AND t.start_epoch < ? ORDER BY t.start_epoch"
+    )
+
+    @property
+    def parsed_date(self) -> datetime.datetime:
+        return datetime.datetime.fromisoformat(self.date)
+
+    @property
+    def start_time(self) -> datetime.datetime:
+        return from_epoch(self.start_epoch)
+
+    @property
+    def end_time(self) -> datetime.datetime:
+        return from_epoch(self.end_epoch)
+
+@dataclass(slots=True)
 class Album:
     name: str
     release_type: str
@@ -316,40 +923,43 @@ class Album:
     READALBUM = "SELECT a.* FROM album a LEFT JOIN user ON a.photographer_email = user.email WHERE a.photographer_email = ? AND a.name = ?"
     DELETE = "DELETE FROM album WHERE photographer_email = ? AND name = ?"
 
-    def __post_init__(self):
-        # TODO: inefficient, should probably condense into a join
-        self.photos = Photo.read(self.name)
-
     @staticmethod 
     def create(album_name: str, release_type: str, photographer_email: str) -> Album:
-        db = get_db()
-        db.execute(Album.CREATE, (album_name, release_type, photographer_email))
-        db.commit()
+        with transaction() as db:
+            db.execute(Album.CREATE, (album_name, release_type, photographer_email))
         return Album(album_name, release_type, photographer_email)
 
 
     @staticmethod
-    def read(photographer_email: str) -> list[Album]:
-        db = get_db()
-        data = db.execute(Album.READ, (photographer_email,)).fetchall()
-        albums = [Album(**row) for row in data]
-        return albums
+    def read(photographer_email: str, with_photos: bool = True) -> list[Album]:
+        albums = fetch_all(Album, Album.READ, (photographer_email,))
+        return Album.load_photos(albums) if with_photos else albums
 
     @staticmethod
-    def readalbum(photographer_email: str, album_name: str) -> list[Album]:
-        db = get_db()
-        data = db.execute(Album.READALBUM, (photographer_email, album_name)).fetchall()
-        albums = [Album(**row) for row in data]
+    def readalbum(photographer_email: str, album_name: str, with_photos: bool = True) -> list[Album]:
+        albums = fetch_all(Album, Album.READALBUM, (photographer_email, album_name))
+        return Album.load_photos(albums) if with_photos else albums
+
+    @staticmethod
+    def load_photos(albums: list[Album]) -> list[Album]:
+        """Fills in `photos` for all given albums using a single batched query.
+
+        Albums are read without photos, callers that skip `with_photos` can call this later.
+        """
+        if not albums:
+            return albums
+        photos = Photo.read_many([album.name for album in albums])
+        for album in albums:
+            album.photos = photos.get(album.name, [])
         return albums
 
     @staticmethod
     def delete(photographer_email: str, album_name: str) -> list[Album]:
-        db = get_db()
-        db.execute(Photo.DELETE, (album_name, ))
-        db.execute(Album.DELETE, (photographer_email , album_name))
-        db.commit()
+        with transaction() as db:
+            db.execute(Photo.DELETE, (album_name, ))
+            db.execute(Album.DELETE, (photographer_email , album_name))
 
-@dataclass
+@dataclass(slots=True)
 class ClientAlbum(Album):
     album_name: str
     appointment_id: int
@@ -364,30 +974,26 @@ class ClientAlbum(Album):
     @staticmethod                   
     @tries_to_commit
     def create(album_name: str, release_type: str, appointment_id: int, client_email: str, photographer_email: str) -> ClientAlbum:
-        db = get_db()
-        album = db.execute(Album.CREATE, (album_name, release_type, photographer_email))
-        if not album:
-            raise Exception("album could not be created")
-        db.execute(ClientAlbum.CREATE, (album_name, appointment_id, client_email))
-        db.commit()
+        with transaction() as db:
+            album = db.execute(Album.CREATE, (album_name, release_type, photographer_email))
+            if not album:
+                raise Exception("album could not be created")
+            db.execute(ClientAlbum.CREATE, (album_name, appointment_id, client_email))
         return ClientAlbum(album_name, release_type, photographer_email, album_name, appointment_id, client_email)
 
     @staticmethod
     def exists(appt_id: int) -> bool:
-        db = get_db()
+        db = get_read_db()
         clientalbum = db.execute(ClientAlbum.EXISTS, (appt_id,)).fetchone()
         return bool(clientalbum)
     
 
     @staticmethod
-    def read(appt_id: int) -> list[ClientAlbum]:
-        db = get_db()
-        print(appt_id)
-        data = db.execute(ClientAlbum.READ, (appt_id,))
-        album = [ClientAlbum(**row) for row in data]
-        return album
+    def read(appt_id: int, with_photos: bool = True) -> list[ClientAlbum]:
+        albums = fetch_all(ClientAlbum, ClientAlbum.READ, (appt_id,))
+        return Album.load_photos(albums) if with_photos else albums
 
-@dataclass
+@dataclass(slots=True)
 class Photo:
     id: int
     pathname: str
@@ -395,25 +1001,43 @@ class Photo:
     
     CREATE = "INSERT INTO photo(pathname, album_name) VALUES (?, ?)"
     READ = "SELECT * FROM photo WHERE album_name = ?"
+    # album names are passed as one JSON array so the statement text stays constant
+    READ_MANY = "SELECT * FROM photo WHERE album_name IN (SELECT value FROM json_each(?)) ORDER BY id"
     DELETE = "DELETE FROM photo WHERE album_name = ?"
+    LAST_ID = "SELECT COALESCE(MAX(id), 0) FROM photo"
+    READ_CREATED = "SELECT * FROM photo WHERE album_name = ? AND id > ? ORDER BY id"
 
     @staticmethod 
     def create(pathname: str, album_name: str) -> Album:
-        db = get_db()
-        c = db.execute(Photo.CREATE, (pathname, album_name))
-        db.commit()
+        with transaction() as db:
+            c = db.execute(Photo.CREATE, (pathname, album_name))
         assert c.lastrowid is not None # TODO unstable, fix if deployed
         return Photo(c.lastrowid, pathname, album_name)
 
+    @staticmethod
+    def create_many(pathnames: list[str], album_name: str) -> list[Photo]:
+        """Inserts all photos of an album in one transaction (a single commit for the batch)."""
+        if not pathnames:
+            return []
+        # transactions take the write lock up front, so the ids after LAST_ID are all ours
+        with transaction() as db:
+            last_id = db.execute(Photo.LAST_ID).fetchone()[0]
+            db.executemany(Photo.CREATE, [(pathname, album_name) for pathname in pathnames])
+            photos = fetch_all(Photo, Photo.READ_CREATED, (album_name, last_id))
+        return photos
 
     @staticmethod
     def read(album_name: str) -> list[Photo]:
-        db = get_db()
-        data = db.execute(Photo.READ, (album_name,)).fetchall()
-        photos = [Photo(**row) for row in data]
+        return fetch_all(Photo, Photo.READ, (album_name,))
+
+    @staticmethod
+    def read_many(album_names: list[str]) -> dict[str, list[Photo]]:
+        photos: dict[str, list[Photo]] = {}
+        for photo in fetch_all(Photo, Photo.READ_MANY, (json.dumps(album_names),)):
+            photos.setdefault(photo.album_name, []).append(photo)
         return photos
 
-@dataclass
+@dataclass(slots=True)
 class ContactForm:
     id: int
     client_name: str
@@ -423,24 +1047,30 @@ class ContactForm:
 
     CREATE = "INSERT INTO form (message, client_email, client_name, photographer_email) VALUES (?, ?, ?, ?)"
     READ = "SELECT * FROM form WHERE photographer_email = ?"
+    # inquiries that aren't the message of a feedback form
+    READ_INQUIRIES = (
+        "SELECT * FROM form c WHERE c.photographer_email = ? AND c.id < ? "
+        "AND NOT EXISTS (SELECT 1 FROM feedback_form f WHERE f.form_id = c.id) ORDER BY c.id DESC LIMIT ?"
+    )
 
     @staticmethod
     @tries_to_commit
     def create(message: str, client_email: str, client_name:str, photographer_email: str) -> ContactForm:
-        db = get_db()
-        c = db.execute(ContactForm.CREATE, (message, client_email, client_name, photographer_email))
-        db.commit()
+        with transaction() as db:
+            c = db.execute(ContactForm.CREATE, (message, client_email, client_name, photographer_email))
         assert c.lastrowid is not None # TODO unstable
         return ContactForm(c.lastrowid, message, client_email, client_name, photographer_email)
 
     @staticmethod
     def read(photographer_email: str) -> list[ContactForm]:
-        db = get_db()
-        data = db.execute(ContactForm.READ, (photographer_email,))
-        forms = [ContactForm(**row) for row in data]
-        return forms
+        return fetch_all(ContactForm, ContactForm.READ, (photographer_email,))
 
-@dataclass
+    @staticmethod
+    def read_inquiries(photographer_email: str, before: Optional[int], limit: int) -> Page[ContactForm]:
+        forms = fetch_all(ContactForm, ContactForm.READ_INQUIRIES, (photographer_email, before or MAX_INTEGER, limit + 1))
+        return Page.from_rows(forms, limit, operator.attrgetter('id'))
+
+@dataclass(slots=True)
 class FeedbackForm(ContactForm):
     id: int
     form_id: int
@@ -450,28 +1080,159 @@ class FeedbackForm(ContactForm):
     CREATE = "INSERT INTO feedback_form (form_id, appointment_id) VALUES (?, ?)"
     EXISTS = "SELECT * FROM feedback_form WHERE appointment_id = ?"
     READ_ALL = "SELECT f.*, c.message, c.client_email, c.client_name, c.photographer_email FROM feedback_form f LEFT JOIN form c ON f.form_id = c.id WHERE c.photographer_email = ?"
+    READ_PAGE = (
+        "SELECT f.*, c.message, c.client_email, c.client_name, c.photographer_email FROM form c "
+        "JOIN feedback_form f ON f.form_id = c.id WHERE c.photographer_email = ? AND c.id < ? ORDER BY c.id DESC LIMIT ?"
+    )
 
 
     @staticmethod
     @tries_to_commit
     def create(message: str, client_email: str, client_name: str, photographer_email: str, appt_id: int) -> FeedbackForm:
-        db = get_db()
-        contact_form = ContactForm.create(message, client_email, client_name, photographer_email)
-        if not contact_form:
-            raise Exception("contact form could not be created")
-        c = db.execute(FeedbackForm.CREATE, (contact_form.id, appt_id))
-        db.commit()
+        with transaction() as db:
+            contact_form = ContactForm.create(message, client_email, client_name, photographer_email)
+            if not contact_form:
+                raise Exception("contact form could not be created")
+            c = db.execute(FeedbackForm.CREATE, (contact_form.id, appt_id))
         assert c.lastrowid is not None # TODO
         return FeedbackForm(c.lastrowid, client_name, message, client_email, photographer_email, contact_form.id, appt_id)
     
     @staticmethod
     def exists(appt_id: int) -> bool:
-        db = get_db()
+        db = get_read_db()
         feedback_form = db.execute(FeedbackForm.EXISTS, (appt_id,)).fetchone()
         return bool(feedback_form)
     
     @staticmethod
     def read_all(photographer_email: str) -> list[FeedbackForm]:
-        db = get_db()
-        res = db.execute(FeedbackForm.READ_ALL, (photographer_email,)).fetchall()
-        return [FeedbackForm(**row) for row in res]
+        return fetch_all(FeedbackForm, FeedbackForm.READ_ALL, (photographer_email,))
+
+    @staticmethod
+    def read_page(photographer_email: str, before: Optional[int], limit: int) -> Page[FeedbackForm]:
+        # the cursor is the id of the feedback's form, which is what the listing is ordered by
+        feedbacks = fetch_all(FeedbackForm, FeedbackForm.READ_PAGE, (photographer_email, before or MAX_INTEGER, limit + 1))
+        return Page.from_rows(feedbacks, limit, operator.attrgetter('form_id'))
+
+@dataclass(slots=True)
+class CacheVersion:
+    scope: str
+    version: int
+
+    # bumped by the triggers in migrations/0003_cache_versions.up.sql
+    READ = "SELECT * FROM cache_version WHERE scope = ?"
+
+    @staticmethod
+    def read(scope: str) -> int:
+        cache_version = fetch_one(CacheVersion, CacheVersion.READ, (scope,))
+        return cache_version.version if cache_version else 0
+
+@dataclass(slots=True)
+class PhotographerSummary:
+    photographer_email: str
+    pending: int = 0
+    confirmed: int = 0
+    completed: int = 0
+    invoices: int = 0
+    revenue: int = 0
+    inquiries: int = 0
+    unread_inquiries: int = 0
+    inquiries_read_id: int = 0
+    feedback: int = 0
+
+    # maintained by the triggers in migrations/0008_photographer_summary.up.sql
+    READ = "SELECT * FROM photographer_summary WHERE photographer_email = ?"
+    # inquiries that arrived after the page was read stay unread
+    MARK_READ = (
+        "UPDATE photographer_summary SET inquiries_read_id = MAX(inquiries_read_id, ?), "
+        "unread_inquiries = (SELECT COUNT(*) FROM form c WHERE c.photographer_email = ? "
+        "AND c.id > MAX(photographer_summary.inquiries_read_id, ?) "
+        "AND NOT EXISTS (SELECT 1 FROM feedback_form f WHERE f.form_id = c.id)) "
+        "WHERE photographer_email = ?"
+    )
+    # recounts every photographer from the source tables, a full scan of each by design
+    RECONCILE = (
+        "DELETE FROM photographer_summary WHERE photographer_email NOT IN (SELECT email FROM user WHERE type = 'photographer')",
+        "INSERT INTO photographer_summary ("
+        "photographer_email, pending, confirmed, completed, invoices, revenue, inquiries, unread_inquiries, inquiries_read_id, feedback) "
+        "SELECT u.email, "
+        "(SELECT COUNT(*) FROM appointment a WHERE a.photographer_email = u.email AND NOT a.confirmed AND NOT a.completed), "
+        "(SELECT COUNT(*) FROM appointment a WHERE a.photographer_email = u.email AND a.confirmed AND NOT a.completed), "
+        "(SELECT COUNT(*) FROM appointment a WHERE a.photographer_email = u.email AND a.completed), "
+        "(SELECT COUNT(*) FROM invoice i JOIN appointment a ON a.id = i.appointment_id WHERE a.photographer_email = u.email), "
+        "(SELECT COALESCE(SUM(i.total_cost), 0) FROM invoice i JOIN appointment a ON a.id = i.appointment_id WHERE a.photographer_email = u.email), "
+        "(SELECT COUNT(*) FROM form c WHERE c.photographer_email = u.email AND NOT EXISTS (SELECT 1 FROM feedback_form f WHERE f.form_id = c.id)), "
+        "(SELECT COUNT(*) FROM form c WHERE c.photographer_email = u.email AND NOT EXISTS (SELECT 1 FROM feedback_form f WHERE f.form_id = c.id) "
+        "AND c.id > COALESCE((SELECT s.inquiries_read_id FROM photographer_summary s WHERE s.photographer_email = u.email), 0)), "
+        "COALESCE((SELECT s.inquiries_read_id FROM photographer_summary s WHERE s.photographer_email = u.email), 0), "
+        "(SELECT COUNT(*) FROM form c JOIN feedback_form f ON f.form_id = c.id WHERE c.photographer_email = u.email) "
+        "FROM user u WHERE u.type = 'photographer' "
+        "ON CONFLICT (photographer_email) DO UPDATE SET "
+        "pending = excluded.pending, confirmed = excluded.confirmed, completed = excluded.completed, "
+        "invoices = excluded.invoices, revenue = excluded.revenue, inquiries = excluded.inquiries, "
+        "unread_inquiries = excluded.unread_inquiries, feedback = excluded.feedback",
+    )
+
+    @staticmethod
+    def read(photographer_email: str) -> PhotographerSummary:
+        """The photographer's dashboard totals, all zero before their first appointment or inquiry."""
+        summary = fetch_one(PhotographerSummary, PhotographerSummary.READ, (photographer_email,))
+        return summary or PhotographerSummary(photographer_email)
+
+    @staticmethod
+    def mark_inquiries_read(photographer_email: str, newest_id: int):
+        """Marks the inquiries up to `newest_id`, the newest one shown, as read."""
+        with transaction() as db:
+            db.execute(
+                PhotographerSummary.MARK_READ, (newest_id, photographer_email, newest_id, photographer_email)
+            )
+
+    @staticmethod
+    def reconcile():
+        with transaction() as db:
+            for sql in PhotographerSummary.RECONCILE:
+                db.execute(sql)
+
+@dataclass(slots=True)
+class Blob:
+    """An object in server.storage, photos refer to it by having its key as their pathname."""
+    key: str
+    size: int
+    used_at: int  # epoch seconds of the latest upload of it
+
+    # touching a blob keeps `flask storage gc` away from it for STORAGE_GC_GRACE
+    TOUCH = (
+        "INSERT INTO blob (key, size, used_at) VALUES (?, ?, ?) "
+        "ON CONFLICT (key) DO UPDATE SET used_at = excluded.used_at"
+    )
+    READ_UNUSED = (
+        "SELECT * FROM blob b WHERE b.used_at < ? "
+        "AND NOT EXISTS (SELECT 1 FROM photo p WHERE p.pathname = b.key) ORDER BY b.used_at LIMIT ?"
+    )
+    DELETE_MANY = "DELETE FROM blob WHERE key IN (SELECT value FROM json_each(?))"
+    READ = "SELECT * FROM blob WHERE key = ?"
+
+    @staticmethod
+    def touch(key: str, size: int):
+        with transaction() as db:
+            db.execute(Blob.TOUCH, (key, size, int(time.time())))
+
+    @staticmethod
+    def read(key: str) -> Optional[Blob]:
+        return fetch_one(Blob, Blob.READ, (key,))
+
+    @staticmethod
+    def read_unused(used_before: int, limit: int) -> list[Blob]:
+        return fetch_all(Blob, Blob.READ_UNUSED, (used_before, limit))
+
+    @staticmethod
+    def delete_many(keys: list[str]):
+        with transaction() as db:
+            db.execute(Blob.DELETE_MANY, (json.dumps(keys),))
+
+@dataclass(slots=True)
+class ReplicationPosition:
+    """Counter of write transactions, replicas have the value of the latest write they contain."""
+    position: int
+
+    READ = "SELECT position FROM replication_position WHERE id = 1"
+    ADVANCE = "UPDATE replication_position SET position = position + 1 WHERE id = 1 RETURNING position"
@@ -20,13 +20,19 @@ T = TypeVar('T')
 P = ParamSpec('P')
 
 def tries_to_commit(committing_func: Callable[P, T]) -> Callable[P, Optional[T]]:
-    """Decorator to attempt to commit a SQLite command and handle potential error."""
+    """Decorator to attempt to commit a SQLite command and handle potential error.
+
+    Inside a `db.transaction` the error is raised instead, so the whole unit of work rolls
+    back rather than committing without this part.
+    """
 
     @functools.wraps(committing_func)
     def wrapped_commit(*args: P.args, **kwargs: P.kwargs):
         try:
             return committing_func(*args, **kwargs)
         except sqlite3.Error as e:
+            if g.get('transaction_depth'):
+                raise
             current_app.logger.error(e)
             return None
     return wrapped_commit
@@ -0,0 +1,206 @@
+"""Cache for rendered public page fragments (gallery albums, photographer listing).
+
+Keys include a version number per scope (`photographer:<email>`, `photographers`) read
+from the `cache_version` table. Triggers bump the version whenever albums, photos or
+users change, so stale fragments are never read again and simply expire (the filesystem
+backend sweeps out expired files as it writes, see `FileSystemBackend`).
+
+Backends are picked with FRAGMENT_CACHE_BACKEND: "memory" (per-process LRU),
+"filesystem" (shared by every worker on the host), "redis" (any Redis-compatible server,
+needs the optional `redis` package) or None to disable caching.
+"""
+from __future__ import annotations
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Optional
+
+from flask import Flask, current_app
+from markupsafe import Markup
+
+from server.cache import TTLCache
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class CacheBackend:
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: float):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    def __init__(self, max_size: int, ttl: float):
+        self._cache: TTLCache[str, str] = TTLCache(max_size, ttl)
+
+    def get(self, key: str) -> Optional[str]:
+        return self._cache.get(key)
+
+    def set(self, key: str, value: str, ttl: float):
+        self._cache.set(key, value)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class FileSystemBackend(CacheBackend):
+    """One file per fragment, expiring at the file's mtime.
+
+    Fragments of old versions are never read again, so every `sweep_every` writes the
+    expired files are deleted, then the ones expiring soonest while there are more than
+    `max_size`.
+    """
+
+    def __init__(self, directory: str, max_size: int, sweep_every: int = 100):
+        self.directory = directory
+        self.max_size = max_size
+        self.sweep_every = sweep_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest())
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            # the expiry time is stored as the file's mtime
+            if os.path.getmtime(path) < time.time():
+                os.remove(path)
+                return None
+            with open(path, encoding='utf8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, key: str, value: str, ttl: float):
+        path = self._path(key)
+        fd, partial = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf8') as f:
+            f.write(value)
+        expires = time.time() + ttl
+        os.utime(partial, (expires, expires))
+        os.replace(partial, path)
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % self.sweep_every == 0
+        if sweep:
+            self.sweep()
+
+    def sweep(self):
+        """Deletes expired fragments, then the soonest to expire beyond `max_size`."""
+        now = time.time()
+        fragments = []
+        for entry in os.scandir(self.directory):
+            # partial files belong to writers in progress
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                expires = entry.stat().st_mtime
+            except OSError:
+                continue
+            fragments.append((expires, entry.path))
+        fragments.sort()
+        expired = sum(1 for expires, _ in fragments if expires < now)
+        for _, path in fragments[:max(expired, len(fragments) - self.max_size)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+
+class RedisBackend(CacheBackend):
+    def __init__(self, url: str, prefix: str = 'fragment:'):
+        if redis is None:
+            raise RuntimeError("FRAGMENT_CACHE_BACKEND='redis' needs the redis package")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        return None if value is None else value.decode('utf8')
+
+    def set(self, key: str, value: str, ttl: float):
+        self.client.set(self.prefix + key, value.encode('utf8'), px=int(ttl * 1000))
+
+    def clear(self):
+        for key in self.client.scan_iter(f"{self.prefix}*"):
+            self.client.delete(key)
+
+
+class FragmentCache:
+    def __init__(self, backend: CacheBackend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def fragment(self, key: str, render: Callable[[], str]) -> Markup:
+        """Returns the cached fragment for `key`, rendering and storing it on a miss."""
+        value = self.backend.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is None:
+            value = render()
+            self.backend.set(key, value, self.ttl)
+        return Markup(value)
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses, hit_rate=self.hits / lookups if lookups else 0.0)
+
+
+class _NoCache(CacheBackend):
+    def get(self, key: str) -> Optional[str]:
+        return None
+
+    def set(self, key: str, value: str, ttl: float):
+        pass
+
+    def clear(self):
+        pass
+
+
+def _make_backend(app: Flask) -> CacheBackend:
+    backend = app.config['FRAGMENT_CACHE_BACKEND']
+    if backend == 'memory':
+        return MemoryBackend(app.config['FRAGMENT_CACHE_SIZE'], app.config['FRAGMENT_CACHE_TTL'])
+    if backend == 'filesystem':
+        return FileSystemBackend(
+            app.config['FRAGMENT_CACHE_DIR'] or os.path.join(app.instance_path, 'fragments'),
+            app.config['FRAGMENT_CACHE_SIZE'],
+        )
+    if backend == 'redis':
+        return RedisBackend(app.config['FRAGMENT_CACHE_REDIS_URL'])
+    if backend is None:
+        return _NoCache()
+    raise ValueError(f"unknown FRAGMENT_CACHE_BACKEND: {backend}")
+
+
+def get_cache(app: Optional[Flask] = None) -> FragmentCache:
+    app = app or current_app._get_current_object()
+    return app.extensions['fragment_cache']
+
+
+def init_app(app: Flask):
+    app.extensions['fragment_cache'] = FragmentCache(_make_backend(app), app.config['FRAGMENT_CACHE_TTL'])
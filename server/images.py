@@ -0,0 +1,174 @@
+"""Resized renditions of gallery photos.
+
+Every photo gets a thumbnail, medium and full size rendition, each as a progressive JPEG
+and a WebP: in `static/renditions/` for files in `static/`, and next to the object for
+uploads in server.storage. They are generated by the `renditions` job (see server.jobs)
+so adding an album doesn't wait on image encoding; templates fall back to the original
+file until a rendition exists.
+"""
+from __future__ import annotations
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import click
+from flask import Flask, current_app, url_for
+from werkzeug.security import safe_join
+
+from server import storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # renditions are skipped without Pillow, templates use the originals
+    Image = None
+
+# rendition name -> max width in pixels
+RENDITIONS = {'thumb': 320, 'medium': 1024, 'full': 2048}
+FORMATS = {'jpeg': 'jpg', 'webp': 'webp'}
+RENDITIONS_DIR = 'renditions'
+
+
+def rendition_filename(pathname: str, rendition: str, fmt: str = 'jpeg') -> str:
+    """Path of a rendition relative to the static folder."""
+    stem, _ = os.path.splitext(pathname)
+    return f"{RENDITIONS_DIR}/{stem}-{rendition}.{FORMATS[fmt]}"
+
+
+def generate_renditions(static_folder: str, pathname: str, quality: int = 80) -> list[str]:
+    """Writes every missing or outdated rendition of `pathname`, returns the ones written."""
+    if Image is None:
+        return []
+    # pathnames are typed in by users, nothing outside the static folder is read or written
+    source = safe_join(static_folder, pathname)
+    if source is None or not os.path.isfile(source):
+        return []
+
+    targets = [
+        (rendition, fmt, safe_join(static_folder, rendition_filename(pathname, rendition, fmt)))
+        for rendition in RENDITIONS
+        for fmt in FORMATS
+    ]
+    source_mtime = os.path.getmtime(source)
+    targets = [t for t in targets if not os.path.exists(t[2]) or os.path.getmtime(t[2]) < source_mtime]
+    if not targets:
+        return []
+
+    written = []
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+        for rendition, fmt, target in targets:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # write next to the target and rename so readers never see a partial file
+            partial = f"{target}.{threading.get_ident()}.tmp"
+            _save(_resize(image, rendition), partial, fmt, quality)
+            os.replace(partial, target)
+            written.append(target)
+    return written
+
+
+def generate_stored_renditions(store: storage.Storage, key: str, quality: int = 80) -> list[str]:
+    """Stores every missing rendition of the stored photo at `key`, returns their keys."""
+    if Image is None:
+        return []
+    # stored objects never change, so a rendition that exists is up to date
+    targets = [
+        (rendition, fmt, storage.variant_key(key, rendition, FORMATS[fmt]))
+        for rendition in RENDITIONS
+        for fmt in FORMATS
+    ]
+    targets = [t for t in targets if not store.backend.exists(t[2])]
+    if not targets:
+        return []
+
+    written = []
+    with store.open(key) as source, Image.open(source) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+        for rendition, fmt, target in targets:
+            encoded = io.BytesIO()
+            _save(_resize(image, rendition), encoded, fmt, quality)
+            encoded.seek(0)
+            store.put(target, encoded)
+            written.append(target)
+    return written
+
+
+def _resize(image: Image.Image, rendition: str) -> Image.Image:
+    width = min(RENDITIONS[rendition], image.width)
+    if width == image.width:
+        return image
+    return image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+
+def _save(image: Image.Image, target, fmt: str, quality: int):
+    if fmt == 'jpeg':
+        image.save(target, 'JPEG', quality=quality, progressive=True, optimize=True)
+    else:
+        image.save(target, 'WEBP', quality=quality, method=4)
+
+
+def _stored_rendition_url(key: str, rendition: str, fmt: str) -> Optional[str]:
+    store = storage.get_storage()
+    target = storage.variant_key(key, rendition, FORMATS[fmt])
+    return store.url_for(target) if store.exists(target) else None
+
+
+def _static_exists(filename: str) -> bool:
+    path = safe_join(current_app.static_folder, filename)
+    return path is not None and os.path.exists(path)
+
+
+def photo_url(pathname: str, rendition: str = 'medium', fmt: str = 'jpeg') -> str:
+    """URL of a rendition, or of the original while the rendition doesn't exist yet."""
+    if storage.is_key(pathname):
+        return _stored_rendition_url(pathname, rendition, fmt) or storage.get_storage().url_for(pathname)
+    filename = rendition_filename(pathname, rendition, fmt)
+    if _static_exists(filename):
+        return url_for('static', filename=filename)
+    return url_for('static', filename=pathname)
+
+
+def photo_srcset(pathname: str, fmt: str = 'jpeg') -> str:
+    """`srcset` value listing the renditions that exist, empty if there are none yet."""
+    candidates = []
+    if storage.is_key(pathname):
+        for rendition, width in RENDITIONS.items():
+            url = _stored_rendition_url(pathname, rendition, fmt)
+            if url is not None:
+                candidates.append(f"{url} {width}w")
+        return ', '.join(candidates)
+    for rendition, width in RENDITIONS.items():
+        filename = rendition_filename(pathname, rendition, fmt)
+        if _static_exists(filename):
+            candidates.append(f"{url_for('static', filename=filename)} {width}w")
+    return ', '.join(candidates)
+
+
+def _static_images(static_folder: str) -> list[str]:
+    return sorted(
+        filename for filename in os.listdir(static_folder)
+        if os.path.splitext(filename)[1].lower() in ('.jpg', '.jpeg', '.png', '.webp')
+    )
+
+
+@click.command('build-renditions')
+def build_renditions_command():
+    """Generates the renditions of every image in the static folder."""
+    if Image is None:
+        raise click.ClickException('Pillow is not installed')
+    static_folder = current_app.static_folder
+    quality = current_app.config['IMAGE_QUALITY']
+    pathnames = _static_images(static_folder)
+    with ThreadPoolExecutor(max_workers=current_app.config['IMAGE_WORKERS']) as executor:
+        results = executor.map(
+            lambda pathname: generate_renditions(static_folder, pathname, quality), pathnames
+        )
+        for pathname, written in zip(pathnames, results):
+            click.echo(f"{pathname}: {len(written)} renditions written")
+
+
+def init_app(app: Flask):
+    app.add_template_global(photo_url)
+    app.add_template_global(photo_srcset)
+    app.cli.add_command(build_renditions_command)
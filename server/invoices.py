@@ -0,0 +1,161 @@
+"""Bulk invoice export as CSV, JSON lines or PDF.
+
+Every format is a generator over `db.Invoice.export`, so an export is written (or sent
+over HTTP) chunk by chunk and never holds more than a batch of invoices in memory.
+
+    flask export-invoices --start 2022-11-01 --end 2022-12-01 --format csv --output november.csv
+"""
+from __future__ import annotations
+import csv
+import datetime
+import io
+import json
+from typing import Callable, Iterable, Iterator
+
+import click
+from flask import Flask
+
+from server import db
+
+COLUMNS = (
+    'id', 'date', 'appointment_id', 'start_time', 'end_time', 'photographer_email', 'photographer_name',
+    'client_email', 'client_name', 'total_cost', 'cost',
+)
+# text formats are buffered up to this many characters before a chunk is yielded
+CHUNK_SIZE = 64 * 1024
+
+
+def _record(invoice: db.InvoiceDetail) -> dict:
+    return dict(
+        id=invoice.id,
+        date=invoice.date,
+        appointment_id=invoice.appointment_id,
+        start_time=invoice.start_time.isoformat(),
+        end_time=invoice.end_time.isoformat(),
+        photographer_email=invoice.photographer_email,
+        photographer_name=invoice.photographer_name,
+        client_email=invoice.client_email,
+        client_name=invoice.client_name,
+        total_cost=invoice.total_cost,
+        cost=invoice.cost,
+    )
+
+
+def to_csv(invoices: Iterable[db.InvoiceDetail]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, COLUMNS)
+    writer.writeheader()
+    for invoice in invoices:
+        writer.writerow(_record(invoice))
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf8')
+
+
+def to_jsonl(invoices: Iterable[db.InvoiceDetail]) -> Iterator[bytes]:
+    lines = []
+    size = 0
+    for invoice in invoices:
+        line = json.dumps(_record(invoice)) + '\n'
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(lines).encode('utf8')
+            lines, size = [], 0
+    yield ''.join(lines).encode('utf8')
+
+
+def _pdf_text(text: str) -> str:
+    text = text.encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _pdf_page_lines(invoice: db.InvoiceDetail) -> list[str]:
+    return [
+        f"Invoice #{invoice.id}",
+        '',
+        f"Photographer: {invoice.photographer_name} <{invoice.photographer_email}>",
+        f"Client: {invoice.client_name} <{invoice.client_email}>",
+        f"Appointment: {invoice.start_time:%c} - {invoice.end_time:%c}",
+        f"Date of Purchase: {invoice.parsed_date:%c}",
+        f"Items Purchased: {invoice.cost}",
+        f"Total Cost: ${invoice.total_cost}",
+    ]
+
+
+def to_pdf(invoices: Iterable[db.InvoiceDetail]) -> Iterator[bytes]:
+    """A minimal PDF with one page per invoice.
+
+    Objects are written as they are produced. The page tree (object 2) is written last,
+    once every page is known; only the byte offset of each object is kept for the xref table.
+    """
+    offsets: dict[int, int] = {}
+    position = 0
+
+    def emit(number: int, body: bytes) -> bytes:
+        nonlocal position
+        offsets[number] = position
+        chunk = f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+        position += len(chunk)
+        return chunk
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position += len(header)
+    yield header
+    yield emit(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+    yield emit(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    pages = []
+    number = 4
+    for invoice in invoices:
+        text = ' Tj T* '.join(f"({_pdf_text(line)})" for line in _pdf_page_lines(invoice))
+        content = f"BT /F1 12 Tf 16 TL 72 720 Td {text} Tj ET".encode('latin-1')
+        yield emit(number, f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+        yield emit(
+            number + 1,
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {number} 0 R "
+            f"/Resources << /Font << /F1 3 0 R >> >> >>".encode(),
+        )
+        pages.append(number + 1)
+        number += 2
+
+    kids = ' '.join(f"{page} 0 R" for page in pages)
+    yield emit(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode())
+
+    xref = [f"xref\n0 {number}\n", "0000000000 65535 f \n"]
+    xref += [f"{offsets[i]:010d} 00000 n \n" for i in range(1, number)]
+    xref.append(f"trailer\n<< /Size {number} /Root 1 0 R >>\nstartxref\n{position}\n%%EOF\n")
+    yield ''.join(xref).encode()
+
+
+# format -> (writer, mimetype)
+FORMATS: dict[str, tuple[Callable[[Iterable[db.InvoiceDetail]], Iterator[bytes]], str]] = {
+    'csv': (to_csv, 'text/csv'),
+    'jsonl': (to_jsonl, 'application/x-ndjson'),
+    'pdf': (to_pdf, 'application/pdf'),
+}
+
+
+def export(
+    format: str, start: datetime.datetime, end: datetime.datetime, photographer_email: str | None = None
+) -> Iterator[bytes]:
+    writer, _ = FORMATS[format]
+    return writer(db.Invoice.export(start, end, photographer_email))
+
+
+@click.command('export-invoices')
+@click.option('--start', type=click.DateTime(), required=True, help='First appointment time to include.')
+@click.option('--end', type=click.DateTime(), required=True, help='Appointment times from here on are left out.')
+@click.option('--format', 'format_', type=click.Choice(list(FORMATS)), default='csv')
+@click.option('--photographer', default=None, help='Only this photographer\'s invoices.')
+@click.option('--output', type=click.File('wb'), default='-')
+def export_invoices_command(start, end, format_, photographer, output):
+    """Generates and writes the invoices for every appointment starting in [start, end)."""
+    for chunk in export(format_, start, end, photographer):
+        output.write(chunk)
+
+
+def init_app(app: Flask):
+    app.cli.add_command(export_invoices_command)
@@ -0,0 +1,282 @@
+"""Background jobs, queued in the `job` table of the app's own database.
+
+Views call `enqueue` for work the response doesn't need to wait for: rendition encoding,
+issuing invoices and notifications. The job is inserted in the caller's transaction, so
+an `atomic` view that rolls back never leaves a job behind. With JOBS_IN_PROCESS the
+web process runs jobs on JOBS_WORKERS threads of its own. Otherwise they wait for
+
+    flask worker [--threads 4] [--burst]
+
+Any number of workers can share a database. A job is claimed in a `BEGIN IMMEDIATE`
+transaction, so two workers never take the same one. Failed jobs are retried with
+exponential backoff until they run out of attempts, then kept as 'failed'. A job running
+longer than JOBS_LEASE is assumed lost with its worker and queued again.
+"""
+from __future__ import annotations
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import click
+from flask import Flask, current_app
+
+from server import db, images, storage
+
+ENQUEUE = "INSERT INTO job (name, payload, max_attempts, run_at, created_at) VALUES (?, ?, ?, ?, ?)"
+# checked before taking the write lock, an idle worker only ever reads
+HAS_WORK = (
+    "SELECT EXISTS (SELECT 1 FROM job WHERE status = 'queued' AND run_at <= ?) "
+    "OR EXISTS (SELECT 1 FROM job WHERE status = 'running' AND locked_at < ?)"
+)
+REQUEUE_EXPIRED = (
+    "UPDATE job SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+    "last_error = 'lease expired', locked_by = NULL, locked_at = NULL "
+    "WHERE status = 'running' AND locked_at < ?"
+)
+COUNT_RUNNING = "SELECT name, COUNT(*) FROM job WHERE status = 'running' GROUP BY name"
+# task names are passed as one JSON array so the statement text stays constant
+CLAIM = (
+    "UPDATE job SET status = 'running', attempts = attempts + 1, locked_by = ?, locked_at = ? "
+    "WHERE id = (SELECT id FROM job WHERE status = 'queued' AND run_at <= ? "
+    "AND name IN (SELECT value FROM json_each(?)) ORDER BY run_at, id LIMIT 1) RETURNING *"
+)
+COMPLETE = "DELETE FROM job WHERE id = ?"
+RETRY = "UPDATE job SET status = 'queued', run_at = ?, last_error = ?, locked_by = NULL, locked_at = NULL WHERE id = ?"
+FAIL = "UPDATE job SET status = 'failed', last_error = ?, locked_by = NULL, locked_at = NULL WHERE id = ?"
+
+
+@dataclass(slots=True)
+class Job:
+    id: int
+    name: str
+    payload: str
+    status: str
+    attempts: int
+    max_attempts: int
+    run_at: int
+    created_at: int
+    locked_by: Optional[str]
+    locked_at: Optional[int]
+    last_error: Optional[str]
+
+
+@dataclass
+class Task:
+    func: Callable[..., object]
+    max_attempts: int
+    concurrency: int
+
+
+_tasks: dict[str, Task] = {}
+
+
+def task(name: str, max_attempts: int = 5, concurrency: int = 1):
+    """Decorator registering `func` as the task run for jobs called `name`.
+
+    `concurrency` is how many of its jobs run at once across all workers, JOBS_CONCURRENCY
+    overrides it per task. The job's payload is passed as keyword arguments.
+    """
+
+    def register(func: Callable[..., object]) -> Callable[..., object]:
+        _tasks[name] = Task(func, max_attempts, concurrency)
+        return func
+    return register
+
+
+def enqueue(name: str, delay: float = 0.0, **payload) -> int:
+    """Queues a job for the task `name` in the current transaction, returns its id."""
+    task = _tasks[name]
+    now = time.time()
+    with db.transaction() as conn:
+        c = conn.execute(ENQUEUE, (name, json.dumps(payload), task.max_attempts, int(now + delay), int(now)))
+    app = current_app._get_current_object()
+    if app.config['JOBS_IN_PROCESS']:
+        # a worker woken before the caller commits waits on the write lock, then sees the job
+        get_worker(app).wake()
+    return c.lastrowid
+
+
+def claim(worker_id: str) -> Optional[Job]:
+    """Takes the next due job whose task is under its concurrency limit, None if there is none."""
+    config = current_app.config
+    now = int(time.time())
+    expired = now - int(config['JOBS_LEASE'])
+    if not db.get_db().execute(HAS_WORK, (now, expired)).fetchone()[0]:
+        return None
+    with db.transaction() as conn:
+        conn.execute(REQUEUE_EXPIRED, (expired,))
+        running = dict(conn.execute(COUNT_RUNNING).fetchall())
+        names = [
+            name for name, task in _tasks.items()
+            if running.get(name, 0) < config['JOBS_CONCURRENCY'].get(name, task.concurrency)
+        ]
+        if not names:
+            return None
+        jobs = db.fetch_all(Job, CLAIM, (worker_id, now, now, json.dumps(names)))
+    return jobs[0] if jobs else None
+
+
+def run(job: Job) -> bool:
+    """Runs a claimed job and records the outcome, False if it failed."""
+    try:
+        _tasks[job.name].func(**json.loads(job.payload))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        extra = dict(job_id=job.id, job=job.name, attempt=job.attempts, error=error)
+        with db.transaction() as conn:
+            if job.attempts < job.max_attempts:
+                delay = current_app.config['JOBS_RETRY_BACKOFF'] * 2 ** (job.attempts - 1)
+                conn.execute(RETRY, (int(time.time() + delay), error, job.id))
+                current_app.logger.warning("job failed, retrying", extra=dict(extra, retry_in=delay))
+            else:
+                conn.execute(FAIL, (error, job.id))
+                current_app.logger.error("job failed", extra=extra, exc_info=True)
+        return False
+    with db.transaction() as conn:
+        conn.execute(COMPLETE, (job.id,))
+    return True
+
+
+class Worker:
+    """Threads taking jobs off the queue, each job in an app context of its own."""
+
+    def __init__(self, app: Flask, threads: int):
+        self.app = app
+        self.threads = threads
+        self.id = f"{socket.gethostname()}:{os.getpid()}"
+        self.completed = 0
+        self.errors = 0
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: list[threading.Thread] = []
+
+    def start(self, burst: bool = False):
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._loop, args=(burst,), name=f"jobs-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def wake(self):
+        self._wakeup.set()
+
+    def stop(self):
+        """Lets the running jobs finish, nothing new is claimed."""
+        self._stopping.set()
+        self._wakeup.set()
+
+    def join(self):
+        for thread in self._threads:
+            # joined with a timeout so the main thread still gets signals
+            while thread.is_alive():
+                thread.join(0.5)
+
+    def run_once(self) -> bool:
+        """Claims and runs one job, False if none was due."""
+        with self.app.app_context():
+            job = claim(f"{self.id}:{threading.current_thread().name}")
+        if job is None:
+            return False
+        with self.app.app_context():
+            ok = run(job)
+        with self._lock:
+            if ok:
+                self.completed += 1
+            else:
+                self.errors += 1
+        return True
+
+    def snapshot(self) -> dict[str, int]:
+        return dict(threads=self.threads, completed=self.completed, errors=self.errors)
+
+    def _loop(self, burst: bool):
+        while not self._stopping.is_set():
+            try:
+                if self.run_once():
+                    continue
+            except Exception:
+                self.app.logger.exception("job worker error")
+            if burst:
+                return
+            self._wakeup.wait(self.app.config['JOBS_POLL_INTERVAL'])
+            self._wakeup.clear()
+
+
+_worker_lock = threading.Lock()
+
+
+def get_worker(app: Optional[Flask] = None) -> Worker:
+    """The in-process worker of `app`, started on first use (again in a forked child)."""
+    app = app or current_app._get_current_object()
+    worker = app.extensions.get('job_worker')
+    if worker is None or worker._pid != os.getpid():
+        with _worker_lock:
+            worker = app.extensions.get('job_worker')
+            if worker is None or worker._pid != os.getpid():
+                worker = Worker(app, app.config['JOBS_WORKERS'])
+                worker.start()
+                app.extensions['job_worker'] = worker
+    return worker
+
+
+@click.command('worker')
+@click.option('--threads', type=int, default=None, help='Jobs run at once, defaults to JOBS_WORKERS.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due instead of waiting for more.')
+def worker_command(threads: Optional[int], burst: bool):
+    """Runs queued jobs until interrupted."""
+    app = current_app._get_current_object()
+    worker = Worker(app, threads or app.config['JOBS_WORKERS'])
+    # jobs enqueued by tasks wake this worker rather than starting one in-process
+    app.extensions['job_worker'] = worker
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    click.echo(f"worker {worker.id} running {', '.join(sorted(_tasks))} on {worker.threads} threads")
+    worker.start(burst)
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        click.echo('stopping, waiting for running jobs')
+        worker.stop()
+        worker.join()
+    click.echo(f"{worker.completed} jobs completed, {worker.errors} errors")
+
+
+def init_app(app: Flask):
+    app.cli.add_command(worker_command)
+
+
+# tasks
+
+@task('renditions', concurrency=2)
+def generate_renditions(pathnames: list[str]):
+    app = current_app
+    for pathname in pathnames:
+        if storage.is_key(pathname):
+            images.generate_stored_renditions(storage.get_storage(), pathname, app.config['IMAGE_QUALITY'])
+        else:
+            images.generate_renditions(app.static_folder, pathname, app.config['IMAGE_QUALITY'])
+
+
+@task('issue_invoice')
+def issue_invoice(appointment_id: int):
+    """Issues the invoice of a completed appointment and tells the client about it."""
+    with db.transaction():
+        invoice = db.Invoice.issue(appointment_id)
+        if invoice is not None:
+            enqueue(
+                'notify',
+                to=invoice.client_email,
+                subject=f"Invoice from {invoice.photographer_name}",
+                body=f"Your session on {invoice.start_time:%Y-%m-%d} is complete, the total is ${invoice.total_cost}.",
+            )
+
+
+@task('notify', max_attempts=8, concurrency=4)
+def notify(to: str, subject: str, body: str):
+    # there is no mail backend yet, notifications only go to the log
+    current_app.logger.info("notification", extra=dict(to=to, subject=subject, body=body))
@@ -0,0 +1,48 @@
+"""Log output for `app.logger` (the `server` logger) and the loggers of the modules under it.
+
+LOG_LEVEL gates what is written, LOG_FORMAT picks "text" (the message followed by any
+`extra=` fields as key=value) or "json" (one object per line, extras as fields).
+"""
+from __future__ import annotations
+import datetime
+import json
+import logging
+
+from flask import Flask
+from flask.logging import default_handler
+
+# attributes every LogRecord has, anything else was passed in `extra=`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def _extras(record: logging.LogRecord) -> dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        extras = ' '.join(f"{key}={value!r}" for key, value in _extras(record).items())
+        return f"{line} {extras}" if extras else line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = dict(
+            time=datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(),
+            level=record.levelname,
+            logger=record.name,
+            message=record.getMessage(),
+            **_extras(record),
+        )
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def init_app(app: Flask):
+    app.logger.setLevel(app.config['LOG_LEVEL'])
+    if app.config['LOG_FORMAT'] == 'json':
+        default_handler.setFormatter(JsonFormatter())
+    else:
+        default_handler.setFormatter(TextFormatter('[%(asctime)s] %(levelname)s in %(module)s: %(message)s'))
@@ -0,0 +1,308 @@
+"""Request, template and SQL instrumentation, exported at /__metrics in the Prometheus text format.
+
+Pooled connections are `InstrumentedConnection`s (see DATABASE pool in server.db): every
+query is timed including fetching its rows, and the trace callback counts each statement
+SQLite runs, triggers included. Totals are kept per endpoint and per SQL text. Each
+response also gets a `Server-Timing` header with its time spent in SQL and templates.
+
+Sending the PROFILE_HEADER (when PROFILE_ENABLED) runs the request under cProfile and
+dumps the stats to PROFILE_DIR, named in the `X-Profile-Dump` response header.
+"""
+from __future__ import annotations
+import cProfile
+import datetime
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from flask import Flask, Response, abort, current_app, g, request, signals
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# distinct SQL texts tracked, the rest are counted as "other"
+MAX_QUERY_LABELS = 200
+
+
+@dataclass
+class RequestStats:
+    metrics: Metrics
+    queries: int = 0
+    statements: int = 0
+    query_time: float = 0.0
+    render_time: float = 0.0
+    render_starts: list[float] = field(default_factory=list)
+
+
+# stats of the request being handled in this context, None outside of requests
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar('request_stats', default=None)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    _sql: Optional[str] = None
+
+    def _timed(self, method, *args):
+        stats = _request_stats.get()
+        if stats is None:
+            return method(*args)
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats.query_time += elapsed
+            stats.metrics.observe_query(self._sql, elapsed)
+
+    def execute(self, sql, parameters=()):
+        self._sql = sql
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql = sql
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    # rows are stepped lazily, so fetching is part of the query's time
+    def fetchone(self):
+        return self._timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._timed(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._timed(super().fetchall)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_count_statement)
+
+    def cursor(self, factory=None):
+        return super().cursor(factory or InstrumentedCursor)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _count_statement(statement: str):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Process-wide totals, a multi-process server exports one set per worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Counter[tuple[str, str, str]] = Counter()
+        self.request_duration: defaultdict[str, Histogram] = defaultdict(Histogram)
+        self.sql_queries: Counter[str] = Counter()
+        self.sql_statements: Counter[str] = Counter()
+        self.sql_time: Counter[str] = Counter()
+        self.render_time: Counter[str] = Counter()
+        # summaries as [sum, count]
+        self.queries: dict[str, list[float]] = {}
+        self.templates: dict[str, list[float]] = {}
+
+    def observe_request(self, endpoint: str, method: str, status: int, duration: float, stats: RequestStats):
+        with self._lock:
+            self.requests[(endpoint, method, str(status))] += 1
+            self.request_duration[endpoint].observe(duration)
+            self.sql_queries[endpoint] += stats.queries
+            self.sql_statements[endpoint] += stats.statements
+            self.sql_time[endpoint] += stats.query_time
+            self.render_time[endpoint] += stats.render_time
+
+    def observe_query(self, sql: Optional[str], duration: float):
+        label = ' '.join((sql or '').split())
+        with self._lock:
+            if label not in self.queries and len(self.queries) >= MAX_QUERY_LABELS:
+                label = 'other'
+            summary = self.queries.setdefault(label, [0.0, 0])
+            summary[0] += duration
+            summary[1] += 1
+
+    def observe_template(self, name: str, duration: float):
+        with self._lock:
+            summary = self.templates.setdefault(name, [0.0, 0])
+            summary[0] += duration
+            summary[1] += 1
+
+    def render(self, gauges: dict[str, float]) -> str:
+        """The Prometheus text exposition of everything recorded so far plus `gauges`."""
+        lines: list[str] = []
+
+        def metric(name: str, kind: str, help: str):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            metric('http_requests_total', 'counter', 'Requests handled.')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}")
+
+            metric('http_request_duration_seconds', 'histogram', 'Time from the first before_request hook to the response.')
+            for endpoint, histogram in sorted(self.request_duration.items()):
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f"http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le=str(bound))} {count}")
+                lines.append(f"http_request_duration_seconds_bucket{_labels(endpoint=endpoint, le='+Inf')} {histogram.count}")
+                lines.append(f"http_request_duration_seconds_sum{_labels(endpoint=endpoint)} {histogram.sum}")
+                lines.append(f"http_request_duration_seconds_count{_labels(endpoint=endpoint)} {histogram.count}")
+
+            for name, kind, help, counter in (
+                ('sql_queries_total', 'counter', 'Queries executed by requests.', self.sql_queries),
+                ('sql_statements_total', 'counter', 'Statements run by SQLite for requests, triggers included.', self.sql_statements),
+                ('sql_query_seconds_total', 'counter', 'Time requests spent executing queries and fetching rows.', self.sql_time),
+                ('template_render_seconds_total', 'counter', 'Time requests spent rendering templates.', self.render_time),
+            ):
+                metric(name, kind, help)
+                for endpoint, value in sorted(counter.items()):
+                    lines.append(f"{name}{_labels(endpoint=endpoint)} {value}")
+
+            for name, label, help, summaries in (
+                ('sql_query_duration_seconds', 'query', 'Time per SQL text, including fetching rows.', self.queries),
+                ('template_duration_seconds', 'template', 'Time per template, including templates it renders.', self.templates),
+            ):
+                metric(name, 'summary', help)
+                for value, (total, count) in sorted(summaries.items()):
+                    lines.append(f"{name}_sum{_labels(**{label: value})} {total}")
+                    lines.append(f"{name}_count{_labels(**{label: value})} {count}")
+
+        for name, value in sorted(gauges.items()):
+            metric(name, 'gauge', name.replace('_', ' ') + '.')
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels: str) -> str:
+    escaped = (
+        f'{name}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def get_metrics(app: Optional[Flask] = None) -> Metrics:
+    app = app or current_app._get_current_object()
+    return app.extensions['metrics']
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.request_stats_token = _request_stats.set(RequestStats(get_metrics()))
+    if current_app.config['PROFILE_ENABLED'] and current_app.config['PROFILE_HEADER'] in request.headers:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _finish_request(response: Response) -> Response:
+    stats = _request_stats.get()
+    if stats is None:
+        return response
+    duration = time.perf_counter() - g.request_started
+    stats.metrics.observe_request(request.endpoint or 'none', request.method, response.status_code, duration, stats)
+    response.headers.add(
+        'Server-Timing',
+        f'db;dur={stats.query_time * 1000:.2f};desc="{stats.queries} queries", '
+        f'render;dur={stats.render_time * 1000:.2f}, app;dur={duration * 1000:.2f}',
+    )
+
+    profiler: Optional[cProfile.Profile] = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        directory = current_app.config['PROFILE_DIR'] or os.path.join(current_app.instance_path, 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        filename = f"{datetime.datetime.now():%Y%m%dT%H%M%S}-{request.endpoint or 'none'}-{uuid.uuid4().hex[:8]}.prof"
+        profiler.dump_stats(os.path.join(directory, filename))
+        response.headers['X-Profile-Dump'] = filename
+    return response
+
+
+def _end_request(exc: Optional[BaseException]):
+    token = g.pop('request_stats_token', None)
+    if token is not None:
+        _request_stats.reset(token)
+
+
+def _before_render(sender, template, context, **extra):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.render_starts.append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    stats = _request_stats.get()
+    if stats is None or not stats.render_starts:
+        return
+    elapsed = time.perf_counter() - stats.render_starts.pop()
+    # a template rendered while another one renders is already part of its parent's time
+    if not stats.render_starts:
+        stats.render_time += elapsed
+    stats.metrics.observe_template(template.name or 'string', elapsed)
+
+
+def _snapshot_gauges(app: Flask) -> dict[str, float]:
+    gauges: dict[str, float] = {}
+    for prefix, extension in (
+        ('db_pool', 'db_pool'), ('user_cache', 'user_cache'), ('fragment_cache', 'fragment_cache'), ('jobs', 'job_worker'),
+        ('storage', 'storage'), ('db_replicas', 'db_replicas'),
+    ):
+        if extension in app.extensions:
+            for name, value in app.extensions[extension].snapshot().items():
+                gauges[f"{prefix}_{name}"] = value
+    for scope, buckets in app.extensions.get('login_buckets', {}).items():
+        for name, value in buckets.snapshot().items():
+            gauges[f"login_limit_{scope}_{name}"] = value
+    return gauges
+
+
+def metrics_view() -> Response:
+    allowed = current_app.config['METRICS_ALLOWED_IPS']
+    if allowed is not None and request.remote_addr not in allowed:
+        abort(404)
+    app = current_app._get_current_object()
+    body = get_metrics(app).render(_snapshot_gauges(app))
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+def init_app(app: Flask):
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.extensions['metrics'] = Metrics()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    app.add_url_rule('/__metrics', 'metrics', metrics_view)
+    # template timings need blinker for Flask's signals, which Flask 2.2 doesn't require
+    if getattr(signals, 'signals_available', True):
+        signals.before_render_template.connect(_before_render, app)
+        signals.template_rendered.connect(_rendered, app)
@@ -0,0 +1,141 @@
+"""Versioned schema migrations.
+
+Migrations live in `server/migrations` as numbered SQL files, `NNNN_name.up.sql` with an
+optional `NNNN_name.down.sql`. Applied versions are recorded in the `schema_version`
+table and each migration runs in its own transaction.
+
+Migrations run against a live database, so prefer steps SQLite does without rebuilding
+a table: `CREATE INDEX IF NOT EXISTS`, `ALTER TABLE ... ADD COLUMN`, new tables and triggers.
+"""
+from __future__ import annotations
+import datetime
+import os
+import re
+import sqlite3
+from dataclasses import dataclass
+from typing import Optional
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(__file__), 'migrations')
+
+CREATE_VERSION_TABLE = """CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY NOT NULL,
+    name TEXT NOT NULL,
+    applied_at TEXT NOT NULL
+)"""
+READ_VERSION = "SELECT COALESCE(MAX(version), 0) FROM schema_version"
+INSERT_VERSION = "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)"
+DELETE_VERSION = "DELETE FROM schema_version WHERE version = ?"
+
+_FILENAME = re.compile(r'^(\d+)_(\w+)\.(up|down)\.sql$')
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    up_path: str
+    down_path: Optional[str] = None
+
+
+def list_migrations(directory: str = MIGRATIONS_DIR) -> list[Migration]:
+    migrations: dict[int, Migration] = {}
+    for filename in os.listdir(directory):
+        match = _FILENAME.match(filename)
+        if not match:
+            continue
+        version, name, direction = int(match[1]), match[2], match[3]
+        path = os.path.join(directory, filename)
+        migration = migrations.setdefault(version, Migration(version, name, ''))
+        if direction == 'up':
+            migration.up_path = path
+        else:
+            migration.down_path = path
+    for migration in migrations.values():
+        if not migration.up_path:
+            raise ValueError(f"migration {migration.version} has no .up.sql file")
+    return sorted(migrations.values(), key=lambda m: m.version)
+
+
+def current_version(db: sqlite3.Connection) -> int:
+    db.execute(CREATE_VERSION_TABLE)
+    version = db.execute(READ_VERSION).fetchone()[0]
+    if version == 0 and _has_table(db, 'user'):
+        # databases created by the old drop-and-recreate schema.sql match the initial migration
+        db.execute(INSERT_VERSION, (1, 'initial', _now()))
+        db.commit()
+        version = 1
+    return version
+
+
+def upgrade(db: sqlite3.Connection, target: Optional[int] = None, directory: str = MIGRATIONS_DIR) -> list[Migration]:
+    """Applies every pending migration up to and including `target` (default: latest)."""
+    version = current_version(db)
+    pending = [
+        m for m in list_migrations(directory)
+        if m.version > version and (target is None or m.version <= target)
+    ]
+    for migration in pending:
+        _run(db, migration.up_path, INSERT_VERSION, (migration.version, migration.name, _now()))
+    return pending
+
+
+def downgrade(db: sqlite3.Connection, target: Optional[int] = None, directory: str = MIGRATIONS_DIR) -> list[Migration]:
+    """Reverts applied migrations down to `target` (default: one step back), newest first."""
+    version = current_version(db)
+    if target is None:
+        target = version - 1
+    applied = [m for m in list_migrations(directory) if target < m.version <= version]
+    reverted = list(reversed(applied))
+    for migration in reverted:
+        if migration.down_path is None:
+            raise ValueError(f"migration {migration.version}_{migration.name} cannot be reverted")
+        _run(db, migration.down_path, DELETE_VERSION, (migration.version,))
+    return reverted
+
+
+def drop_all(db: sqlite3.Connection):
+    """Drops every view, trigger and table, used by `flask init-db` to start from an empty database."""
+    # views first, a view left behind would outlive the tables it selects from
+    objects = db.execute(
+        "SELECT type, name FROM sqlite_master WHERE type IN ('view', 'trigger', 'table') AND name NOT LIKE 'sqlite_%' "
+        "ORDER BY CASE type WHEN 'view' THEN 0 WHEN 'trigger' THEN 1 ELSE 2 END"
+    ).fetchall()
+    for kind, name in objects:
+        db.execute(f'DROP {kind.upper()} IF EXISTS "{name}"')
+    db.commit()
+
+
+def _run(db: sqlite3.Connection, path: str, record: str, params: tuple):
+    with open(path, encoding='utf8') as f:
+        statements = _split_statements(f.read())
+    db.commit()
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        for statement in statements:
+            db.execute(statement)
+        db.execute(record, params)
+        db.execute("COMMIT")
+    except sqlite3.Error:
+        db.execute("ROLLBACK")
+        raise
+
+
+def _split_statements(script: str) -> list[str]:
+    statements, buffer = [], ''
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            if buffer.strip():
+                statements.append(buffer.strip())
+            buffer = ''
+    if buffer.strip() and not all(l.strip().startswith('--') for l in buffer.splitlines() if l.strip()):
+        raise ValueError(f"incomplete SQL statement: {buffer.strip()[:80]}")
+    return statements
+
+
+def _has_table(db: sqlite3.Connection, name: str) -> bool:
+    return bool(db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone())
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat()
@@ -0,0 +1,11 @@
+DROP TABLE IF EXISTS feedback_form;
+DROP TABLE IF EXISTS form;
+DROP TABLE IF EXISTS invoice;
+DROP TABLE IF EXISTS appointment;
+DROP TABLE IF EXISTS package;
+DROP TABLE IF EXISTS photo;
+DROP TABLE IF EXISTS client_album;
+DROP TABLE IF EXISTS album;
+DROP TABLE IF EXISTS photographer_available_time;
+DROP TABLE IF EXISTS user_type;
+DROP TABLE IF EXISTS user;
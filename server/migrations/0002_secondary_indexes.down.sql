@@ -0,0 +1,10 @@
+DROP INDEX IF EXISTS idx_form_photographer;
+DROP INDEX IF EXISTS idx_appointment_time;
+DROP INDEX IF EXISTS idx_appointment_photographer;
+DROP INDEX IF EXISTS idx_appointment_client;
+DROP INDEX IF EXISTS idx_package_photographer;
+DROP INDEX IF EXISTS idx_photo_album;
+DROP INDEX IF EXISTS idx_client_album_appointment;
+DROP INDEX IF EXISTS idx_album_photographer;
+DROP INDEX IF EXISTS idx_available_time_photographer;
+DROP INDEX IF EXISTS idx_user_type;
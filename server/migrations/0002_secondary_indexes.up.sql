@@ -0,0 +1,11 @@
+-- secondary indexes for the access paths used in server.db, check with `flask index-advisor`
+CREATE INDEX IF NOT EXISTS idx_user_type ON user (type);
+CREATE INDEX IF NOT EXISTS idx_available_time_photographer ON photographer_available_time (photographer_email, start_time);
+CREATE INDEX IF NOT EXISTS idx_album_photographer ON album (photographer_email, name, release_type);
+CREATE INDEX IF NOT EXISTS idx_client_album_appointment ON client_album (appointment_id);
+CREATE INDEX IF NOT EXISTS idx_photo_album ON photo (album_name, pathname);
+CREATE INDEX IF NOT EXISTS idx_package_photographer ON package (photographer_email);
+CREATE INDEX IF NOT EXISTS idx_appointment_client ON appointment (client_email);
+CREATE INDEX IF NOT EXISTS idx_appointment_photographer ON appointment (photographer_email);
+CREATE INDEX IF NOT EXISTS idx_appointment_time ON appointment (time_id);
+CREATE INDEX IF NOT EXISTS idx_form_photographer ON form (photographer_email);
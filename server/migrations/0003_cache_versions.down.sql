@@ -0,0 +1,10 @@
+DROP TRIGGER IF EXISTS user_delete_cache_version;
+DROP TRIGGER IF EXISTS user_update_cache_version;
+DROP TRIGGER IF EXISTS user_insert_cache_version;
+DROP TRIGGER IF EXISTS photo_delete_cache_version;
+DROP TRIGGER IF EXISTS photo_update_cache_version;
+DROP TRIGGER IF EXISTS photo_insert_cache_version;
+DROP TRIGGER IF EXISTS album_delete_cache_version;
+DROP TRIGGER IF EXISTS album_update_cache_version;
+DROP TRIGGER IF EXISTS album_insert_cache_version;
+DROP TABLE IF EXISTS cache_version;
@@ -0,0 +1,57 @@
+-- version counters for server.fragments, bumped by triggers whenever cached content changes
+CREATE TABLE IF NOT EXISTS cache_version (
+    scope TEXT PRIMARY KEY NOT NULL,
+    version INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS album_insert_cache_version AFTER INSERT ON album BEGIN
+    INSERT INTO cache_version (scope, version) VALUES ('photographer:' || NEW.photographer_email, 1)
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS album_update_cache_version AFTER UPDATE ON album BEGIN
+    INSERT INTO cache_version (scope, version) VALUES ('photographer:' || OLD.photographer_email, 1)
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+    INSERT INTO cache_version (scope, version) VALUES ('photographer:' || NEW.photographer_email, 1)
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS album_delete_cache_version AFTER DELETE ON album BEGIN
+    INSERT INTO cache_version (scope, version) VALUES ('photographer:' || OLD.photographer_email, 1)
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS photo_insert_cache_version AFTER INSERT ON photo BEGIN
+    INSERT INTO cache_version (scope, version)
+        SELECT 'photographer:' || photographer_email, 1 FROM album WHERE name = NEW.album_name
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS photo_update_cache_version AFTER UPDATE ON photo BEGIN
+    INSERT INTO cache_version (scope, version)
+        SELECT 'photographer:' || photographer_email, 1 FROM album WHERE name IN (OLD.album_name, NEW.album_name)
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS photo_delete_cache_version AFTER DELETE ON photo BEGIN
+    INSERT INTO cache_version (scope, version)
+        SELECT 'photographer:' || photographer_email, 1 FROM album WHERE name = OLD.album_name
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_insert_cache_version AFTER INSERT ON user WHEN NEW.type = 'photographer' BEGIN
+    INSERT INTO cache_version (scope, version) VALUES ('photographers', 1)
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_update_cache_version AFTER UPDATE ON user BEGIN
+    INSERT INTO cache_version (scope, version) VALUES ('photographer:' || NEW.email, 1)
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+    INSERT INTO cache_version (scope, version) VALUES ('photographers', 1)
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_delete_cache_version AFTER DELETE ON user WHEN OLD.type = 'photographer' BEGIN
+    INSERT INTO cache_version (scope, version) VALUES ('photographers', 1)
+        ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+END;
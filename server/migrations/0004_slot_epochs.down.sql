@@ -0,0 +1,10 @@
+DROP TRIGGER IF EXISTS appointment_delete_free_time;
+DROP TRIGGER IF EXISTS appointment_update_book_time;
+DROP TRIGGER IF EXISTS appointment_insert_book_time;
+DROP TRIGGER IF EXISTS available_time_no_overlap;
+DROP INDEX IF EXISTS idx_available_time_free;
+DROP INDEX IF EXISTS idx_available_time_start;
+CREATE INDEX IF NOT EXISTS idx_available_time_photographer ON photographer_available_time (photographer_email, start_time);
+ALTER TABLE photographer_available_time DROP COLUMN booked;
+ALTER TABLE photographer_available_time DROP COLUMN end_epoch;
+ALTER TABLE photographer_available_time DROP COLUMN start_epoch;
@@ -0,0 +1,49 @@
+-- available times as integer epochs (seconds, times are naive so read as UTC) plus a
+-- booked flag kept in sync with appointment, so free slots are an index range scan
+ALTER TABLE photographer_available_time ADD COLUMN start_epoch INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE photographer_available_time ADD COLUMN end_epoch INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE photographer_available_time ADD COLUMN booked BOOLEAN NOT NULL DEFAULT 0;
+
+UPDATE photographer_available_time SET
+    start_epoch = CAST(strftime('%s', start_time) AS INTEGER),
+    end_epoch = CAST(strftime('%s', end_time) AS INTEGER),
+    booked = EXISTS (SELECT 1 FROM appointment WHERE time_id = photographer_available_time.id);
+
+DROP INDEX IF EXISTS idx_available_time_photographer;
+CREATE INDEX IF NOT EXISTS idx_available_time_start ON photographer_available_time (photographer_email, start_epoch);
+CREATE INDEX IF NOT EXISTS idx_available_time_free ON photographer_available_time (photographer_email, start_epoch) WHERE booked = 0;
+
+-- a photographer's slots never overlap, so besides the slots starting inside the new one
+-- only the latest slot starting before it can overlap, both are single index seeks
+CREATE TRIGGER IF NOT EXISTS available_time_no_overlap BEFORE INSERT ON photographer_available_time BEGIN
+    SELECT RAISE(ABORT, 'available time must end after it starts')
+        WHERE NEW.end_epoch <= NEW.start_epoch;
+    SELECT RAISE(ABORT, 'available time overlaps another available time')
+        WHERE EXISTS (
+            SELECT 1 FROM photographer_available_time
+            WHERE photographer_email = NEW.photographer_email
+                AND start_epoch >= NEW.start_epoch AND start_epoch < NEW.end_epoch
+        ) OR (
+            SELECT end_epoch FROM photographer_available_time
+            WHERE photographer_email = NEW.photographer_email AND start_epoch < NEW.start_epoch
+            ORDER BY start_epoch DESC LIMIT 1
+        ) > NEW.start_epoch;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointment_insert_book_time BEFORE INSERT ON appointment BEGIN
+    SELECT RAISE(ABORT, 'available time is already booked')
+        WHERE NOT EXISTS (
+            SELECT 1 FROM photographer_available_time
+            WHERE id = NEW.time_id AND photographer_email = NEW.photographer_email AND booked = 0
+        );
+    UPDATE photographer_available_time SET booked = 1 WHERE id = NEW.time_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointment_update_book_time AFTER UPDATE OF time_id ON appointment BEGIN
+    UPDATE photographer_available_time SET booked = 0 WHERE id = OLD.time_id;
+    UPDATE photographer_available_time SET booked = 1 WHERE id = NEW.time_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointment_delete_free_time AFTER DELETE ON appointment BEGIN
+    UPDATE photographer_available_time SET booked = 0 WHERE id = OLD.time_id;
+END;
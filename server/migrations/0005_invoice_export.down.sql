@@ -0,0 +1 @@
+DROP INDEX IF EXISTS idx_available_time_epoch;
@@ -0,0 +1,2 @@
+-- appointments by time across all photographers, for `flask export-invoices`
+CREATE INDEX IF NOT EXISTS idx_available_time_epoch ON photographer_available_time (start_epoch);
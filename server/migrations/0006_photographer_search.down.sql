@@ -0,0 +1,11 @@
+DROP TRIGGER IF EXISTS package_delete_search;
+DROP TRIGGER IF EXISTS package_update_search;
+DROP TRIGGER IF EXISTS package_insert_search;
+DROP TRIGGER IF EXISTS album_delete_search;
+DROP TRIGGER IF EXISTS album_update_search;
+DROP TRIGGER IF EXISTS album_insert_search;
+DROP TRIGGER IF EXISTS user_delete_search;
+DROP TRIGGER IF EXISTS user_update_search;
+DROP TRIGGER IF EXISTS user_insert_search;
+DROP TABLE IF EXISTS photographer_search;
+DROP VIEW IF EXISTS photographer_search_source;
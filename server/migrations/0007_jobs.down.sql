@@ -0,0 +1,2 @@
+DROP INDEX IF EXISTS idx_job_status;
+DROP TABLE IF EXISTS job;
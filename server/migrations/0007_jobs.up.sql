@@ -0,0 +1,17 @@
+-- background jobs for server.jobs, rows are deleted once a job succeeds
+CREATE TABLE IF NOT EXISTS job (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    payload TEXT NOT NULL,  -- JSON object of the task's keyword arguments
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at INTEGER NOT NULL,  -- epoch seconds, retries are pushed back by their backoff
+    created_at INTEGER NOT NULL,
+    locked_by TEXT,
+    locked_at INTEGER,
+    last_error TEXT
+);
+
+-- the next due job, and the running ones for concurrency limits and expired leases
+CREATE INDEX IF NOT EXISTS idx_job_status ON job (status, run_at);
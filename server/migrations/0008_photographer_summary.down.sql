@@ -0,0 +1,11 @@
+DROP TRIGGER IF EXISTS feedback_form_delete_summary;
+DROP TRIGGER IF EXISTS feedback_form_insert_summary;
+DROP TRIGGER IF EXISTS form_delete_summary;
+DROP TRIGGER IF EXISTS form_insert_summary;
+DROP TRIGGER IF EXISTS invoice_delete_summary;
+DROP TRIGGER IF EXISTS invoice_update_summary;
+DROP TRIGGER IF EXISTS invoice_insert_summary;
+DROP TRIGGER IF EXISTS appointment_delete_summary;
+DROP TRIGGER IF EXISTS appointment_update_summary;
+DROP TRIGGER IF EXISTS appointment_insert_summary;
+DROP TABLE IF EXISTS photographer_summary;
@@ -0,0 +1,125 @@
+-- per-photographer dashboard totals, kept up to date by the triggers below and rebuilt
+-- from scratch by `flask db reconcile-summaries`
+CREATE TABLE IF NOT EXISTS photographer_summary (
+    photographer_email TEXT PRIMARY KEY NOT NULL,
+    -- appointments by state: pending isn't confirmed yet, completed ones count once
+    pending INTEGER NOT NULL DEFAULT 0,
+    confirmed INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    invoices INTEGER NOT NULL DEFAULT 0,
+    revenue INTEGER NOT NULL DEFAULT 0,  -- sum of invoice.total_cost
+    -- contact forms that aren't feedback, unread ones came in after the newest one shown on /manage
+    inquiries INTEGER NOT NULL DEFAULT 0,
+    unread_inquiries INTEGER NOT NULL DEFAULT 0,
+    inquiries_read_id INTEGER NOT NULL DEFAULT 0,
+    feedback INTEGER NOT NULL DEFAULT 0
+);
+
+-- every trigger upserts its photographer's row with the changes as deltas
+
+CREATE TRIGGER IF NOT EXISTS appointment_insert_summary AFTER INSERT ON appointment BEGIN
+    INSERT INTO photographer_summary (photographer_email, pending, confirmed, completed)
+        VALUES (NEW.photographer_email, NOT NEW.confirmed AND NOT NEW.completed, NEW.confirmed AND NOT NEW.completed, NEW.completed <> 0)
+        ON CONFLICT (photographer_email) DO UPDATE SET
+            pending = pending + excluded.pending, confirmed = confirmed + excluded.confirmed, completed = completed + excluded.completed;
+END;
+
+CREATE TRIGGER IF NOT EXISTS appointment_update_summary AFTER UPDATE OF confirmed, completed, photographer_email ON appointment BEGIN
+    INSERT INTO photographer_summary (photographer_email, pending, confirmed, completed)
+        VALUES (OLD.photographer_email, -(NOT OLD.confirmed AND NOT OLD.completed), -(OLD.confirmed AND NOT OLD.completed), -(OLD.completed <> 0))
+        ON CONFLICT (photographer_email) DO UPDATE SET
+            pending = pending + excluded.pending, confirmed = confirmed + excluded.confirmed, completed = completed + excluded.completed;
+    INSERT INTO photographer_summary (photographer_email, pending, confirmed, completed)
+        VALUES (NEW.photographer_email, NOT NEW.confirmed AND NOT NEW.completed, NEW.confirmed AND NOT NEW.completed, NEW.completed <> 0)
+        ON CONFLICT (photographer_email) DO UPDATE SET
+            pending = pending + excluded.pending, confirmed = confirmed + excluded.confirmed, completed = completed + excluded.completed;
+END;
+
+-- the appointment's invoice no longer counts either (foreign keys aren't enforced, it isn't deleted)
+CREATE TRIGGER IF NOT EXISTS appointment_delete_summary AFTER DELETE ON appointment BEGIN
+    INSERT INTO photographer_summary (photographer_email, pending, confirmed, completed, invoices, revenue)
+        VALUES (
+            OLD.photographer_email, -(NOT OLD.confirmed AND NOT OLD.completed), -(OLD.confirmed AND NOT OLD.completed), -(OLD.completed <> 0),
+            -(SELECT COUNT(*) FROM invoice WHERE appointment_id = OLD.id),
+            -(SELECT COALESCE(SUM(total_cost), 0) FROM invoice WHERE appointment_id = OLD.id)
+        )
+        ON CONFLICT (photographer_email) DO UPDATE SET
+            pending = pending + excluded.pending, confirmed = confirmed + excluded.confirmed, completed = completed + excluded.completed,
+            invoices = invoices + excluded.invoices, revenue = revenue + excluded.revenue;
+END;
+
+CREATE TRIGGER IF NOT EXISTS invoice_insert_summary AFTER INSERT ON invoice BEGIN
+    INSERT INTO photographer_summary (photographer_email, invoices, revenue)
+        SELECT photographer_email, 1, NEW.total_cost FROM appointment WHERE id = NEW.appointment_id
+        ON CONFLICT (photographer_email) DO UPDATE SET invoices = invoices + excluded.invoices, revenue = revenue + excluded.revenue;
+END;
+
+CREATE TRIGGER IF NOT EXISTS invoice_update_summary AFTER UPDATE OF total_cost, appointment_id ON invoice BEGIN
+    INSERT INTO photographer_summary (photographer_email, invoices, revenue)
+        SELECT photographer_email, -1, -OLD.total_cost FROM appointment WHERE id = OLD.appointment_id
+        ON CONFLICT (photographer_email) DO UPDATE SET invoices = invoices + excluded.invoices, revenue = revenue + excluded.revenue;
+    INSERT INTO photographer_summary (photographer_email, invoices, revenue)
+        SELECT photographer_email, 1, NEW.total_cost FROM appointment WHERE id = NEW.appointment_id
+        ON CONFLICT (photographer_email) DO UPDATE SET invoices = invoices + excluded.invoices, revenue = revenue + excluded.revenue;
+END;
+
+CREATE TRIGGER IF NOT EXISTS invoice_delete_summary AFTER DELETE ON invoice BEGIN
+    INSERT INTO photographer_summary (photographer_email, invoices, revenue)
+        SELECT photographer_email, -1, -OLD.total_cost FROM appointment WHERE id = OLD.appointment_id
+        ON CONFLICT (photographer_email) DO UPDATE SET invoices = invoices + excluded.invoices, revenue = revenue + excluded.revenue;
+END;
+
+-- a feedback form is a form plus its feedback_form row, inserted after it in one transaction,
+-- so every form starts out as an inquiry and becomes feedback
+CREATE TRIGGER IF NOT EXISTS form_insert_summary AFTER INSERT ON form BEGIN
+    INSERT INTO photographer_summary (photographer_email, inquiries, unread_inquiries)
+        VALUES (NEW.photographer_email, 1, 1)
+        ON CONFLICT (photographer_email) DO UPDATE SET
+            inquiries = inquiries + 1, unread_inquiries = unread_inquiries + (NEW.id > inquiries_read_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS form_delete_summary AFTER DELETE ON form BEGIN
+    INSERT INTO photographer_summary (photographer_email, inquiries, feedback)
+        VALUES (
+            OLD.photographer_email,
+            -(NOT EXISTS (SELECT 1 FROM feedback_form WHERE form_id = OLD.id)),
+            -(EXISTS (SELECT 1 FROM feedback_form WHERE form_id = OLD.id))
+        )
+        ON CONFLICT (photographer_email) DO UPDATE SET
+            inquiries = inquiries + excluded.inquiries, feedback = feedback + excluded.feedback,
+            unread_inquiries = unread_inquiries + excluded.inquiries * (OLD.id > inquiries_read_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS feedback_form_insert_summary AFTER INSERT ON feedback_form BEGIN
+    INSERT INTO photographer_summary (photographer_email, inquiries, feedback)
+        SELECT photographer_email, -1, 1 FROM form WHERE id = NEW.form_id
+        ON CONFLICT (photographer_email) DO UPDATE SET
+            inquiries = inquiries - 1, feedback = feedback + 1,
+            unread_inquiries = unread_inquiries - (NEW.form_id > inquiries_read_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS feedback_form_delete_summary AFTER DELETE ON feedback_form BEGIN
+    INSERT INTO photographer_summary (photographer_email, inquiries, feedback)
+        SELECT photographer_email, 1, -1 FROM form WHERE id = OLD.form_id
+        ON CONFLICT (photographer_email) DO UPDATE SET
+            inquiries = inquiries + 1, feedback = feedback - 1,
+            unread_inquiries = unread_inquiries + (OLD.form_id > inquiries_read_id);
+END;
+
+-- existing inquiries start out as read
+INSERT INTO photographer_summary (
+    photographer_email, pending, confirmed, completed, invoices, revenue, inquiries, unread_inquiries, inquiries_read_id, feedback
+)
+SELECT
+    u.email,
+    (SELECT COUNT(*) FROM appointment a WHERE a.photographer_email = u.email AND NOT a.confirmed AND NOT a.completed),
+    (SELECT COUNT(*) FROM appointment a WHERE a.photographer_email = u.email AND a.confirmed AND NOT a.completed),
+    (SELECT COUNT(*) FROM appointment a WHERE a.photographer_email = u.email AND a.completed),
+    (SELECT COUNT(*) FROM invoice i JOIN appointment a ON a.id = i.appointment_id WHERE a.photographer_email = u.email),
+    (SELECT COALESCE(SUM(i.total_cost), 0) FROM invoice i JOIN appointment a ON a.id = i.appointment_id WHERE a.photographer_email = u.email),
+    (SELECT COUNT(*) FROM form c WHERE c.photographer_email = u.email AND NOT EXISTS (SELECT 1 FROM feedback_form f WHERE f.form_id = c.id)),
+    0,
+    (SELECT COALESCE(MAX(c.id), 0) FROM form c WHERE c.photographer_email = u.email),
+    (SELECT COUNT(*) FROM form c JOIN feedback_form f ON f.form_id = c.id WHERE c.photographer_email = u.email)
+FROM user u WHERE u.type = 'photographer'
+ON CONFLICT (photographer_email) DO NOTHING;
@@ -0,0 +1,3 @@
+DROP INDEX IF EXISTS idx_photo_pathname;
+DROP INDEX IF EXISTS idx_blob_used_at;
+DROP TABLE IF EXISTS blob;
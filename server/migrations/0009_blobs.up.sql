@@ -0,0 +1,10 @@
+-- objects in content-addressed storage (server.storage), a photo refers to one by its pathname
+CREATE TABLE IF NOT EXISTS blob (
+    key TEXT PRIMARY KEY NOT NULL,
+    size INTEGER NOT NULL,
+    used_at INTEGER NOT NULL  -- epoch seconds of the latest upload, gc leaves recent ones alone
+);
+
+CREATE INDEX IF NOT EXISTS idx_blob_used_at ON blob (used_at);
+-- whether any photo still refers to a blob
+CREATE INDEX IF NOT EXISTS idx_photo_pathname ON photo (pathname);
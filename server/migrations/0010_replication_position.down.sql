@@ -0,0 +1 @@
+DROP TABLE IF EXISTS replication_position;
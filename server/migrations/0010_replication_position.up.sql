@@ -0,0 +1,8 @@
+-- counts write transactions while DATABASE_REPLICAS is set, a replica carries the count of
+-- the latest write it has, so sessions can tell whether it has theirs (see db.get_read_db)
+CREATE TABLE IF NOT EXISTS replication_position (
+    id INTEGER PRIMARY KEY NOT NULL CHECK (id = 1),
+    position INTEGER NOT NULL
+);
+
+INSERT OR IGNORE INTO replication_position (id, position) VALUES (1, 0);
@@ -0,0 +1,95 @@
+-- back to the rowid-keyed index of 0006, rebuilt from scratch
+DROP TRIGGER IF EXISTS package_delete_search;
+DROP TRIGGER IF EXISTS package_update_search;
+DROP TRIGGER IF EXISTS package_insert_search;
+DROP TRIGGER IF EXISTS album_delete_search;
+DROP TRIGGER IF EXISTS album_update_search;
+DROP TRIGGER IF EXISTS album_insert_search;
+DROP TRIGGER IF EXISTS user_delete_search;
+DROP TRIGGER IF EXISTS user_update_search;
+DROP TRIGGER IF EXISTS user_insert_search;
+DROP TABLE IF EXISTS photographer_search;
+DROP VIEW IF EXISTS photographer_search_source;
+DROP TABLE IF EXISTS photographer_search_id;
+
+-- full-text index of photographers for /search/photographers, one row per photographer
+-- keyed by the user's rowid and rebuilt from this view by the triggers below. user has no
+-- INTEGER PRIMARY KEY, so run `flask db rebuild-search` after a VACUUM renumbers rowids
+CREATE VIEW IF NOT EXISTS photographer_search_source AS
+    SELECT
+        u.rowid AS rowid,
+        u.email AS email,
+        u.name AS name,
+        u.about AS about,
+        (SELECT group_concat(a.name, ' ') FROM album a WHERE a.photographer_email = u.email) AS albums,
+        (SELECT group_concat(p.items, ' ') FROM package p WHERE p.photographer_email = u.email) AS packages
+    FROM user u WHERE u.type = 'photographer';
+
+CREATE VIRTUAL TABLE IF NOT EXISTS photographer_search USING fts5(
+    email UNINDEXED, name, about, albums, packages,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+
+-- weights per column (email, name, about, albums, packages) for ORDER BY rank
+INSERT INTO photographer_search (photographer_search, rank) VALUES ('rank', 'bm25(0.0, 10.0, 2.0, 4.0, 1.0)');
+
+INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+    SELECT rowid, email, name, about, albums, packages FROM photographer_search_source;
+
+CREATE TRIGGER IF NOT EXISTS user_insert_search AFTER INSERT ON user WHEN NEW.type = 'photographer' BEGIN
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = NEW.email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_update_search AFTER UPDATE ON user BEGIN
+    DELETE FROM photographer_search WHERE rowid = OLD.rowid;
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = NEW.email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_delete_search AFTER DELETE ON user BEGIN
+    DELETE FROM photographer_search WHERE rowid = OLD.rowid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS album_insert_search AFTER INSERT ON album BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT rowid FROM user WHERE email = NEW.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = NEW.photographer_email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS album_update_search AFTER UPDATE ON album BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT rowid FROM user WHERE email = OLD.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = OLD.photographer_email;
+    DELETE FROM photographer_search WHERE rowid = (SELECT rowid FROM user WHERE email = NEW.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = NEW.photographer_email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS album_delete_search AFTER DELETE ON album BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT rowid FROM user WHERE email = OLD.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = OLD.photographer_email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS package_insert_search AFTER INSERT ON package BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT rowid FROM user WHERE email = NEW.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = NEW.photographer_email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS package_update_search AFTER UPDATE ON package BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT rowid FROM user WHERE email = OLD.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = OLD.photographer_email;
+    DELETE FROM photographer_search WHERE rowid = (SELECT rowid FROM user WHERE email = NEW.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = NEW.photographer_email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS package_delete_search AFTER DELETE ON package BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT rowid FROM user WHERE email = OLD.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = OLD.photographer_email;
+END;
@@ -0,0 +1,97 @@
+-- photographer_search was keyed by user.rowid, which a VACUUM renumbers (user has no INTEGER
+-- PRIMARY KEY), leaving the triggers deleting the wrong rows. It is now keyed by a stable id
+-- per photographer from photographer_search_id.
+CREATE TABLE IF NOT EXISTS photographer_search_id (
+    id INTEGER PRIMARY KEY NOT NULL,
+    email TEXT UNIQUE NOT NULL
+);
+
+INSERT OR IGNORE INTO photographer_search_id (email) SELECT email FROM user WHERE type = 'photographer';
+
+DROP TRIGGER IF EXISTS package_delete_search;
+DROP TRIGGER IF EXISTS package_update_search;
+DROP TRIGGER IF EXISTS package_insert_search;
+DROP TRIGGER IF EXISTS album_delete_search;
+DROP TRIGGER IF EXISTS album_update_search;
+DROP TRIGGER IF EXISTS album_insert_search;
+DROP TRIGGER IF EXISTS user_delete_search;
+DROP TRIGGER IF EXISTS user_update_search;
+DROP TRIGGER IF EXISTS user_insert_search;
+DROP VIEW IF EXISTS photographer_search_source;
+
+CREATE VIEW IF NOT EXISTS photographer_search_source AS
+    SELECT
+        i.id AS rowid,
+        u.email AS email,
+        u.name AS name,
+        u.about AS about,
+        (SELECT group_concat(a.name, ' ') FROM album a WHERE a.photographer_email = u.email) AS albums,
+        (SELECT group_concat(p.items, ' ') FROM package p WHERE p.photographer_email = u.email) AS packages
+    FROM user u JOIN photographer_search_id i ON i.email = u.email WHERE u.type = 'photographer';
+
+DELETE FROM photographer_search;
+INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+    SELECT rowid, email, name, about, albums, packages FROM photographer_search_source;
+
+CREATE TRIGGER IF NOT EXISTS user_insert_search AFTER INSERT ON user WHEN NEW.type = 'photographer' BEGIN
+    INSERT OR IGNORE INTO photographer_search_id (email) VALUES (NEW.email);
+    DELETE FROM photographer_search WHERE rowid = (SELECT id FROM photographer_search_id WHERE email = NEW.email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = NEW.email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_update_search AFTER UPDATE ON user BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT id FROM photographer_search_id WHERE email = OLD.email);
+    -- an id follows its photographer through an email change
+    UPDATE OR REPLACE photographer_search_id SET email = NEW.email WHERE email = OLD.email;
+    INSERT OR IGNORE INTO photographer_search_id (email) SELECT NEW.email WHERE NEW.type = 'photographer';
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = NEW.email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS user_delete_search AFTER DELETE ON user BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT id FROM photographer_search_id WHERE email = OLD.email);
+    DELETE FROM photographer_search_id WHERE email = OLD.email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS album_insert_search AFTER INSERT ON album BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT id FROM photographer_search_id WHERE email = NEW.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = NEW.photographer_email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS album_update_search AFTER UPDATE ON album BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT id FROM photographer_search_id WHERE email = OLD.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = OLD.photographer_email;
+    DELETE FROM photographer_search WHERE rowid = (SELECT id FROM photographer_search_id WHERE email = NEW.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = NEW.photographer_email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS album_delete_search AFTER DELETE ON album BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT id FROM photographer_search_id WHERE email = OLD.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = OLD.photographer_email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS package_insert_search AFTER INSERT ON package BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT id FROM photographer_search_id WHERE email = NEW.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = NEW.photographer_email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS package_update_search AFTER UPDATE ON package BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT id FROM photographer_search_id WHERE email = OLD.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = OLD.photographer_email;
+    DELETE FROM photographer_search WHERE rowid = (SELECT id FROM photographer_search_id WHERE email = NEW.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = NEW.photographer_email;
+END;
+
+CREATE TRIGGER IF NOT EXISTS package_delete_search AFTER DELETE ON package BEGIN
+    DELETE FROM photographer_search WHERE rowid = (SELECT id FROM photographer_search_id WHERE email = OLD.photographer_email);
+    INSERT INTO photographer_search (rowid, email, name, about, albums, packages)
+        SELECT rowid, email, name, about, albums, packages FROM photographer_search_source WHERE email = OLD.photographer_email;
+END;
@@ -0,0 +1,133 @@
+"""Password hashing with the standard library's scrypt or PBKDF2.
+
+Hashes are stored as `method$salt$key`, the method holding its cost parameters:
+
+    scrypt$16384$8$1$<salt>$<key>
+    pbkdf2_sha256$600000$<salt>$<key>
+
+A hash costs tens of milliseconds of CPU on purpose, so it runs in a pool of
+PASSWORD_PROCESSES processes rather than on the request thread: a login storm queues up
+behind a fixed number of cores instead of stalling every worker. When PASSWORD_HASH or its
+cost settings change, `verify_password` hands back a new hash to store on the next
+successful login. Rows from before hashing (plain text) are upgraded the same way.
+"""
+from __future__ import annotations
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, TypeVar
+
+from flask import Flask, current_app
+
+T = TypeVar('T')
+
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+_executor_lock = threading.Lock()
+
+
+def hash_method(config) -> str:
+    """The method prefix for new hashes from the app config."""
+    if config['PASSWORD_HASH'] == 'scrypt':
+        return f"scrypt${config['PASSWORD_SCRYPT_N']}${config['PASSWORD_SCRYPT_R']}${config['PASSWORD_SCRYPT_P']}"
+    if config['PASSWORD_HASH'] == 'pbkdf2_sha256':
+        return f"pbkdf2_sha256${config['PASSWORD_PBKDF2_ITERATIONS']}"
+    raise ValueError(f"unknown PASSWORD_HASH {config['PASSWORD_HASH']!r}")
+
+
+def _derive(method: str, password: str, salt: bytes) -> bytes:
+    name, *params = method.split('$')
+    if name == 'scrypt':
+        n, r, p = map(int, params)
+        # scrypt needs 128 * n * r bytes of memory, with some room to spare
+        return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=KEY_BYTES)
+    if name == 'pbkdf2_sha256':
+        (iterations,) = map(int, params)
+        return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations, dklen=KEY_BYTES)
+    raise ValueError(f"unknown password hash method {name!r}")
+
+
+def _split(stored: str) -> Optional[tuple[str, bytes, bytes]]:
+    """(method, salt, key) of a stored hash, None for anything else (a plain text password)."""
+    parts = stored.split('$')
+    counts = {'scrypt': 6, 'pbkdf2_sha256': 4}
+    if parts[0] not in counts or len(parts) != counts[parts[0]]:
+        return None
+    try:
+        salt, key = base64.b64decode(parts[-2], validate=True), base64.b64decode(parts[-1], validate=True)
+    except ValueError:
+        return None
+    return '$'.join(parts[:-2]), salt, key
+
+
+def is_hash(stored: str) -> bool:
+    """False for passwords stored before hashing, as plain text."""
+    return _split(stored) is not None
+
+
+def make_hash(password: str, method: str) -> str:
+    """Hashes `password` in this process, see `hash_password` for requests."""
+    salt = os.urandom(SALT_BYTES)
+    key = _derive(method, password, salt)
+    return f"{method}${base64.b64encode(salt).decode()}${base64.b64encode(key).decode()}"
+
+
+def check_hash(password: str, stored: str, method: str) -> tuple[bool, Optional[str]]:
+    """Whether `password` matches `stored`, plus a new hash when `stored` isn't made with `method`."""
+    parts = _split(stored)
+    if parts is None:
+        ok = hmac.compare_digest(password.encode(), stored.encode())
+    else:
+        stored_method, salt, key = parts
+        ok = hmac.compare_digest(_derive(stored_method, password, salt), key)
+    if not ok or (parts is not None and parts[0] == method):
+        return ok, None
+    return ok, make_hash(password, method)
+
+
+def get_executor(app: Optional[Flask] = None) -> Optional[ProcessPoolExecutor]:
+    """The hashing processes of `app`, None when PASSWORD_PROCESSES is 0."""
+    app = app or current_app._get_current_object()
+    if not app.config['PASSWORD_PROCESSES']:
+        return None
+    executor = app.extensions.get('password_executor')
+    if executor is None:
+        with _executor_lock:
+            executor = app.extensions.get('password_executor')
+            if executor is None:
+                # spawned, forking a threaded server can copy a held lock into the child
+                executor = ProcessPoolExecutor(
+                    app.config['PASSWORD_PROCESSES'], mp_context=multiprocessing.get_context('spawn')
+                )
+                app.extensions['password_executor'] = executor
+    return executor
+
+
+def _run(func: Callable[..., T], *args) -> T:
+    app = current_app._get_current_object()
+    executor = get_executor(app)
+    if executor is None:
+        return func(*args)
+    try:
+        return executor.submit(func, *args).result()
+    except BrokenProcessPool:
+        # a hashing process died (e.g. killed for memory), start a new pool and try once more
+        with _executor_lock:
+            if app.extensions.get('password_executor') is executor:
+                del app.extensions['password_executor']
+        return get_executor(app).submit(func, *args).result()
+
+
+def hash_password(password: str) -> str:
+    return _run(make_hash, password, hash_method(current_app.config))
+
+
+def verify_password(password: str, stored: str) -> tuple[bool, Optional[str]]:
+    """Whether `password` matches, and the hash to store in place of `stored` if it's outdated."""
+    return _run(check_hash, password, stored, hash_method(current_app.config))
@@ -0,0 +1,213 @@
+from __future__ import annotations
+import os
+import pathlib
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    created: int = 0
+    discarded: int = 0
+    timeouts: int = 0
+    wait_time_total: float = 0.0
+    wait_time_max: float = 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return dict(self.__dict__)
+
+
+@dataclass
+class _PooledConnection:
+    conn: sqlite3.Connection
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class ConnectionPool:
+    """Per-process pool of reusable SQLite connections.
+
+    Idle connections are kept in a LIFO stack so the most recently used (and warmest)
+    connection is handed out first. At most `max_size` connections exist at once, a
+    checkout waits up to `timeout` seconds for one to be returned before failing.
+    `snapshot` is served as the db_pool_* gauges of /__metrics (see server.metrics).
+    """
+
+    def __init__(
+        self,
+        database: str,
+        max_size: int = 8,
+        timeout: float = 5.0,
+        pragmas: Optional[dict[str, object]] = None,
+        health_check_interval: float = 30.0,
+        cached_statements: int = 128,
+        factory: type[sqlite3.Connection] = sqlite3.Connection,
+        read_only: bool = False,
+    ):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = pragmas or {}
+        self.health_check_interval = health_check_interval
+        self.cached_statements = cached_statements
+        self.factory = factory
+        self.read_only = read_only
+        self.stats = PoolStats()
+
+        self._idle: list[_PooledConnection] = []
+        self._size = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+
+    def _connect(self) -> sqlite3.Connection:
+        # connections move between threads as requests come and go, but a connection
+        # is only ever held by one request at a time
+        database = self.database
+        if self.read_only:
+            database = pathlib.Path(self.database).absolute().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(
+            database,
+            uri=self.read_only,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=self.factory,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            if value is not None:
+                conn.execute(f"PRAGMA {name} = {value}")
+        with self._cond:
+            self.stats.created += 1
+        return conn
+
+    def _is_healthy(self, pooled: _PooledConnection) -> bool:
+        if time.monotonic() - pooled.last_used < self.health_check_interval:
+            return True
+        try:
+            pooled.conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _reset_after_fork(self):
+        # connections must not be shared with a parent process (e.g. preloading servers)
+        if self._pid != os.getpid():
+            self._idle = []
+            self._size = 0
+            self._pid = os.getpid()
+            self._cond = threading.Condition()
+
+    def checkout(self) -> sqlite3.Connection:
+        self._reset_after_fork()
+        start = time.monotonic()
+        with self._cond:
+            while not self._idle and self._size >= self.max_size:
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self.stats.timeouts += 1
+                    raise sqlite3.OperationalError(
+                        f"timed out waiting for a database connection (pool size {self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+            waited = time.monotonic() - start
+            self.stats.checkouts += 1
+            self.stats.wait_time_total += waited
+            self.stats.wait_time_max = max(self.stats.wait_time_max, waited)
+
+            pooled = self._idle.pop() if self._idle else None
+            if pooled is None:
+                self._size += 1
+
+        if pooled is not None:
+            if self._is_healthy(pooled):
+                return pooled.conn
+            self._close_quietly(pooled.conn)
+
+        try:
+            return self._connect()
+        except sqlite3.Error:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def checkin(self, conn: sqlite3.Connection, discard: bool = False):
+        if self._pid != os.getpid():
+            return
+        if not discard and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                discard = True
+
+        with self._cond:
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append(_PooledConnection(conn))
+            self._cond.notify()
+
+        if discard:
+            self._close_quietly(conn)
+
+    def _close_quietly(self, conn: sqlite3.Connection):
+        with self._cond:
+            self.stats.discarded += 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for pooled in idle:
+            pooled.conn.close()
+
+    def snapshot(self) -> dict[str, float]:
+        with self._cond:
+            stats = self.stats.as_dict()
+            stats.update(size=self._size, idle=len(self._idle), in_use=self._size - len(self._idle))
+        return stats
+
+
+class ReplicaSet:
+    """One pool of read-only connections per replica of a database.
+
+    Which replica a request reads from is up to the caller (see `db.get_read_db`), this
+    only hands out the pools in random order to spread requests and counts the outcomes.
+    """
+
+    def __init__(self, databases: tuple[str, ...], **pool_options):
+        self.databases = databases
+        self.pools = [ConnectionPool(database, read_only=True, **pool_options) for database in databases]
+        self.reads = 0  # requests that read from a replica
+        self.behind = 0  # replicas passed over for not having a session's latest write yet
+        self.fallbacks = 0  # requests that read from the primary as no replica was usable
+        self._lock = threading.Lock()
+
+    def shuffled(self) -> list[ConnectionPool]:
+        return random.sample(self.pools, len(self.pools))
+
+    def count(self, outcome: str):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def close(self):
+        for pool in self.pools:
+            pool.close()
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            stats = dict(replicas=len(self.pools), reads=self.reads, behind=self.behind, fallbacks=self.fallbacks)
+        pools = [pool.snapshot() for pool in self.pools]
+        for name in ('size', 'in_use', 'timeouts'):
+            stats[name] = sum(pool[name] for pool in pools)
+        return stats
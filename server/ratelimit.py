@@ -0,0 +1,99 @@
+"""Token bucket rate limits for logins, kept per process.
+
+Every login attempt takes a token from the bucket of its account and from the bucket of
+its IP address before the password is hashed. A bucket holds up to `burst` tokens and
+refills at `rate` tokens per second. A successful login refills its account's bucket, so
+only failed attempts add up against an account. Limits are configured as (burst, rate)
+in LOGIN_LIMIT_PER_ACCOUNT and LOGIN_LIMIT_PER_IP, None turns one off.
+
+Each process has its own buckets, with N server processes a client gets up to N times
+the configured rate.
+"""
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from flask import Flask, current_app
+
+# scope -> config key of its (burst, rate)
+LOGIN_LIMITS = {'account': 'LOGIN_LIMIT_PER_ACCOUNT', 'ip': 'LOGIN_LIMIT_PER_IP'}
+
+
+class TokenBuckets:
+    """Thread-safe token buckets per key, the least recently used dropped past `max_keys`."""
+
+    def __init__(self, burst: float, rate: float, max_keys: int = 10_000):
+        self.burst = burst
+        self.rate = rate
+        self.max_keys = max_keys
+        self.allowed = 0
+        self.limited = 0
+        # key -> (tokens, monotonic time they were counted)
+        self._buckets: OrderedDict[Hashable, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: Hashable) -> float:
+        """Takes a token for `key`: 0.0 if there was one, otherwise seconds until there is."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, counted = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - counted) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+                self.allowed += 1
+            else:
+                wait = (1 - tokens) / self.rate
+                self.limited += 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def reset(self, key: Hashable):
+        with self._lock:
+            self._buckets.pop(key, None)
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            return dict(keys=len(self._buckets), allowed=self.allowed, limited=self.limited)
+
+
+_buckets_lock = threading.Lock()
+
+
+def get_login_buckets(app: Optional[Flask] = None) -> dict[str, TokenBuckets]:
+    """Buckets of `app` per enabled scope, created from the config on first use."""
+    app = app or current_app._get_current_object()
+    buckets = app.extensions.get('login_buckets')
+    if buckets is None:
+        with _buckets_lock:
+            buckets = app.extensions.get('login_buckets')
+            if buckets is None:
+                buckets = {
+                    scope: TokenBuckets(*app.config[key], max_keys=app.config['LOGIN_LIMIT_KEYS'])
+                    for scope, key in LOGIN_LIMITS.items()
+                    if app.config[key] is not None
+                }
+                app.extensions['login_buckets'] = buckets
+    return buckets
+
+
+def limit_login(email: Optional[str], ip: Optional[str]) -> float:
+    """Charges a login attempt (or anything as costly), returns seconds to wait if it's over a limit."""
+    buckets = get_login_buckets()
+    waits = [0.0]
+    if email is not None and 'account' in buckets:
+        waits.append(buckets['account'].take(email.lower()))
+    if ip is not None and 'ip' in buckets:
+        waits.append(buckets['ip'].take(ip))
+    return max(waits)
+
+
+def reset_login(email: str):
+    buckets = get_login_buckets()
+    if 'account' in buckets:
+        buckets['account'].reset(email.lower())
@@ -0,0 +1,527 @@
+"""Content-addressed storage for uploaded photos.
+
+An upload is stored once under the SHA-256 of its bytes, sharded two directory levels
+deep so no directory grows past a few thousand entries:
+
+    3f/a9/3fa9...c1.jpg           the upload, the extension comes from its content
+    3f/a9/3fa9...c1-medium.webp   variants (renditions) are stored next to it
+
+The key is what `photo.pathname` holds, so the same image uploaded to several albums is
+one object with several photo rows pointing at it. Each object has a `blob` row, and
+`flask storage gc` deletes the objects no photo refers to anymore.
+
+Backends are picked with STORAGE_BACKEND: "local" (files under STORAGE_DIR), "pack"
+(append-only pack files under STORAGE_DIR read through mmap, for filesystems that handle
+millions of small files badly) or "s3" (any S3-compatible service, e.g. a MinIO running
+next to the app, needs the optional `boto3` package).
+
+`/media/<key>` serves an object without Python reading its bytes where the backend
+allows it: with STORAGE_SENDFILE a local file is handed to the front server as
+`X-Sendfile` (Apache, lighttpd) or `X-Accel-Redirect` (nginx, an internal location at
+STORAGE_ACCEL_PREFIX aliased to STORAGE_DIR), and S3 objects redirect to a presigned URL.
+Pack objects are slices of a bigger file, those are sent from the mapping.
+"""
+from __future__ import annotations
+import hashlib
+import io
+import mimetypes
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
+
+import click
+from flask import Flask, Response, abort, current_app, redirect, request, url_for
+from flask.cli import AppGroup
+from werkzeug.utils import send_file
+
+from server import db
+from server.cache import TTLCache
+
+try:
+    import fcntl
+except ImportError:  # no cross-process locking, only one process may write a pack store
+    fcntl = None
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+CHUNK_SIZE = 64 * 1024
+SPOOL_SIZE = 1024 * 1024  # uploads up to this size are hashed in memory, larger ones in a temp file
+GC_BATCH = 500
+
+KEY = re.compile(r'(?P<digest>[0-9a-f]{64})(?:-(?P<variant>[a-z]+))?\.(?P<ext>[a-z0-9]+)')
+# magic bytes -> extension, uploads are stored as what they are rather than what they're called
+SIGNATURES = ((b'\xff\xd8\xff', 'jpg'), (b'\x89PNG\r\n\x1a\n', 'png'))
+
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    """Extension of a JPEG, PNG or WebP file from its first bytes, None for anything else."""
+    for signature, ext in SIGNATURES:
+        if head.startswith(signature):
+            return ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def make_key(digest: str, ext: str) -> str:
+    return f"{digest[:2]}/{digest[2:4]}/{digest}.{ext}"
+
+
+def variant_key(key: str, variant: str, ext: str) -> str:
+    """Key of a file derived from the object at `key`, deleted along with it."""
+    stem, _ = os.path.splitext(key)
+    return f"{stem}-{variant}.{ext}"
+
+
+def is_key(pathname: str) -> bool:
+    """Whether a photo pathname is a storage key rather than a file in the static folder."""
+    shard, _, name = pathname.rpartition('/')
+    match = KEY.fullmatch(name)
+    return match is not None and shard == f"{name[:2]}/{name[2:4]}"
+
+
+class StorageBackend:
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def put(self, key: str, source: BinaryIO):
+        """Stores `source` (read from its current position) under `key`, a no-op if it's there."""
+        raise NotImplementedError
+
+    def open(self, key: str) -> BinaryIO:
+        """The object's bytes, FileNotFoundError if there is no such object."""
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def keys(self, prefix: str) -> list[str]:
+        """Keys starting with `prefix`, which never spans more than one shard directory."""
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Path of the object on this host for X-Sendfile, None if it isn't a file of its own."""
+        return None
+
+    def url(self, key: str) -> Optional[str]:
+        """URL clients can fetch the object from directly, None to serve it from here."""
+        return None
+
+
+class LocalBackend(StorageBackend):
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+    def put(self, key: str, source: BinaryIO):
+        path = self.local_path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written next to the target and renamed, so readers never see a partial file
+        partial = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(partial, 'wb') as out:
+                shutil.copyfileobj(source, out, CHUNK_SIZE)
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.local_path(key), 'rb')
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.local_path(key))
+        except FileNotFoundError:
+            pass
+
+    def keys(self, prefix: str) -> list[str]:
+        shard, _, start = prefix.rpartition('/')
+        try:
+            names = os.listdir(os.path.join(self.directory, shard))
+        except FileNotFoundError:
+            return []
+        return [f"{shard}/{name}" for name in names if name.startswith(start) and not name.endswith('.tmp')]
+
+
+class PackBackend(StorageBackend):
+    """Objects appended to pack files of up to `pack_size` bytes, located through an index.
+
+    The index is an append-only log of `put` and `delete` lines shared by every process
+    (writers take an flock on it) and replayed by readers when it grows. Deleting only
+    drops the index entry, the bytes stay in their pack.
+    """
+
+    def __init__(self, directory: str, pack_size: int):
+        self.directory = directory
+        self.pack_size = pack_size
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, 'index')
+        # key -> (pack number, offset, length)
+        self._index: dict[str, tuple[int, int, int]] = {}
+        self._index_read = 0  # bytes of the index file replayed so far
+        self._last_pack = 0
+        self._maps: dict[int, mmap.mmap] = {}
+        self._lock = threading.Lock()
+
+    def _pack_path(self, pack: int) -> str:
+        return os.path.join(self.directory, f"pack-{pack:06d}")
+
+    def _refresh(self):
+        """Replays index lines other processes appended since the last call (needs `_lock`)."""
+        try:
+            if os.path.getsize(self._index_path) <= self._index_read:
+                return
+        except FileNotFoundError:
+            return
+        with open(self._index_path, 'rb') as f:
+            f.seek(self._index_read)
+            data = f.read()
+        # a writer may be halfway through a line, leave it for the next refresh
+        complete = data[:data.rfind(b'\n') + 1]
+        self._index_read += len(complete)
+        for line in complete.decode().splitlines():
+            op, key, *location = line.split('\t')
+            if op == 'put':
+                pack, offset, length = map(int, location)
+                self._index[key] = (pack, offset, length)
+                self._last_pack = max(self._last_pack, pack)
+            else:
+                self._index.pop(key, None)
+
+    def _locate(self, key: str) -> Optional[tuple[int, int, int]]:
+        with self._lock:
+            location = self._index.get(key)
+            if location is None:
+                self._refresh()
+                location = self._index.get(key)
+            return location
+
+    def exists(self, key: str) -> bool:
+        # refreshed every time, another process may have deleted it (see `Storage.collect_garbage`)
+        with self._lock:
+            self._refresh()
+            return key in self._index
+
+    def put(self, key: str, source: BinaryIO):
+        with self._lock, open(self._index_path, 'ab') as index:
+            if fcntl is not None:
+                fcntl.flock(index, fcntl.LOCK_EX)
+            self._refresh()
+            if key in self._index:
+                return
+            pack = max(self._last_pack, 1)
+            path = self._pack_path(pack)
+            if os.path.exists(path) and os.path.getsize(path) >= self.pack_size:
+                pack += 1
+                path = self._pack_path(pack)
+            with open(path, 'ab') as out:
+                offset = out.tell()
+                shutil.copyfileobj(source, out, CHUNK_SIZE)
+                length = out.tell() - offset
+            # the index line goes last, a crash in between only leaves unreachable bytes
+            line = f"put\t{key}\t{pack}\t{offset}\t{length}\n".encode()
+            index.write(line)
+            index.flush()
+            self._index_read += len(line)
+            self._index[key] = (pack, offset, length)
+            self._last_pack = pack
+
+    def _map(self, pack: int, end: int) -> mmap.mmap:
+        """A read-only mapping of `pack` covering at least `end` bytes (needs `_lock`)."""
+        mapping = self._maps.get(pack)
+        if mapping is None or len(mapping) < end:
+            if mapping is not None:
+                mapping.close()
+            with open(self._pack_path(pack), 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[pack] = mapping
+        return mapping
+
+    def open(self, key: str) -> BinaryIO:
+        location = self._locate(key)
+        if location is None:
+            raise FileNotFoundError(key)
+        pack, offset, length = location
+        with self._lock:
+            return io.BytesIO(self._map(pack, offset + length)[offset:offset + length])
+
+    def delete(self, key: str):
+        with self._lock, open(self._index_path, 'ab') as index:
+            if fcntl is not None:
+                fcntl.flock(index, fcntl.LOCK_EX)
+            self._refresh()
+            if self._index.pop(key, None) is not None:
+                line = f"delete\t{key}\n".encode()
+                index.write(line)
+                index.flush()
+                self._index_read += len(line)
+
+    def keys(self, prefix: str) -> list[str]:
+        with self._lock:
+            self._refresh()
+            return [key for key in self._index if key.startswith(prefix)]
+
+
+class S3Backend(StorageBackend):
+    def __init__(self, bucket: str, endpoint_url: Optional[str], url_ttl: int, max_age: int):
+        if boto3 is None:
+            raise RuntimeError("STORAGE_BACKEND='s3' needs the boto3 package")
+        # credentials come from the usual AWS_* environment variables or config files
+        self.client = boto3.client('s3', endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.url_ttl = url_ttl
+        self.max_age = max_age
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return False
+            raise
+        return True
+
+    def put(self, key: str, source: BinaryIO):
+        self.client.upload_fileobj(source, self.bucket, key, ExtraArgs=dict(
+            ContentType=mimetypes.guess_type(key)[0] or 'application/octet-stream',
+            CacheControl=f"public, max-age={self.max_age}, immutable",
+        ))
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            body = self.client.get_object(Bucket=self.bucket, Key=key)['Body']
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                raise FileNotFoundError(key) from e
+            raise
+        with body:
+            return io.BytesIO(body.read())
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def keys(self, prefix: str) -> list[str]:
+        pages = self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=prefix)
+        return [item['Key'] for page in pages for item in page.get('Contents', ())]
+
+    def url(self, key: str) -> str:
+        return self.client.generate_presigned_url(
+            'get_object', Params=dict(Bucket=self.bucket, Key=key), ExpiresIn=self.url_ttl
+        )
+
+
+@dataclass(slots=True)
+class Stored:
+    key: str
+    size: int
+    duplicate: bool  # an identical upload was stored already
+
+
+class Storage:
+    def __init__(
+        self, backend: StorageBackend, sendfile: Optional[str], accel_prefix: str, max_age: int, exists_ttl: float
+    ):
+        if sendfile not in (None, 'x-sendfile', 'x-accel-redirect'):
+            raise ValueError(f"unknown STORAGE_SENDFILE: {sendfile}")
+        self.backend = backend
+        self.sendfile = sendfile
+        self.accel_prefix = accel_prefix
+        self.max_age = max_age
+        # what `exists` found, both ways: renditions appear from the jobs worker and gc deletes
+        # from the CLI, so other processes' changes are only seen once an entry expires
+        self._existing: TTLCache[str, bool] = TTLCache(100_000, exists_ttl)
+        self.stored = 0
+        self.deduplicated = 0
+        self.offloaded = 0  # sent by the front server or the object store
+        self.streamed = 0  # sent by Python
+        self._lock = threading.Lock()
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def exists(self, key: str) -> bool:
+        """Whether the object exists, as of up to STORAGE_EXISTS_TTL ago, for rendering pages.
+
+        Anything that acts on the answer asks the backend instead.
+        """
+        exists = self._existing.get(key)
+        if exists is None:
+            exists = self.backend.exists(key)
+            self._existing.set(key, exists)
+        return exists
+
+    def save(self, stream: BinaryIO) -> Optional[Stored]:
+        """Stores an upload unless an identical one is stored already, None if it isn't an image."""
+        sha = hashlib.sha256()
+        with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as spool:
+            while chunk := stream.read(CHUNK_SIZE):
+                sha.update(chunk)
+                spool.write(chunk)
+            size = spool.tell()
+            spool.seek(0)
+            ext = sniff_extension(spool.read(16))
+            if ext is None:
+                return None
+            key = make_key(sha.hexdigest(), ext)
+            # the blob is touched before looking for the object, see `collect_garbage`; the
+            # backend is asked rather than the cache, gc may have run in another process
+            db.Blob.touch(key, size)
+            duplicate = self.backend.exists(key)
+            if not duplicate:
+                spool.seek(0)
+                self.backend.put(key, spool)
+                self._existing.set(key, True)
+        self._count('deduplicated' if duplicate else 'stored')
+        return Stored(key, size, duplicate)
+
+    def put(self, key: str, source: BinaryIO):
+        self.backend.put(key, source)
+        self._existing.set(key, True)
+
+    def open(self, key: str) -> BinaryIO:
+        return self.backend.open(key)
+
+    def delete(self, key: str):
+        """Deletes an object and its variants."""
+        stem, _ = os.path.splitext(key)
+        for k in self.backend.keys(f"{stem}-") + [key]:
+            self.backend.delete(k)
+            self._existing.delete(k)
+
+    def url_for(self, key: str) -> str:
+        return url_for('media', key=key)
+
+    def send(self, key: str) -> Response:
+        url = self.backend.url(key)
+        if url is not None:
+            self._count('offloaded')
+            return redirect(url)
+
+        etag = KEY.fullmatch(key.rpartition('/')[2])['digest']
+        mimetype = mimetypes.guess_type(key)[0] or 'application/octet-stream'
+        path = self.backend.local_path(key)
+        if path is not None:
+            if not os.path.isfile(path):
+                abort(404)
+            if self.sendfile == 'x-accel-redirect':
+                response = current_app.response_class(mimetype=mimetype)
+                response.headers['X-Accel-Redirect'] = self.accel_prefix + key
+                response.set_etag(etag)
+                response.cache_control.max_age = self.max_age
+                response.make_conditional(request)
+            else:
+                response = send_file(
+                    path, request.environ, mimetype=mimetype, use_x_sendfile=self.sendfile == 'x-sendfile',
+                    response_class=current_app.response_class, etag=etag, max_age=self.max_age,
+                )
+            self._count('offloaded' if self.sendfile else 'streamed')
+        else:
+            try:
+                source = self.backend.open(key)
+            except FileNotFoundError:
+                abort(404)
+            response = send_file(
+                source, request.environ, mimetype=mimetype,
+                response_class=current_app.response_class, etag=etag, max_age=self.max_age,
+            )
+            self._count('streamed')
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+    def collect_garbage(self, grace: float) -> int:
+        """Deletes objects no photo refers to and nobody uploaded in the last `grace` seconds.
+
+        The blob rows are deleted first, and the objects only once that has committed. Each
+        object is deleted in a write transaction that first checks no upload touched its
+        blob again in between. That way an upload either touches the blob before that check,
+        and the object is kept, or finds the object gone and stores it again (see `save`).
+        """
+        removed = 0
+        while True:
+            with db.transaction():
+                blobs = db.Blob.read_unused(int(time.time() - grace), GC_BATCH)
+                db.Blob.delete_many([blob.key for blob in blobs])
+            for blob in blobs:
+                with db.transaction():
+                    if db.Blob.read(blob.key) is None:
+                        self.delete(blob.key)
+                        removed += 1
+            if len(blobs) < GC_BATCH:
+                return removed
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            return dict(
+                stored=self.stored, deduplicated=self.deduplicated, offloaded=self.offloaded, streamed=self.streamed
+            )
+
+
+def _storage_dir(app: Flask) -> str:
+    return app.config['STORAGE_DIR'] or os.path.join(app.instance_path, 'media')
+
+
+def _make_backend(app: Flask) -> StorageBackend:
+    backend = app.config['STORAGE_BACKEND']
+    if backend == 'local':
+        return LocalBackend(_storage_dir(app))
+    if backend == 'pack':
+        return PackBackend(_storage_dir(app), app.config['STORAGE_PACK_SIZE'])
+    if backend == 's3':
+        return S3Backend(
+            app.config['STORAGE_S3_BUCKET'], app.config['STORAGE_S3_ENDPOINT_URL'],
+            app.config['STORAGE_S3_URL_TTL'], app.config['STATIC_IMMUTABLE_MAX_AGE'],
+        )
+    raise ValueError(f"unknown STORAGE_BACKEND: {backend}")
+
+
+def get_storage(app: Optional[Flask] = None) -> Storage:
+    app = app or current_app._get_current_object()
+    return app.extensions['storage']
+
+
+def send_media(key: str) -> Response:
+    if not is_key(key):
+        abort(404)
+    return get_storage().send(key)
+
+
+storage_cli = AppGroup('storage', help='Content-addressed photo storage.')
+
+
+@storage_cli.command('gc')
+def gc_command():
+    """Deletes stored photos (and their renditions) that no photo row refers to."""
+    removed = get_storage().collect_garbage(current_app.config['STORAGE_GC_GRACE'])
+    click.echo(f"{removed} unused objects deleted")
+
+
+def init_app(app: Flask):
+    app.extensions['storage'] = Storage(
+        _make_backend(app), app.config['STORAGE_SENDFILE'], app.config['STORAGE_ACCEL_PREFIX'],
+        app.config['STATIC_IMMUTABLE_MAX_AGE'], app.config['STORAGE_EXISTS_TTL'],
+    )
+    app.add_url_rule('/media/<path:key>', 'media', send_media)
+    app.cli.add_command(storage_cli)
@@ -0,0 +1,72 @@
+"""Compiled template cache and startup warm-up.
+
+Jinja compiles a template to Python code the first time it's used, in every worker
+process. With a bytecode cache in TEMPLATE_CACHE_DIR the compiled code is written to disk
+once and loaded by every worker (and every deploy, until the template source changes).
+
+    flask compile-templates
+
+compiles all of `server/templates` ahead of time, e.g. while building a release.
+`create_app` then loads every template (TEMPLATE_PRELOAD), so a server that imports the
+app before forking shares them between its workers. When TEMPLATE_WARMUP is set, the
+server entry point (server.asgi at lifespan startup) also requests WARMUP_PATHS once so
+the first real visitor doesn't pay for the remaining first-use setup either. CLI commands
+and scripts that build an app never make those requests.
+"""
+from __future__ import annotations
+import os
+import time
+
+import click
+from flask import Flask, current_app
+from jinja2 import FileSystemBytecodeCache
+
+
+def _cache_dir(app: Flask) -> str:
+    return app.config['TEMPLATE_CACHE_DIR'] or os.path.join(app.instance_path, 'jinja')
+
+
+def preload(app: Flask) -> int:
+    """Loads (compiling if needed) every template into the environment, returns how many."""
+    env = app.jinja_env
+    names = env.list_templates()
+    for name in names:
+        env.get_template(name)
+    return len(names)
+
+
+def warm_up(app: Flask) -> dict[str, int]:
+    """Requests WARMUP_PATHS in-process, returns the status of each.
+
+    Only use paths that render without the database, the app may start before `init-db`.
+    """
+    statuses = {}
+    client = app.test_client()
+    for path in app.config['WARMUP_PATHS']:
+        try:
+            statuses[path] = client.get(path).status_code
+        except Exception as e:
+            app.logger.warning("warm-up request failed", extra=dict(path=path, error=str(e)))
+    return statuses
+
+
+@click.command('compile-templates')
+def compile_templates_command():
+    """Compiles every template into the bytecode cache, replacing what's there."""
+    app = current_app._get_current_object()
+    env = app.jinja_env
+    env.bytecode_cache.clear()
+    if env.cache is not None:
+        env.cache.clear()
+    start = time.perf_counter()
+    count = preload(app)
+    click.echo(f"compiled {count} templates into {_cache_dir(app)} in {time.perf_counter() - start:.2f}s")
+
+
+def init_app(app: Flask):
+    directory = _cache_dir(app)
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    app.cli.add_command(compile_templates_command)
+    if app.config['TEMPLATE_PRELOAD']:
+        preload(app)
@@ -0,0 +1,44 @@
+"""Saving uploaded photos into content-addressed storage (see server.storage)."""
+from __future__ import annotations
+import io
+import os
+from typing import Iterable, Iterator
+
+from werkzeug.datastructures import FileStorage
+
+from server import storage
+
+ALLOWED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+
+def detach(files: Iterable[FileStorage]) -> list[FileStorage]:
+    """Takes the uploads' streams over from the request, which closes its files when the view returns.
+
+    Lets a streamed response read them afterwards, the caller closes what it gets back.
+    """
+    detached = []
+    for file in files:
+        detached.append(FileStorage(file.stream, file.filename, file.name, file.content_type, headers=file.headers))
+        file.stream = io.BytesIO()
+    return detached
+
+
+def save_uploads(files: Iterable[FileStorage]) -> Iterator[dict]:
+    """Stores each upload, yielding one progress event per file with the photo pathname (its key)."""
+    store = storage.get_storage()
+    for file in files:
+        _, ext = os.path.splitext(file.filename or '')
+        if ext.lower() not in ALLOWED_EXTENSIONS:
+            yield dict(file=file.filename, status='rejected', error='unsupported file type')
+            continue
+        try:
+            stored = store.save(file.stream)
+        except OSError as e:
+            yield dict(file=file.filename, status='failed', error=str(e))
+            continue
+        if stored is None:
+            yield dict(file=file.filename, status='rejected', error='not a JPEG, PNG or WebP image')
+            continue
+        yield dict(
+            file=file.filename, status='saved', pathname=stored.key, bytes=stored.size, duplicate=stored.duplicate
+        )
@@ -0,0 +1,38 @@
+"""Tests, run with `python -m unittest discover tests` from the project root."""
+import os
+import shutil
+import tempfile
+import unittest
+
+from flask import Flask
+
+from server import create_app, storage
+
+
+class AppTestCase(unittest.TestCase):
+    """Gives each test an app on its own temporary database and media folder."""
+
+    config: dict = {}
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.app = self.make_app(**self.config)
+
+    def make_app(self, **config) -> Flask:
+        app = create_app()
+        app.config.update(
+            TESTING=True,
+            DATABASE=os.path.join(self.tmp, 'server.sqlite'),
+            STORAGE_DIR=os.path.join(self.tmp, 'media'),
+            JOBS_IN_PROCESS=False,
+            PASSWORD_PROCESSES=0,
+            FRAGMENT_CACHE_BACKEND=None,
+            **config,
+        )
+        # storage is set up by create_app, before STORAGE_DIR pointed here
+        app.extensions['storage'] = storage.Storage(
+            storage._make_backend(app), None, app.config['STORAGE_ACCEL_PREFIX'],
+            app.config['STATIC_IMMUTABLE_MAX_AGE'], app.config['STORAGE_EXISTS_TTL'],
+        )
+        return app
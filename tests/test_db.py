@@ -0,0 +1,39 @@
+import sqlite3
+
+from server import db, migrate
+from tests import AppTestCase
+
+
+class InitDbTest(AppTestCase):
+    def test_init_db_twice(self):
+        with self.app.app_context():
+            db.init_db()
+            db.init_db()
+            latest = migrate.list_migrations()[-1].version
+            self.assertEqual(migrate.current_version(db.get_db()), latest)
+            self.assertTrue(db.User.search_photographers('pictures').items)
+            self.assertIsNone(db.Blob.read('00/00/missing.jpg'))
+
+    def test_drop_all_leaves_nothing(self):
+        with self.app.app_context():
+            db.init_db()
+            migrate.drop_all(db.get_db())
+            left = db.get_db().execute("SELECT type, name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'").fetchall()
+            self.assertEqual([tuple(row) for row in left], [])
+
+
+class UnitOfWorkTest(AppTestCase):
+    def test_failed_model_call_rolls_back_the_transaction(self):
+        with self.app.app_context():
+            db.init_db()
+            with self.assertRaises(sqlite3.IntegrityError):
+                with db.transaction():
+                    db.Photo.create_many(['garden4.jpg'], 'Nature')
+                    # release_type is NOT NULL
+                    db.ClientAlbum.create('Wedding', None, 1, 'client@email.com', 'photo@email.com')
+            self.assertEqual(len(db.Photo.read('Nature')), 3)
+
+    def test_failed_model_call_outside_a_transaction_returns_none(self):
+        with self.app.app_context():
+            db.init_db()
+            self.assertIsNone(db.ClientAlbum.create('Wedding', None, 1, 'client@email.com', 'photo@email.com'))
@@ -0,0 +1,25 @@
+import os
+import tempfile
+import unittest
+
+from server.fragments import FileSystemBackend
+
+
+class FileSystemBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.backend = FileSystemBackend(self.directory, max_size=3, sweep_every=5)
+
+    def test_expired_fragments_are_swept(self):
+        self.backend.set('photographer:1:a', 'old', ttl=-1)
+        for i in range(4):
+            self.backend.set(f'photographer:2:{i}', 'new', ttl=60)
+        self.assertIsNone(self.backend.get('photographer:1:a'))
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+
+    def test_sweep_keeps_max_size(self):
+        for i in range(10):
+            self.backend.set(f'key{i}', str(i), ttl=60 + i)
+        self.backend.sweep()
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+        self.assertEqual(self.backend.get('key9'), '9')
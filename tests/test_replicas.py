@@ -0,0 +1,39 @@
+import io
+import json
+import os
+
+from server import db
+from tests import AppTestCase
+
+PHOTO = os.path.join(os.path.dirname(__file__), '..', 'server', 'static', 'garden1.jpg')
+
+
+class ReadYourWritesTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config['DATABASE_REPLICAS'] = (os.path.join(self.tmp, 'replica.sqlite'),)
+        with self.app.app_context():
+            db.init_db()
+            # the replica has the seed data and nothing written after it
+            result = self.app.test_cli_runner().invoke(args=['db', 'sync-replicas'])
+        self.assertIsNone(result.exception, result.output)
+        self.client = self.app.test_client()
+        self.client.post('/login', data={'email': 'photo@email.com', 'password': 'password'})
+
+    def gallery(self) -> str:
+        return self.client.get('/gallery/photo@email.com').data.decode()
+
+    def test_edit_shows_to_its_author(self):
+        self.client.post('/edit_about/photo@email.com', data={'text': 'Now shooting weddings'})
+        self.assertIn('Now shooting weddings', self.gallery())
+
+    def test_streamed_upload_shows_to_its_uploader(self):
+        with open(PHOTO, 'rb') as f:
+            response = self.client.post(
+                '/upload_photos/Nature', data={'photos': [(io.BytesIO(f.read()), 'new.jpg')]},
+                content_type='multipart/form-data',
+            )
+        events = [json.loads(line) for line in response.data.decode().splitlines()]
+        self.assertEqual(events[-1]['created'], 1)
+        stem, _ = os.path.splitext(events[0]['pathname'])
+        self.assertIn(f"/media/{stem}", self.gallery())